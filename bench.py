@@ -0,0 +1,257 @@
+# ==========================================
+# BANC D'ESSAI DES CHEMINS CRITIQUES
+# ==========================================
+# Chronomètre, hors ligne et de façon reproductible, les étapes coûteuses de
+# l'appli : lecture de chaque ouvrage livré (read_file), assemblage de la
+# bibliothèque (à froid puis depuis le cache), index BM25, radar, exports
+# PDF / DOCX d'analyses courte, standard et détaillée, assemblage du prompt,
+# lecture d'un rapport Q-GLOBAL et compte rendu complet (modèle simulé).
+#
+# Utilisation :
+#   python bench.py [--repetitions 5] [--sortie bench.json] [--filtre pdf]
+#                   [--profil [--top 15]] [--comparer ancien.json [--seuil 1.2]]
+#
+# Les résultats (min, médiane, p95 par étape, version et machine) vont dans
+# un JSON : --comparer affiche le rapport des médianes avec un résultat
+# précédent et sort en erreur si une étape a ralenti au-delà du seuil.
+# --profil passe chaque étape sous cProfile et affiche les fonctions les
+# plus coûteuses (temps cumulé), aussi enregistrées dans le JSON ; les durées
+# mesurées sous profileur sont gonflées et ne se comparent qu'entre elles.
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+os.environ.setdefault("WISC_IA_BACKEND", "stub")   # jamais de réseau pendant la mesure
+os.environ["WISC_STUB_LATENCE"] = "0"
+CACHE_BANC = tempfile.mkdtemp(prefix="bench_wisc_cache_")
+os.environ["WISC_CACHE_DIR"] = CACHE_BANC          # caches de l'appli (réponses, journal) jamais touchés
+
+from bibliotheque import Bibliotheque, lister_sources, read_file
+from bilan_reference import SCORES_BILAN, rapport_qglobal
+from exports import create_docx, create_pdf
+from graphiques import radar_png, valeurs_radar
+from moteur import (EntreeBilan, Identite, Observations, Scores, NIVEAUX_DETAIL, analyser, champs_export,
+                    contexte_bibliotheque, generate_report, preparer_prompt_mesure)
+from qglobal import analyser_rapport, extraire
+from recherche import IndexBM25
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+REPETITIONS_DEFAUT = 5
+TOP_DEFAUT = 15
+SEUIL_DEFAUT = 1.2   # médiane 20 % plus lente que la référence : régression
+
+# Longueur (mots) des analyses exportées, d'après les consignes de moteur.niveau_consigne
+MOTS_ANALYSE = dict(zip(NIVEAUX_DETAIL, [400, 900, 1800]))
+TITRES_ANALYSE = ["VALIDITÉ DES INDICES GLOBAUX", "ANALYSE INTER-INDIVIDUELLE",
+                  "ANALYSE INTRA-INDIVIDUELLE", "SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS"]
+PHRASE_ANALYSE = ("L'indice de **compréhension verbale** se situe dans la zone moyenne forte, "
+                  "nettement au-dessus de la vitesse de traitement ; cet écart est cliniquement "
+                  "significatif et doit être croisé avec l'anamnèse et les observations. ")
+
+
+# ==========================================
+# DONNÉES DE RÉFÉRENCE
+# ==========================================
+def entree_reference(niveau_detail=NIVEAUX_DETAIL[1]):
+    return EntreeBilan(
+        Identite(prenom="Lucas", date_naissance=date(2014, 4, 3), date_bilan=date(2023, 6, 12)),
+        Observations(obs=["Coopérant", "Fatigable"], obs_libre="Lenteur graphique marquée.",
+                     motifs=["Difficultés scolaires", "Lenteur"],
+                     anamnese="Né à terme, acquisitions dans les temps. Plainte de lenteur en classe. " * 20),
+        Scores(**SCORES_BILAN),
+        niveau_detail=niveau_detail,
+    )
+
+
+def analyse_synthetique(mots):
+    """Analyse markdown de `mots` mots environ, découpée comme celle du modèle."""
+    n = max(1, mots // len(PHRASE_ANALYSE.split()) // len(TITRES_ANALYSE))
+    return "\n\n".join(f"## {i}. {titre}\n" + "\n".join(f"- {PHRASE_ANALYSE}" for _ in range(n))
+                       for i, titre in enumerate(TITRES_ANALYSE, 1))
+
+
+def contexte_complet(bibli, fichiers):
+    """Bibliothèque entière telle que l'appli l'injecte (streamlit_app.get_contexte_complet)."""
+    return "".join(f"\n--- SOURCE PRIORITAIRE: {f} ---\n{bibli.texte(os.path.join(DOSSIER, f))}\n"
+                   for f in fichiers)
+
+
+# ==========================================
+# ÉTAPES
+# ==========================================
+def etapes():
+    """[(nom, fonction sans argument)] dans l'ordre d'exécution.
+
+    Les préparations (lecture des octets, index, analyse) sont faites ici,
+    hors chronomètre ; chaque fonction ne mesure que l'étape nommée.
+    """
+    fichiers = lister_sources(DOSSIER)
+    contenus = {}
+    for f in fichiers:
+        with open(os.path.join(DOSSIER, f), "rb") as fh:
+            contenus[f] = fh.read()
+    cache_chaud = tempfile.mkdtemp(prefix="bench_wisc_")
+    bibli = Bibliotheque(cache_chaud)
+    sources = {f: bibli.texte(os.path.join(DOSSIER, f)) for f in fichiers}
+    index = IndexBM25.depuis_sources(sources)
+    entree = entree_reference()
+    analyse = analyser(entree.scores)
+    contexte_bm25, _ = contexte_bibliotheque(entree, analyse, index)
+    contexte_entier = contexte_complet(bibli, fichiers)
+    champs = champs_export(entree.identite, analyse.valid_ind)
+    radar = radar_png(valeurs_radar(analyse.valid_ind))
+    texte_qglobal = rapport_qglobal()
+
+    def a_froid():
+        dossier = tempfile.mkdtemp(prefix="bench_wisc_")
+        try:
+            contexte_complet(Bibliotheque(dossier), fichiers)
+        finally:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+    liste = [(f"read_file · {f}", lambda f=f: read_file(io.BytesIO(contenus[f]), f)) for f in fichiers]
+    liste += [
+        ("bibliothèque · à froid", a_froid),
+        ("bibliothèque · cache disque", lambda: contexte_complet(Bibliotheque(cache_chaud), fichiers)),
+        ("bibliothèque · cache mémoire", lambda: contexte_complet(bibli, fichiers)),
+        ("bibliothèque · index BM25", lambda: IndexBM25.depuis_sources(sources)),
+        ("bibliothèque · passages du profil", lambda: contexte_bibliotheque(entree, analyse, index)),
+        ("radar", lambda: radar_png.__wrapped__(valeurs_radar(analyse.valid_ind))),
+    ]
+    for niveau, mots in MOTS_ANALYSE.items():
+        texte = analyse_synthetique(mots)
+        court = niveau.split()[0].lower()
+        liste += [
+            (f"create_pdf · {court}", lambda t=texte: create_pdf(
+                t, champs["prenom"], champs["sexe"], champs["age_long"], champs["date_bilan"], radar)),
+            (f"create_docx · {court}", lambda t=texte: create_docx(t, champs["prenom"], champs["age_court"], radar)),
+        ]
+    liste += [
+        ("prompt · passages BM25", lambda: preparer_prompt_mesure(entree, analyse, contexte_bm25)),
+        ("prompt · bibliothèque entière", lambda: preparer_prompt_mesure(entree, analyse, contexte_entier)),
+        ("qglobal · analyser_rapport", lambda: analyser_rapport(texte_qglobal)),
+        ("qglobal · extraire", lambda: extraire(texte_qglobal)),
+        ("compte rendu complet (modèle simulé)", lambda: generate_report(entree, contexte_biblio=contexte_bm25)),
+    ]
+    return liste, cache_chaud
+
+
+def centile(valeurs, q):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * q))] if valeurs else 0.0
+
+
+def mesurer(fonction, repetitions, profil=None):
+    """Durées (secondes) de `repetitions` appels, après un appel d'amorçage non compté."""
+    fonction()
+    durees = []
+    for _ in range(repetitions):
+        if profil is not None:
+            profil.enable()
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+        if profil is not None:
+            profil.disable()
+    return durees
+
+
+def points_chauds(profil, top):
+    """Fonctions les plus coûteuses (temps cumulé) : [{"fonction", "appels", "cumule", "propre"}]."""
+    stats = pstats.Stats(profil)
+    lignes = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top]
+    return [{"fonction": f"{os.path.basename(fichier)}:{ligne}({nom})", "appels": nc,
+             "cumule": round(ct, 6), "propre": round(tt, 6)}
+            for (fichier, ligne, nom), (_, nc, tt, ct, _) in lignes]
+
+
+def version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=DOSSIER, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+# ==========================================
+# LIGNE DE COMMANDE
+# ==========================================
+def comparer(resultats, chemin, seuil):
+    """Affiche médiane actuelle / référence par étape. Retourne les étapes en régression."""
+    with open(chemin, encoding="utf-8") as fh:
+        reference = json.load(fh)["etapes"]
+    regressions = []
+    print(f"\nComparaison avec {chemin} (médianes) :")
+    for nom, r in resultats.items():
+        if nom not in reference or not reference[nom]["mediane"]:
+            continue
+        ratio = r["mediane"] / reference[nom]["mediane"]
+        marque = "  <-- régression" if ratio > seuil else ""
+        print(f"  {nom:45} {reference[nom]['mediane'] * 1000:9.2f} -> {r['mediane'] * 1000:9.2f} ms  "
+              f"x{ratio:.2f}{marque}")
+        if ratio > seuil:
+            regressions.append(nom)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne des chemins critiques de l'appli.")
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS_DEFAUT)
+    parser.add_argument("--sortie", default="bench.json", help="Résultats JSON")
+    parser.add_argument("--filtre", help="Ne mesurer que les étapes dont le nom contient ce texte")
+    parser.add_argument("--profil", action="store_true", help="Profiler chaque étape avec cProfile")
+    parser.add_argument("--top", type=int, default=TOP_DEFAUT, help="Points chauds affichés par étape")
+    parser.add_argument("--comparer", help="JSON d'une exécution précédente")
+    parser.add_argument("--seuil", type=float, default=SEUIL_DEFAUT,
+                        help="Rapport des médianes au-delà duquel une étape est en régression")
+    args = parser.parse_args(argv)
+
+    liste, cache_chaud = etapes()
+    resultats = {}
+    try:
+        for nom, fonction in liste:
+            if args.filtre and args.filtre.lower() not in nom.lower():
+                continue
+            profil = cProfile.Profile() if args.profil else None
+            durees = mesurer(fonction, args.repetitions, profil)
+            resultats[nom] = {"n": len(durees), "min": min(durees), "mediane": centile(durees, 0.5),
+                              "p95": centile(durees, 0.95), "moyenne": sum(durees) / len(durees)}
+            r = resultats[nom]
+            print(f"{nom:45} min {r['min'] * 1000:9.2f} ms   médiane {r['mediane'] * 1000:9.2f} ms   "
+                  f"p95 {r['p95'] * 1000:9.2f} ms")
+            if profil is not None:
+                r["points_chauds"] = points_chauds(profil, args.top)
+                for p in r["points_chauds"]:
+                    print(f"    {p['cumule'] * 1000:9.2f} ms cumulés  {p['appels']:>7} appels  {p['fonction']}")
+    finally:
+        shutil.rmtree(cache_chaud, ignore_errors=True)
+        shutil.rmtree(CACHE_BANC, ignore_errors=True)
+
+    with open(args.sortie, "w", encoding="utf-8") as fh:
+        json.dump({"version": version(), "date": datetime.now().isoformat(timespec="seconds"),
+                   "python": platform.python_version(), "machine": platform.platform(),
+                   "processeurs": os.cpu_count(), "repetitions": args.repetitions, "profil": args.profil,
+                   "etapes": resultats}, fh, ensure_ascii=False, indent=2)
+    print(f"\nRésultats écrits dans {args.sortie}", file=sys.stderr)
+
+    if args.comparer:
+        regressions = comparer(resultats, args.comparer, args.seuil)
+        if regressions:
+            print(f"{len(regressions)} étape(s) en régression (seuil x{args.seuil})", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
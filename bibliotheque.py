@@ -0,0 +1,414 @@
+# ==========================================
+# BIBLIOTHÈQUE DE RÉFÉRENCE (PDF / TXT)
+# ==========================================
+# Lecture des ouvrages de référence et cache persistant du texte extrait.
+#
+# Le texte est indexé par empreinte SHA-256 du contenu : un fichier renommé
+# ou recopié n'est jamais reparsé. Un stat() (mtime + taille) suffit à savoir
+# si l'empreinte connue est encore valable ; sinon le fichier est relu et
+# rehaché. Le texte est stocké sur disque (partagé entre sessions et entre
+# redémarrages) avec un LRU en mémoire devant.
+#
+# À l'ingestion, le texte est compacté une fois pour toutes (espaces de mise
+# en page, césures, en-têtes/pieds de page) avant d'être mis en cache.
+#
+# Le texte brut d'un PDF est aussi gardé page par page (empreinte, numéro de
+# page) : seules les pages absentes du cache sont extraites, par lots, dans
+# un pool de processus pour les gros documents (scripts, import par lot ;
+# dans l'appli Streamlit, l'extraction reste dans le processus). Ajouter un ouvrage ou en
+# remplacer un n'extrait que ce fichier ; une extraction interrompue reprend
+# où elle s'était arrêtée, et un changement de compactage ne relit aucun PDF.
+# Une page ou un fichier illisible n'est jamais mis en cache : le texte
+# obtenu est servi tel quel, et l'extraction est retentée au prochain accès.
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+
+DOSSIER_CACHE = os.environ.get("WISC_CACHE_DIR", ".cache_wisc")
+EXTENSIONS = ('.pdf', '.txt')
+FICHIERS_EXCLUS = ["requirements.txt", "app.py"]
+LRU_MAX = 8   # nombre de textes gardés en mémoire
+VERSION_COMPACTAGE = 2   # à incrémenter si compacter() change (invalide le cache)
+WORKERS_PAGES = int(os.environ.get("WISC_PAGES_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PAR_LOT = 8                     # pages extraites par tâche du pool
+SEUIL_PARALLELE = 2 * PAGES_PAR_LOT   # en dessous, extraction dans le processus
+# Pas de fork : l'appelant peut avoir des threads (verrous copiés dans les fils)
+DEMARRAGE_POOL = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def pages_pdf(file_obj, numeros=None):
+    """Texte des pages d'un PDF (chaîne vide pour une page sans texte) :
+    toutes, ou seulement celles de `numeros` (à partir de 0)."""
+    pages = PdfReader(file_obj).pages
+    return [pages[n].extract_text() or "" for n in (range(len(pages)) if numeros is None else numeros)]
+
+
+def read_file(file_obj, filename):
+    morceaux = []
+    try:
+        if filename.lower().endswith('.pdf'):
+            for page in PdfReader(file_obj).pages:
+                t = page.extract_text()
+                if t:
+                    morceaux += [t, "\n"]
+        else:
+            morceaux.append(file_obj.getvalue().decode("utf-8"))
+    except: pass
+    return "".join(morceaux)
+
+
+# --- Extraction parallèle des pages ---
+_pool_pages = None
+_verrou_pool = threading.Lock()
+
+
+def _pool():
+    """Pool de processus partagé, créé au premier gros PDF (forkserver, sinon spawn)."""
+    global _pool_pages
+    with _verrou_pool:
+        if _pool_pages is None:
+            _pool_pages = ProcessPoolExecutor(WORKERS_PAGES, mp_context=multiprocessing.get_context(DEMARRAGE_POOL))
+        return _pool_pages
+
+
+def _script_non_reimportable():
+    """Vrai si le module principal est un script exécuté par Streamlit (serveur ou
+    AppTest) : module sans chargeur, installé par le ScriptRunner. Un fils
+    forkserver / spawn réimporterait ce script en entier (page, file des tâches...)."""
+    principal = sys.modules.get("__main__")
+    return getattr(principal, "__file__", None) is not None and getattr(principal, "__loader__", None) is None
+
+
+def _abandonner_pool():
+    global _pool_pages
+    with _verrou_pool:
+        pool, _pool_pages = _pool_pages, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extraire_lot(contenu, numeros):
+    """{numéro: texte} d'un lot de pages ; exécuté dans un processus du pool."""
+    return dict(zip(numeros, pages_pdf(io.BytesIO(contenu), numeros)))
+
+
+def _extraire_ici(contenu, numeros):
+    """{numéro: texte} extrait dans ce processus, page par page : une page
+    que pypdf ne sait pas lire vaut None, sans perdre les autres."""
+    pages = PdfReader(io.BytesIO(contenu)).pages
+    lot = {}
+    for n in numeros:
+        try:
+            lot[n] = pages[n].extract_text() or ""
+        except Exception:
+            lot[n] = None
+    return lot
+
+
+def extraire_pages(contenu, numeros):
+    """Texte des pages `numeros` du PDF `contenu` (octets), par lots {numéro: texte}
+    au fil de l'extraction (None pour une page illisible). Un lot que le pool n'a
+    pas pu traiter (pool arrêté ou cassé, page en erreur) est repris ici page par page.
+    Sous Streamlit, tout est extrait ici (voir _script_non_reimportable)."""
+    if WORKERS_PAGES < 2 or len(numeros) < SEUIL_PARALLELE or _script_non_reimportable():
+        yield _extraire_ici(contenu, numeros)
+        return
+    futurs, ici = {}, []
+    for i in range(0, len(numeros), PAGES_PAR_LOT):
+        lot = numeros[i:i + PAGES_PAR_LOT]
+        try:
+            futurs[_pool().submit(_extraire_lot, contenu, lot)] = lot
+        except BrokenProcessPool:
+            _abandonner_pool()
+            ici.append(lot)
+        except Exception:   # RuntimeError : pool arrêté entre-temps par une autre extraction
+            ici.append(lot)
+    for futur in as_completed(futurs):
+        try:
+            yield futur.result()
+            continue
+        except BrokenProcessPool:
+            _abandonner_pool()
+        except Exception:   # page en erreur dans le fils, lot annulé, OSError...
+            pass
+        yield _extraire_ici(contenu, futurs[futur])
+    for lot in ici:
+        yield _extraire_ici(contenu, lot)
+
+
+# --- Compactage du texte extrait ---
+RE_ESPACES = re.compile(r"[ \t\u00a0\x08]+")
+RE_NUMERO_PAGE = re.compile(r"^(p(age)?\.?\s*)?\d{1,4}(\s*/\s*\d{1,4})?$", re.IGNORECASE)
+RE_ALNUM = re.compile(r"[^\W_]")
+RE_APOSTROPHES = re.compile(r"[’‘`´]")
+RE_ELISION_OCR = re.compile(r"(?<!\w)[il1|]'")
+FIN_DE_PHRASE = ('.', ':', ';', '!', '?', '»', ')')
+
+
+def _cle_repetition(ligne):
+    """Clé de comparaison des en-têtes, insensible aux variantes de l'OCR d'une
+    page à l'autre : chiffres, apostrophes (’ ‘ ` ´), « I' » / « 1' » lus pour
+    « l' », et caractères isolés en bout de ligne (« a », « ] », « € », numéros)."""
+    ligne = RE_ELISION_OCR.sub("l'", RE_APOSTROPHES.sub("'", ligne.lower()))
+    ligne = re.sub(r"\d+", "#", ligne)
+    mots = ligne.split()
+    while mots and len(mots[0]) == 1:
+        mots.pop(0)
+    while mots and len(mots[-1]) == 1:
+        mots.pop()
+    return " ".join(mots) or ligne   # ligne faite de parasites : comparée telle quelle
+
+
+def compacter(texte):
+    """Supprime les artefacts de mise en page d'un texte extrait de PDF.
+
+    Les pages sont séparées par des sauts de page (\\f). Une ligne qui revient
+    en tête ou en pied de page sur au moins 3 pages est un titre courant.
+    """
+    pages = [[RE_ESPACES.sub(" ", l).strip() for l in p.splitlines()]
+             for p in texte.split("\f")]
+
+    bords = Counter()
+    for lignes in pages:
+        utiles = [l for l in lignes if l]
+        for l in set(utiles[:2] + utiles[-2:]):
+            bords[_cle_repetition(l)] += 1
+    repetes = {cle for cle, n in bords.items() if n >= 3}
+
+    paragraphes = []
+    courant = ""
+    for lignes in pages:
+        for l in lignes:
+            if not l:
+                if courant:
+                    paragraphes.append(courant)
+                    courant = ""
+                continue
+            if (not RE_ALNUM.search(l) or RE_NUMERO_PAGE.match(l)
+                    or _cle_repetition(l) in repetes):
+                continue
+            if not courant:
+                courant = l
+            elif courant.endswith("-") and courant[-2:-1].isalpha() and l[:1].islower():
+                courant = courant[:-1] + l
+            elif courant.endswith(FIN_DE_PHRASE):
+                courant += "\n" + l
+            else:
+                courant += " " + l
+    if courant:
+        paragraphes.append(courant)
+    return "\n\n".join(paragraphes)
+
+
+def empreinte_fichier(chemin):
+    h = hashlib.sha256()
+    with open(chemin, 'rb') as fh:
+        for bloc in iter(lambda: fh.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def lister_sources(dossier='.'):
+    """Liste les ouvrages PDF/TXT présents dans le dossier (ordre stable)."""
+    return sorted(
+        f for f in os.listdir(dossier)
+        if f.lower().endswith(EXTENSIONS)
+        and f not in FICHIERS_EXCLUS
+        and os.path.isfile(os.path.join(dossier, f))
+    )
+
+
+class Bibliotheque:
+    """Cache texte des ouvrages : disque (par empreinte) + LRU mémoire.
+
+    Une instance est partagée par tout le processus ; les accès sont
+    protégés par un verrou.
+    """
+
+    def __init__(self, dossier_cache=DOSSIER_CACHE, lru_max=LRU_MAX):
+        self.dossier_cache = dossier_cache
+        self.dossier_textes = os.path.join(dossier_cache, "textes")
+        self.dossier_pages = os.path.join(dossier_cache, "pages")
+        self.chemin_index = os.path.join(dossier_cache, "index.json")
+        self.lru_max = lru_max
+        self._lru = OrderedDict()      # empreinte -> texte
+        self._stats = {}               # empreinte -> {"brut": nb car., "net": nb car.}
+        self._verrou = threading.RLock()
+        os.makedirs(self.dossier_textes, exist_ok=True)
+        self._index = self._charger_index()   # chemin absolu -> {mtime, taille, sha}
+
+    # --- Index disque ---
+    def _charger_index(self):
+        try:
+            with open(self.chemin_index, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _sauver_index(self):
+        tmp = self.chemin_index + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self._index, fh)
+        os.replace(tmp, self.chemin_index)
+
+    # --- Empreinte (stat d'abord, hachage seulement si le fichier a bougé) ---
+    def empreinte(self, chemin):
+        chemin = os.path.abspath(chemin)
+        st_ = os.stat(chemin)
+        with self._verrou:
+            connu = self._index.get(chemin)
+            if connu and connu["mtime"] == st_.st_mtime_ns and connu["taille"] == st_.st_size:
+                return connu["sha"]
+        sha = empreinte_fichier(chemin)
+        with self._verrou:
+            self._index[chemin] = {"mtime": st_.st_mtime_ns, "taille": st_.st_size, "sha": sha}
+            self._sauver_index()
+        return sha
+
+    # --- LRU mémoire ---
+    def _lru_get(self, sha):
+        with self._verrou:
+            if sha in self._lru:
+                self._lru.move_to_end(sha)
+                return self._lru[sha]
+        return None
+
+    def _lru_put(self, sha, texte):
+        with self._verrou:
+            self._lru[sha] = texte
+            self._lru.move_to_end(sha)
+            while len(self._lru) > self.lru_max:
+                self._lru.popitem(last=False)
+
+    # --- Accès au texte ---
+    def _extraire(self, chemin, sha):
+        """(texte brut, complet) du fichier ; les pages d'un PDF sont séparées
+        par \\f. Incomplet : pages illisibles laissées vides, ou fichier illisible."""
+        with open(chemin, 'rb') as fh:
+            contenu = fh.read()
+        if not chemin.lower().endswith('.pdf'):
+            try:
+                return contenu.decode("utf-8"), True
+            except UnicodeDecodeError:
+                return "", False
+        try:
+            pages = self._pages(sha, contenu)
+        except Exception:   # PDF illisible (structure, chiffrement...)
+            return "", False
+        return "\f".join(p or "" for p in pages), None not in pages
+
+    def _chemin_page(self, sha, numero):
+        return os.path.join(self.dossier_pages, sha, f"{numero:05d}.txt")
+
+    def _pages(self, sha, contenu):
+        """Texte brut de chaque page : lu dans le cache par (empreinte, page),
+        pages manquantes extraites (en parallèle) et écrites lot par lot.
+        Une page illisible vaut None et n'est pas mise en cache."""
+        nb_pages = len(PdfReader(io.BytesIO(contenu)).pages)
+        os.makedirs(os.path.join(self.dossier_pages, sha), exist_ok=True)
+        pages, manquantes = {}, []
+        for n in range(nb_pages):
+            try:
+                with open(self._chemin_page(sha, n), encoding="utf-8") as fh:
+                    pages[n] = fh.read()
+            except OSError:
+                manquantes.append(n)
+        if manquantes:
+            for lot in extraire_pages(contenu, manquantes):
+                for n, texte in lot.items():
+                    if texte is not None:
+                        self._ecrire(self._chemin_page(sha, n), texte)
+                pages.update(lot)
+        return [pages[n] for n in range(nb_pages)]
+
+    def _chemins_cache(self, sha):
+        base = os.path.join(self.dossier_textes, f"{sha}.c{VERSION_COMPACTAGE}")
+        return base + ".txt", base + ".json"
+
+    @staticmethod
+    def _ecrire(chemin, contenu):
+        tmp = chemin + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(contenu)
+        os.replace(tmp, chemin)
+
+    def texte(self, chemin):
+        """Texte compacté du fichier, reparsé uniquement si son contenu a changé."""
+        sha = self.empreinte(chemin)
+        texte = self._lru_get(sha)
+        if texte is not None:
+            return texte
+        chemin_txt, chemin_stats = self._chemins_cache(sha)
+        try:
+            with open(chemin_txt, encoding="utf-8") as fh:
+                texte = fh.read()
+        except OSError:
+            brut, complet = self._extraire(chemin, sha)
+            texte = compacter(brut)
+            if not complet:   # pas de cache : pages manquantes retentées au prochain accès
+                return texte
+            self._ecrire(chemin_stats, json.dumps({"brut": len(brut), "net": len(texte)}))
+            self._ecrire(chemin_txt, texte)
+        self._lru_put(sha, texte)
+        return texte
+
+    def stats(self, chemin):
+        """Nombre de caractères avant/après compactage : {"brut": ..., "net": ...}."""
+        sha = self.empreinte(chemin)
+        with self._verrou:
+            if sha in self._stats:
+                return self._stats[sha]
+        self.texte(chemin)
+        _, chemin_stats = self._chemins_cache(sha)
+        try:
+            with open(chemin_stats, encoding="utf-8") as fh:
+                stats = json.load(fh)
+        except (OSError, ValueError):
+            n = len(self.texte(chemin))
+            stats = {"brut": n, "net": n}
+        with self._verrou:
+            self._stats[sha] = stats
+        return stats
+
+    def memoire(self):
+        """Octets des textes gardés en mémoire (LRU), partagés par toutes les sessions."""
+        with self._verrou:
+            return sum(sys.getsizeof(t) for t in self._lru.values())
+
+    def prechauffer(self, dossier='.'):
+        """Extrait (si besoin) tous les ouvrages du dossier. Appelé au démarrage."""
+        for f in lister_sources(dossier):
+            try:
+                self.texte(os.path.join(dossier, f))
+            except Exception:
+                pass
+        self.purger()
+
+    def purger(self):
+        """Supprime du disque les textes et pages des contenus qui ne sont plus
+        référencés (ouvrage remplacé ou modifié). Retourne le nombre d'empreintes retirées."""
+        with self._verrou:   # index relu : un autre processus a pu ajouter des ouvrages
+            connues = {v["sha"] for v in {**self._charger_index(), **self._index}.values()}
+        orphelines = set()
+        for nom in os.listdir(self.dossier_textes):
+            sha = nom.split(".", 1)[0]
+            if sha not in connues:
+                orphelines.add(sha)
+                os.remove(os.path.join(self.dossier_textes, nom))
+        if os.path.isdir(self.dossier_pages):
+            for sha in os.listdir(self.dossier_pages):
+                if sha not in connues:
+                    orphelines.add(sha)
+                    shutil.rmtree(os.path.join(self.dossier_pages, sha), ignore_errors=True)
+        return len(orphelines)
@@ -0,0 +1,38 @@
+# ==========================================
+# BILAN DE RÉFÉRENCE (BANC D'ESSAI, TESTS)
+# ==========================================
+# Un profil fixe et le rapport Q-GLOBAL qui lui correspond, partagés par
+# bench.py et les tests. Module de données seulement : l'importer ne change
+# ni l'environnement ni le backend du modèle.
+
+from qglobal import INDICES, INDICES_AVEC_PERCENTILE, SUBTESTS
+
+# Bilan de référence (profil hétérogène : forces verbales, vitesse faible)
+SCORES_BILAN = {
+    'sim': 13, 'voc': 14, 'info': 12, 'comp': 11, 'cub': 9, 'puz': 10, 'mat': 11, 'bal': 10,
+    'arit': 9, 'memc': 8, 'memi': 9, 'seq': 8, 'cod': 6, 'sym': 7, 'bar': 8,
+    'qit': 98, 'perc_qit': 45.0, 'qit_bas': 92, 'qit_haut': 104,
+    'icv': 118, 'perc_icv': 88.0, 'icv_bas': 109, 'icv_haut': 124,
+    'ivs': 97, 'perc_ivs': 42.0, 'ivs_bas': 89, 'ivs_haut': 105,
+    'irf': 103, 'perc_irf': 58.0, 'irf_bas': 95, 'irf_haut': 110,
+    'imt': 91, 'perc_imt': 27.0, 'imt_bas': 84, 'imt_haut': 99,
+    'ivt': 80, 'perc_ivt': 9.0, 'ivt_bas': 73, 'ivt_haut': 91,
+}
+
+
+def rapport_qglobal():
+    """Texte d'un rapport Q-GLOBAL (tableaux de synthèse) construit depuis SCORES_BILAN."""
+    lignes = ["WISC-V Rapport de notes",
+              "Nom : Lucas X     Date de naissance : 03/04/2014",
+              "Date de l'évaluation : 12/06/2023   Âge : 9 ans 2 mois", "",
+              "Synthèse des notes composites",
+              "Indice  Somme NS  Note composite  Rang percentile  IC 95 %   Catégorie"]
+    for cle, (abrev, nom) in INDICES.items():
+        if cle in INDICES_AVEC_PERCENTILE:
+            s = SCORES_BILAN
+            lignes.append(f"{nom} {abrev}    {s[cle] // 5}    {s[cle]}    {s['perc_' + cle]:g}    "
+                          f"{s[cle + '_bas']}-{s[cle + '_haut']}    Moyen")
+    lignes += ["", "Synthèse des notes des subtests", "Subtest  Note brute  Note standard  Rang percentile"]
+    for cle, (abrev, nom) in SUBTESTS.items():
+        lignes.append(f"{nom} {abrev}    {SCORES_BILAN[cle] * 2 + 3}    {SCORES_BILAN[cle]}    50")
+    return "\n".join(lignes) + "\n"
@@ -0,0 +1,178 @@
+# ==========================================
+# TEST DE CHARGE (SESSIONS SIMULTANÉES)
+# ==========================================
+# Lance l'appli (streamlit run, backend IA local) et y connecte N sessions
+# simultanées par le même websocket que le navigateur : premier rendu, puis
+# saisies de scores qui relancent le rendu ; avec --generer, chaque session
+# demande aussi un compte rendu et attend qu'il arrive.
+#
+# Utilisation :
+#   python charge.py [--sessions 12] [--rendus 10] [--generer] [--latence 0.5]
+#
+# Le modèle est simulé (WISC_IA_BACKEND=stub, --latence secondes par
+# réponse) : on mesure l'appli, pas l'API. Le serveur travaille dans un
+# dossier temporaire (WISC_CACHE_DIR, WISC_DONNEES_DIR), supprimé à la fin. Rapporte la mémoire résidente du
+# serveur (chaud avec une session, puis avec N) et les latences p50 / p95
+# d'un rendu.
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.asyncio.client import connect
+
+from memoire import rss_octets
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+SCORES = ["sim", "voc", "cub", "puz", "mat", "bal", "memc", "memi", "cod", "sym"]
+PORT_DEFAUT = 8531
+DEMARRAGE_MAX = 60    # secondes pour que le serveur réponde
+ATTENTE_MAX = 180     # secondes d'attente d'un compte rendu
+FIN_GENERATION = "Génération complète"
+
+
+def centile(valeurs, q):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * q))] if valeurs else 0.0
+
+
+def demarrer_serveur(port, latence, cache):
+    env = {**os.environ, "WISC_IA_BACKEND": "stub", "WISC_STUB_LATENCE": str(latence), "WISC_CACHE_DIR": cache,
+           "WISC_DONNEES_DIR": os.path.join(cache, "donnees")}
+    serveur = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+         "--server.port", str(port), "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(APP), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.time() + DEMARRAGE_MAX
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=1):
+                return serveur
+        except OSError:
+            time.sleep(0.5)
+    serveur.terminate()
+    raise RuntimeError(f"Le serveur ne répond pas sur le port {port}")
+
+
+class Session:
+    """Une session navigateur : envoie les saisies, attend la fin de chaque rendu."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}     # clé ou libellé -> identifiant du widget
+        self.valeurs = {}     # identifiant -> valeur saisie (renvoyée à chaque rendu)
+        self.latences = []
+        self.erreurs = 0
+        self.textes = []
+
+    async def rendu(self, declencheur=None):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        for id_widget, valeur in self.valeurs.items():
+            etat = msg.rerun_script.widget_states.widgets.add()
+            etat.id, etat.int_value = id_widget, valeur
+        if declencheur:
+            etat = msg.rerun_script.widget_states.widgets.add()
+            etat.id, etat.trigger_value = declencheur, True
+        debut = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        self.textes = []
+        while True:
+            f = ForwardMsg()
+            f.ParseFromString(await self.ws.recv())
+            if f.WhichOneof("type") == "script_finished":
+                break
+            if f.WhichOneof("type") != "delta" or f.delta.WhichOneof("type") != "new_element":
+                continue
+            element = f.delta.new_element
+            genre = element.WhichOneof("type")
+            if genre in ("number_input", "button"):
+                w = getattr(element, genre)
+                self.widgets[w.id.rsplit("-", 1)[-1] if genre == "number_input" else w.label] = w.id
+            elif genre == "exception":
+                self.erreurs += 1
+            elif genre == "markdown":
+                self.textes.append(element.markdown.body)
+        self.latences.append(time.perf_counter() - debut)
+
+    def saisir(self, cle, valeur):
+        self.valeurs[self.widgets[cle]] = valeur
+
+
+async def scenario(session, numero, rendus, generer):
+    alea = random.Random(numero)
+    await session.rendu()
+    for _ in range(rendus):
+        session.saisir(alea.choice(SCORES), alea.randint(4, 16))
+        await session.rendu()
+    if generer:
+        bouton = next(i for libelle, i in session.widgets.items() if "GÉNÉRER L'ANALYSE" in libelle)
+        await session.rendu(declencheur=bouton)
+        limite = time.time() + ATTENTE_MAX
+        while not any(FIN_GENERATION in t for t in session.textes) and time.time() < limite:
+            await asyncio.sleep(1)
+            await session.rendu()
+
+
+async def charge(port, n, rendus, generer, pid):
+    url = f"ws://localhost:{port}/_stcore/stream"
+    async with connect(url, max_size=None) as ws:   # serveur chaud : caches partagés remplis
+        await Session(ws).rendu()
+        rss_une = rss_octets(pid)
+        connexions = [await connect(url, max_size=None) for _ in range(n)]
+        sessions = [Session(ws) for ws in connexions]
+        debut = time.perf_counter()
+        await asyncio.gather(*(scenario(s, i, rendus, generer) for i, s in enumerate(sessions)))
+        duree = time.perf_counter() - debut
+        rss_n = rss_octets(pid)
+        for ws in connexions:
+            await ws.close()
+    return sessions, duree, rss_une, rss_n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge : N sessions simultanées sur l'appli.")
+    parser.add_argument("--sessions", type=int, default=12)
+    parser.add_argument("--rendus", type=int, default=10, help="Saisies (rendus) par session")
+    parser.add_argument("--generer", action="store_true", help="Chaque session demande un compte rendu")
+    parser.add_argument("--latence", type=float, default=0.5, help="Latence simulée du modèle (secondes)")
+    parser.add_argument("--port", type=int, default=PORT_DEFAUT)
+    args = parser.parse_args(argv)
+
+    cache = tempfile.mkdtemp(prefix="charge_wisc_")
+    try:
+        serveur = demarrer_serveur(args.port, args.latence, cache)
+        try:
+            sessions, duree, rss_une, rss_n = asyncio.run(
+                charge(args.port, args.sessions, args.rendus, args.generer, serveur.pid))
+        finally:
+            serveur.terminate()
+            serveur.wait()
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+    premiers = [s.latences[0] for s in sessions]
+    suivants = [l for s in sessions for l in s.latences[1:]]
+    erreurs = sum(s.erreurs for s in sessions)
+    print(f"{args.sessions} session(s), {len(premiers) + len(suivants)} rendus en {duree:.1f} s, "
+          f"{erreurs} exception(s) dans l'appli")
+    print(f"Mémoire résidente du serveur : {rss_une / 2**20:.0f} Mo (1 session) -> "
+          f"{rss_n / 2**20:.0f} Mo ({args.sessions + 1} sessions), "
+          f"+{(rss_n - rss_une) / 2**20 / args.sessions:.1f} Mo par session")
+    print(f"Premier rendu : p50 {centile(premiers, 0.5):.2f} s, p95 {centile(premiers, 0.95):.2f} s")
+    print(f"Rendus suivants : p50 {centile(suivants, 0.5):.2f} s, p95 {centile(suivants, 0.95):.2f} s")
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# ==========================================
+# DIAGNOSTICS : TEMPS PAR BLOC DU RENDU
+# ==========================================
+# Les blocs coûteux d'un rendu (CSS, bibliothèque, saisie des scores,
+# validité, radar, prompt, appel au modèle, export) sont chronométrés dans
+# des « spans ». Les durées sont agrégées pour le processus et pour chaque
+# session, consultées sur la page de diagnostics de l'administrateur, et
+# écrites dans un journal local tournant (une ligne JSON par span).
+#
+# WISC_DIAGNOSTICS=0 désactive les mesures : span() rend alors un
+# gestionnaire de contexte vide partagé (ni horloge, ni verrou, ni écriture).
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from logging.handlers import RotatingFileHandler
+
+from bibliotheque import DOSSIER_CACHE
+from memoire import INACTIVITE_SESSION
+
+ACTIF = os.environ.get("WISC_DIAGNOSTICS", "1") != "0"
+TAILLE_JOURNAL = 1024 * 1024   # octets avant rotation du journal
+FICHIERS_JOURNAL = 3           # anciens journaux gardés (diagnostics.log.1 à .3)
+ECHANTILLONS = 500             # dernières durées gardées par bloc (p50 / p95)
+
+_INACTIF = nullcontext()
+
+
+def _centile(valeurs, q):
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * q))] if valeurs else None
+
+
+class Diagnostics:
+    """Durées des blocs du rendu : agrégats processus / session et journal tournant."""
+
+    def __init__(self, chemin=None, actif=ACTIF, inactivite=INACTIVITE_SESSION):
+        self.chemin = chemin or os.path.join(DOSSIER_CACHE, "diagnostics.log")
+        self.actif = actif
+        self.inactivite = inactivite
+        self._verrou = threading.Lock()
+        self._processus = {}   # bloc -> {"n", "total", "max", "recents"}
+        self._sessions = {}    # id -> {"utilisateur", "vu", "blocs": {bloc: {"n", "total", "max", "dernier"}}}
+        self._journal = None
+
+    def _journaliser(self, ligne):
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.chemin) or ".", exist_ok=True)
+            journal = logging.Logger("wisc.diagnostics")   # hors registre : pas de propagation
+            gestionnaire = RotatingFileHandler(self.chemin, maxBytes=TAILLE_JOURNAL,
+                                               backupCount=FICHIERS_JOURNAL, encoding="utf-8")
+            gestionnaire.setFormatter(logging.Formatter("%(message)s"))
+            journal.addHandler(gestionnaire)
+            self._journal = journal
+        self._journal.info(ligne)
+
+    def span(self, bloc, session=None, utilisateur=""):
+        """Gestionnaire de contexte qui chronomètre `bloc` (sans effet si désactivé)."""
+        if not self.actif:
+            return _INACTIF
+        return self._span(bloc, session, utilisateur)
+
+    @contextmanager
+    def _span(self, bloc, session, utilisateur):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.noter(bloc, time.perf_counter() - debut, session, utilisateur)
+
+    def noter(self, bloc, secondes, session=None, utilisateur=""):
+        """Durée mesurée ailleurs (tâche de fond, par exemple)."""
+        if not self.actif:
+            return
+        maintenant = time.time()
+        with self._verrou:
+            p = self._processus.setdefault(bloc, {"n": 0, "total": 0.0, "max": 0.0,
+                                                  "recents": deque(maxlen=ECHANTILLONS)})
+            p["n"] += 1
+            p["total"] += secondes
+            p["max"] = max(p["max"], secondes)
+            p["recents"].append(secondes)
+            if session:
+                s = self._sessions.setdefault(session, {"utilisateur": utilisateur, "blocs": {}})
+                s["vu"] = maintenant
+                b = s["blocs"].setdefault(bloc, {"n": 0, "total": 0.0, "max": 0.0, "dernier": 0.0})
+                b["n"] += 1
+                b["total"] += secondes
+                b["max"] = max(b["max"], secondes)
+                b["dernier"] = secondes
+        self._journaliser(json.dumps({"ts": round(maintenant, 3), "session": session, "utilisateur": utilisateur,
+                                      "bloc": bloc, "ms": round(secondes * 1000, 2)}, ensure_ascii=False))
+
+    def synthese(self):
+        """Par bloc, pour tout le processus, le plus coûteux d'abord :
+        [{"bloc", "n", "total", "moyenne", "p50", "p95", "max"}] (secondes)."""
+        with self._verrou:
+            copie = {bloc: (p["n"], p["total"], p["max"], sorted(p["recents"]))
+                     for bloc, p in self._processus.items()}
+        lignes = [{"bloc": bloc, "n": n, "total": total, "moyenne": total / n, "p50": _centile(recents, 0.5),
+                   "p95": _centile(recents, 0.95), "max": maxi}
+                  for bloc, (n, total, maxi, recents) in copie.items()]
+        return sorted(lignes, key=lambda l: l["total"], reverse=True)
+
+    def sessions(self):
+        """Sessions actives, les plus coûteuses d'abord :
+        [{"id", "utilisateur", "vu", "total", "blocs"}]."""
+        limite = time.time() - self.inactivite
+        with self._verrou:
+            for id_session in [i for i, s in self._sessions.items() if s["vu"] < limite]:
+                del self._sessions[id_session]
+            copie = {i: {**s, "blocs": {b: dict(v) for b, v in s["blocs"].items()}}
+                     for i, s in self._sessions.items()}
+        lignes = [{"id": i, **s, "total": sum(b["total"] for b in s["blocs"].values())} for i, s in copie.items()]
+        return sorted(lignes, key=lambda l: l["total"], reverse=True)
+
+    def vider(self):
+        with self._verrou:
+            self._processus.clear()
+            self._sessions.clear()
@@ -0,0 +1,113 @@
+# ==========================================
+# COMPARAISONS PAR PAIRES (ÉCARTS CRITIQUES)
+# ==========================================
+# Différences entre indices principaux (et IAG / ICC) et entre les subtests
+# de chaque indice, comparées à des seuils critiques et, si disponibles, à
+# des taux de base par tranche d'âge. Le tableau obtenu est injecté tel quel
+# dans les données du prompt : le modèle n'a plus à recalculer les écarts.
+#
+# Seuils et taux de base sont fournis par l'utilisateur (tables de l'éditeur
+# sous licence) dans normes/ecarts/*.csv :
+#
+#   paire;critique;ecart;taux_base;tranche
+#   ICV-IVS;11,5;;;6:0-16:11        seuil critique de la paire
+#   ICV-IVS;;15;12,4;               12,4 % de l'échantillon ont un écart >= 15
+#
+# Sans table, le seuil par défaut est de 15 points pour les indices (un
+# écart-type) et de 4 points pour les subtests (règle d'homogénéité).
+
+import os
+from itertools import combinations
+
+from normes import DOSSIER_NORMES, lire_csv, nombre, tranche, TOUS_AGES
+from psychometrie import INDICES_PRINCIPAUX, PAIRES, SEUIL_HETEROGENEITE
+from qglobal import SUBTESTS
+
+DOSSIER_ECARTS = os.path.join(DOSSIER_NORMES, "ecarts")
+
+PAIRES_INDICES = list(combinations(INDICES_PRINCIPAUX, 2)) + [("IAG", "ICC")]
+PAIRES_SUBTESTS = [(SUBTESTS[a][0], SUBTESTS[b][0]) for a, b in PAIRES]
+CHAMP = {**{k: k.lower() for k in INDICES_PRINCIPAUX + ["IAG", "ICC"]},
+         **{abrev: cle for cle, (abrev, _) in SUBTESTS.items()}}
+CRITIQUE_DEFAUT = {"indice": 15, "subtest": SEUIL_HETEROGENEITE}
+
+
+def _nom_paire(txt):
+    a, b = (x.strip().upper() for x in txt.split("-"))
+    return a, b
+
+
+def _dans(bornes, age_mois):
+    if bornes == TOUS_AGES:
+        return True
+    return age_mois is not None and bornes[0] <= age_mois <= bornes[1]
+
+
+class TablesEcarts:
+    """Seuils critiques et taux de base par paire et tranche d'âge."""
+
+    def __init__(self, lignes=()):
+        self.critiques = {}   # (a, b) -> [(bornes, seuil)]
+        self.taux = {}        # (a, b) -> [(bornes, écart, taux en %)]
+        for l in lignes:
+            paire, bornes = _nom_paire(l["paire"]), tranche(l.get("tranche"))
+            if (l.get("critique") or "").strip():
+                self.critiques.setdefault(paire, []).append((bornes, nombre(l["critique"])))
+            if (l.get("taux_base") or "").strip():
+                self.taux.setdefault(paire, []).append((bornes, nombre(l["ecart"]), nombre(l["taux_base"])))
+
+    @classmethod
+    def depuis_dossier(cls, dossier=DOSSIER_ECARTS):
+        return cls(lire_csv(dossier))
+
+    def _pour(self, table, a, b, age_mois):
+        return [x for x in table.get((a, b), []) + table.get((b, a), []) if _dans(x[0], age_mois)]
+
+    def critique(self, a, b, genre, age_mois=None):
+        seuils = self._pour(self.critiques, a, b, age_mois)
+        return seuils[0][1] if seuils else CRITIQUE_DEFAUT[genre]
+
+    def taux_base(self, a, b, ecart, age_mois=None):
+        """% de l'échantillon avec un écart au moins aussi grand (None si non tabulé)."""
+        lignes = sorted((e, t) for _, e, t in self._pour(self.taux, a, b, age_mois) if e <= abs(ecart))
+        return lignes[-1][1] if lignes else None
+
+
+def comparer(scores, age_mois=None, tables=None):
+    """Une ligne par paire renseignée : genre, paire, notes, écart, seuil, significatif, taux de base."""
+    tables = tables or TablesEcarts()
+    lignes = []
+    for genre, paires in (("indice", PAIRES_INDICES), ("subtest", PAIRES_SUBTESTS)):
+        for a, b in paires:
+            va, vb = getattr(scores, CHAMP[a]), getattr(scores, CHAMP[b])
+            if not (va > 0 and vb > 0):
+                continue
+            ecart = va - vb
+            critique = tables.critique(a, b, genre, age_mois)
+            lignes.append({"genre": genre, "paire": f"{a}-{b}", "a": va, "b": vb, "ecart": ecart,
+                           "critique": critique, "significatif": abs(ecart) >= critique,
+                           "taux_base": tables.taux_base(a, b, ecart, age_mois)})
+    return lignes
+
+
+def _nb(x):
+    return f"{x:g}".replace(".", ",")
+
+
+def formater_comparaisons(lignes):
+    """Tableau compact pour le prompt (chaîne vide si aucune paire renseignée)."""
+    if not lignes:
+        return ""
+    txt = "Comparaisons par paires (écart A-B ; * = écart >= seuil critique) :"
+    for genre, titre in (("indice", "Indices"), ("subtest", "Subtests")):
+        morceaux = []
+        for l in lignes:
+            if l["genre"] != genre:
+                continue
+            m = f"{l['paire']} {int(l['ecart']):+d}{'*' if l['significatif'] else ''} (seuil {_nb(l['critique'])}"
+            if l["taux_base"] is not None:
+                m += f", taux de base {_nb(l['taux_base'])} %"
+            morceaux.append(m + ")")
+        if morceaux:
+            txt += f"\n{titre} : " + ", ".join(morceaux) + "."
+    return txt
@@ -0,0 +1,201 @@
+# ==========================================
+# DOSSIERS PATIENTS (STOCKAGE LOCAL CHIFFRÉ)
+# ==========================================
+# Bilans enregistrés dans une base SQLite locale : identité, observations,
+# scores, analyse et résumé générés, fichiers DOCX / PDF exportés.
+# Fonctionne hors ligne, sans service externe.
+#
+# Tout ce qui identifie l'enfant est chiffré (Fernet, AES-128 + HMAC) :
+#   - contenu : le dossier complet (JSON) ;
+#   - entete  : prénom et âge, seuls déchiffrés pour afficher une liste ;
+#   - exports : octets des fichiers, table à part (lus seulement à la demande).
+# Les colonnes indexées restent en clair pour la recherche : date du bilan,
+# identifiant du clinicien et empreinte HMAC du prénom normalisé (recherche
+# exacte sans accents ni casse, le prénom lui-même n'est jamais en clair).
+#
+# Clé : secret Streamlit WISC_CLE_DOSSIERS (passé par l'application), sinon
+# variable d'environnement du même nom, sinon fichier donnees/cle_dossiers.key
+# créé au premier usage (droits 600). Sans la clé, les dossiers sont
+# illisibles : la sauvegarder.
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from contextlib import contextmanager
+from dataclasses import asdict
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from moteur import calculer_age, entree_depuis_dict
+
+DOSSIER_DONNEES = os.environ.get("WISC_DONNEES_DIR", "donnees")
+FICHIER_CLE = "cle_dossiers.key"
+LIMITE_LISTE = 50
+
+
+def cle_chiffrement(dossier=DOSSIER_DONNEES):
+    """Clé Fernet (octets) : WISC_CLE_DOSSIERS, sinon fichier local généré une fois."""
+    cle = os.environ.get("WISC_CLE_DOSSIERS")
+    if cle:
+        return cle.encode("ascii")
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, FICHIER_CLE)
+    try:
+        fd = os.open(chemin, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(chemin, "rb") as fh:
+            return fh.read().strip()
+    cle = Fernet.generate_key()
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(cle)
+    return cle
+
+
+def normaliser_nom(nom):
+    """« Éloïse » -> « eloise » : sans accents, casse ni espaces superflus."""
+    nom = unicodedata.normalize("NFKD", nom or "")
+    return " ".join("".join(c for c in nom if not unicodedata.combining(c)).casefold().split())
+
+
+class Dossiers:
+    """Base locale des bilans : enregistrer, ouvrir, lister, supprimer."""
+
+    def __init__(self, chemin=None, cle=None):
+        if chemin is None:
+            os.makedirs(DOSSIER_DONNEES, exist_ok=True)
+            chemin = os.path.join(DOSSIER_DONNEES, "dossiers.sqlite")
+        cle = cle or cle_chiffrement(os.path.dirname(chemin) or ".")
+        self.chemin = chemin
+        self._fernet = Fernet(cle)
+        # Sous-clé dérivée pour l'index des prénoms (distincte de la clé de chiffrement)
+        self._cle_index = hashlib.sha256(b"wisc-index-nom" + cle).digest()
+        with self._connexion() as cx:
+            cx.execute("PRAGMA journal_mode=WAL")
+            cx.execute("""CREATE TABLE IF NOT EXISTS dossiers (
+                id INTEGER PRIMARY KEY, nom TEXT, date_bilan TEXT, clinicien TEXT,
+                cree REAL, modifie REAL, entete BLOB, contenu BLOB)""")
+            cx.execute("""CREATE TABLE IF NOT EXISTS exports (
+                dossier INTEGER, format TEXT, contenu BLOB, PRIMARY KEY (dossier, format))""")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_dossiers_nom ON dossiers(nom, date_bilan)")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_dossiers_date ON dossiers(date_bilan)")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_dossiers_clinicien ON dossiers(clinicien, date_bilan)")
+
+    @contextmanager
+    def _connexion(self):
+        cx = sqlite3.connect(self.chemin, timeout=10)
+        try:
+            with cx:   # commit / rollback
+                yield cx
+        finally:
+            cx.close()
+
+    def _empreinte_nom(self, nom):
+        return hmac.new(self._cle_index, normaliser_nom(nom).encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _chiffrer(self, objet):
+        return self._fernet.encrypt(json.dumps(objet, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def _dechiffrer(self, jeton):
+        try:
+            return json.loads(self._fernet.decrypt(jeton))
+        except InvalidToken:
+            raise ValueError("Dossier illisible : clé de chiffrement incorrecte ou données altérées") from None
+
+    def enregistrer(self, entree, clinicien="", analyse="", resume="", champs_export=None,
+                    exports=None, id_dossier=None):
+        """Crée le dossier (ou remplace `id_dossier`). Retourne son identifiant.
+
+        `exports` : {format: octets} des fichiers rendus (facultatif).
+        """
+        idt = entree.identite
+        ans, mois = calculer_age(idt.date_naissance, idt.date_bilan)
+        entete = {"prenom": idt.prenom, "age": f"{ans} ans {mois} mois"}
+        contenu = {**asdict(entree), "analyse": analyse, "resume": resume, "champs_export": champs_export}
+        maintenant = time.time()
+        with self._connexion() as cx:
+            if id_dossier is None:
+                id_dossier = cx.execute(
+                    "INSERT INTO dossiers (cree) VALUES (?)", (maintenant,)).lastrowid
+            cx.execute("""UPDATE dossiers SET nom = ?, date_bilan = ?, clinicien = ?, modifie = ?,
+                          entete = ?, contenu = ? WHERE id = ?""",
+                       (self._empreinte_nom(idt.prenom), idt.date_bilan.isoformat(), clinicien,
+                        maintenant, self._chiffrer(entete), self._chiffrer(contenu), id_dossier))
+            if exports is not None:
+                cx.execute("DELETE FROM exports WHERE dossier = ?", (id_dossier,))
+                cx.executemany("INSERT INTO exports VALUES (?, ?, ?)",
+                               [(id_dossier, fmt, self._fernet.encrypt(octets))
+                                for fmt, octets in exports.items() if octets])
+        return id_dossier
+
+    def ouvrir(self, id_dossier):
+        """Dossier complet : {"id", "entree" (EntreeBilan), "analyse", "resume",
+        "champs_export", "clinicien", "modifie", "formats"}. None si absent."""
+        with self._connexion() as cx:
+            ligne = cx.execute("SELECT contenu, clinicien, modifie FROM dossiers WHERE id = ?",
+                               (id_dossier,)).fetchone()
+            formats = [f for (f,) in cx.execute("SELECT format FROM exports WHERE dossier = ?",
+                                                 (id_dossier,))]
+        if ligne is None:
+            return None
+        contenu = self._dechiffrer(ligne[0])
+        return {"id": id_dossier, "entree": entree_depuis_dict(contenu),
+                "analyse": contenu.get("analyse", ""), "resume": contenu.get("resume", ""),
+                "champs_export": contenu.get("champs_export"),
+                "clinicien": ligne[1], "modifie": ligne[2], "formats": formats}
+
+    def export(self, id_dossier, fmt):
+        """Octets du fichier exporté enregistré avec le dossier (None si absent)."""
+        with self._connexion() as cx:
+            ligne = cx.execute("SELECT contenu FROM exports WHERE dossier = ? AND format = ?",
+                               (id_dossier, fmt)).fetchone()
+        if not ligne:
+            return None
+        try:
+            return self._fernet.decrypt(ligne[0])
+        except InvalidToken:
+            raise ValueError("Export illisible : clé de chiffrement incorrecte ou données altérées") from None
+
+    def lister(self, nom=None, clinicien=None, du=None, au=None, limite=LIMITE_LISTE):
+        """Dossiers les plus récents (date du bilan), filtrés par prénom exact,
+        clinicien et période (dates) :
+        [{"id", "prenom", "age", "date_bilan", "clinicien", "modifie", "formats"}]."""
+        conditions, params = [], []
+        if nom:
+            conditions.append("nom = ?"); params.append(self._empreinte_nom(nom))
+        if clinicien:
+            conditions.append("clinicien = ?"); params.append(clinicien)
+        if du:
+            conditions.append("date_bilan >= ?"); params.append(du.isoformat())
+        if au:
+            conditions.append("date_bilan <= ?"); params.append(au.isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connexion() as cx:
+            lignes = cx.execute(
+                f"""SELECT id, date_bilan, clinicien, modifie, entete,
+                           (SELECT group_concat(format) FROM exports WHERE dossier = dossiers.id)
+                    FROM dossiers {where}
+                    ORDER BY date_bilan DESC, modifie DESC LIMIT ?""", params + [limite]).fetchall()
+        return [{"id": i, **self._dechiffrer(entete), "date_bilan": d, "clinicien": c, "modifie": m,
+                 "formats": f.split(",") if f else []}
+                for i, d, c, m, entete, f in lignes]
+
+    def historique(self, prenom, date_naissance, clinicien=None):
+        """Dossiers complets du même enfant (prénom et date de naissance),
+        du bilan le plus ancien au plus récent."""
+        dossiers = [self.ouvrir(d["id"]) for d in self.lister(nom=prenom, clinicien=clinicien, limite=-1)]
+        return sorted((d for d in dossiers if d["entree"].identite.date_naissance == date_naissance),
+                      key=lambda d: d["entree"].identite.date_bilan)
+
+    def supprimer(self, id_dossier):
+        with self._connexion() as cx:
+            cx.execute("DELETE FROM exports WHERE dossier = ?", (id_dossier,))
+            cx.execute("DELETE FROM dossiers WHERE id = ?", (id_dossier,))
+
+    def stats(self):
+        with self._connexion() as cx:
+            n = cx.execute("SELECT COUNT(*) FROM dossiers").fetchone()[0]
+        return {"dossiers": n, "taille": os.path.getsize(self.chemin)}
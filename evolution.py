@@ -0,0 +1,88 @@
+# ==========================================
+# ÉVOLUTION ENTRE BILANS (RETEST)
+# ==========================================
+# Compare deux protocoles ou plus d'un même enfant, du plus ancien au plus
+# récent : écarts par note composite et par subtest calculés d'un coup sur
+# la matrice T × 24 de psychometrie.matrice.
+#
+# Un changement de note composite est jugé au-delà de l'erreur de mesure
+# quand les IC 95 % saisis (*_bas / *_haut) des deux bilans sont disjoints.
+# Les subtests n'ont pas d'IC : on signale un écart d'au moins un
+# écart-type (3 points de note standard).
+#
+# Le prompt ne reçoit que le tableau compact des évolutions, pas les
+# scores complets des bilans précédents.
+
+import numpy as np
+
+from psychometrie import COLONNES, COLONNES_SUBTESTS, COLONNES_INDICES, matrice
+from qglobal import SUBTESTS, INDICES
+
+ECART_TYPE_SUBTEST = 3
+COLONNES_IC = [f"{k}_{borne}" for k in COLONNES_INDICES for borne in ("bas", "haut")]
+ABREVIATIONS = {k: abrev for k, (abrev, _) in {**SUBTESTS, **INDICES}.items()}
+
+
+def matrice_ic(lignes):
+    """Tableau N × 9 × 2 des IC (bas, haut) des notes composites (0 = non saisi)."""
+    return matrice(lignes, COLONNES_IC).reshape(len(lignes), len(COLONNES_INDICES), 2)
+
+
+def _changements(delta, ic_avant, ic_apres):
+    """1 au-delà de l'erreur de mesure, 0 en deçà, -1 non calculable."""
+    ns = len(COLONNES_SUBTESTS)
+    change = np.where(np.isnan(delta), -1, (np.abs(delta) >= ECART_TYPE_SUBTEST).astype(int))
+    ic_connus = ((ic_avant > 0) & (ic_apres > 0)).all(axis=-1)
+    disjoints = (ic_apres[..., 0] > ic_avant[..., 1]) | (ic_apres[..., 1] < ic_avant[..., 0])
+    change[..., ns:] = np.where(~np.isnan(delta[..., ns:]) & ic_connus, disjoints.astype(int), -1)
+    return change
+
+
+def evolution_lot(X, IC):
+    """Écarts entre T protocoles d'un même enfant (du plus ancien au plus récent).
+
+    X : matrice T × 24 (psychometrie.matrice), IC : T × 9 × 2 (matrice_ic).
+    Retourne un dict de tableaux :
+      delta (T-1 × 24)    écart avec le bilan précédent (NaN si une note manque)
+      change (T-1 × 24)   1 au-delà de l'erreur de mesure, 0 en deçà, -1 non calculable
+      total, change_total (24)   idem entre le premier et le dernier bilan
+    """
+    X = np.where(np.asarray(X, dtype=float) > 0, X, np.nan)
+    IC = np.asarray(IC, dtype=float)
+    delta = X[1:] - X[:-1]
+    total = X[-1] - X[0]
+    return {"delta": delta, "change": _changements(delta, IC[:-1], IC[1:]),
+            "total": total, "change_total": _changements(total, IC[0], IC[-1])}
+
+
+def comparer_bilans(protocoles):
+    """Une ligne par note renseignée au premier et au dernier bilan.
+
+    `protocoles` : objets Scores (ou dicts) du plus ancien au plus récent.
+    """
+    X = matrice(protocoles)
+    r = evolution_lot(X, matrice_ic(protocoles))
+    lignes = []
+    for j, k in enumerate(COLONNES):
+        if np.isnan(r["total"][j]):
+            continue
+        lignes.append({"genre": "subtest" if k in SUBTESTS else "indice", "note": ABREVIATIONS[k],
+                       "valeurs": [int(v) for v in X[:, j]], "delta": int(r["total"][j]),
+                       "hors_erreur": r["change_total"][j] == 1})
+    return lignes
+
+
+def formater_evolution(dates, lignes):
+    """Tableau compact pour le prompt (chaîne vide si aucune note comparable)."""
+    if not lignes:
+        return ""
+    txt = (f"Évolution entre bilans ({' -> '.join(dates)} ; écart dernier - premier ; "
+           "* = au-delà de l'erreur de mesure : IC 95 % disjoints pour les indices, "
+           f">= {ECART_TYPE_SUBTEST} points pour les subtests) :")
+    for genre, titre in (("indice", "Indices"), ("subtest", "Subtests")):
+        morceaux = [f"{l['note']} {'->'.join(str(v) if v else '?' for v in l['valeurs'])} "
+                    f"({l['delta']:+d}{'*' if l['hors_erreur'] else ''})"
+                    for l in lignes if l["genre"] == genre]
+        if morceaux:
+            txt += f"\n{titre} : " + ", ".join(morceaux) + "."
+    return txt
@@ -0,0 +1,252 @@
+# ==========================================
+# EXPORTS DU COMPTE RENDU (WORD / PDF)
+# ==========================================
+# Les styles PDF sont construits une fois au chargement du module. Les
+# fichiers rendus sont gardés en mémoire par empreinte du texte et de
+# l'identité : un rerun ou un second téléchargement ne refait pas le rendu.
+
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import date
+from docx import Document
+from docx.shared import Cm
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable, Table, TableStyle, Image
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
+
+from bibliotheque import DOSSIER_CACHE
+from graphiques import radar_png
+
+VERSION_EXPORTS = 2   # à incrémenter si la mise en page change (invalide le cache)
+LRU_EXPORTS = 16      # fichiers rendus gardés en mémoire, toutes sessions
+FORMATS = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+# --- Couleurs et styles PDF ---
+BLEU_MARINE  = colors.HexColor('#1B3A5C')
+BLEU_MOYEN   = colors.HexColor('#2D6A9F')
+OR_MEDICAL   = colors.HexColor('#C9A84C')
+GRIS_DOUX    = colors.HexColor('#E8E4DF')
+GRIS_TEXTE   = colors.HexColor('#6B7280')
+FOND_CLAIR   = colors.HexColor('#F5F2EE')
+
+s_titre = ParagraphStyle('titre',
+    fontSize=18, textColor=BLEU_MARINE,
+    fontName='Helvetica-Bold', alignment=TA_LEFT,
+    spaceAfter=4)
+
+s_sous_titre = ParagraphStyle('sous_titre',
+    fontSize=9, textColor=OR_MEDICAL,
+    fontName='Helvetica-Bold', alignment=TA_LEFT,
+    spaceAfter=16, letterSpacing=1.5)
+
+s_section = ParagraphStyle('section',
+    fontSize=10, textColor=BLEU_MARINE,
+    fontName='Helvetica-Bold', alignment=TA_LEFT,
+    spaceBefore=14, spaceAfter=6,
+    borderPad=4)
+
+s_corps = ParagraphStyle('corps',
+    fontSize=9.5, textColor=colors.HexColor('#1a2a3a'),
+    fontName='Helvetica', alignment=TA_JUSTIFY,
+    spaceAfter=8, leading=15)
+
+s_avert = ParagraphStyle('avert',
+    fontSize=8, textColor=GRIS_TEXTE,
+    fontName='Helvetica-Oblique', alignment=TA_CENTER,
+    spaceAfter=6)
+
+s_pied = ParagraphStyle('pied',
+    fontSize=7.5, textColor=GRIS_TEXTE,
+    fontName='Helvetica', alignment=TA_CENTER)
+
+STYLE_IDENTITE = TableStyle([
+    ('BACKGROUND', (0,0), (0,-1), FOND_CLAIR),
+    ('BACKGROUND', (2,0), (2,-1), FOND_CLAIR),
+    ('TEXTCOLOR',  (0,0), (0,-1), BLEU_MARINE),
+    ('TEXTCOLOR',  (2,0), (2,-1), BLEU_MARINE),
+    ('FONTNAME',   (0,0), (0,-1), 'Helvetica-Bold'),
+    ('FONTNAME',   (2,0), (2,-1), 'Helvetica-Bold'),
+    ('FONTSIZE',   (0,0), (-1,-1), 9),
+    ('GRID',       (0,0), (-1,-1), 0.5, GRIS_DOUX),
+    ('PADDING',    (0,0), (-1,-1), 6),
+    ('ROWBACKGROUNDS', (0,0), (-1,-1), [colors.white, colors.white]),
+])
+
+
+def _echapper(texte):
+    return texte.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def markdown_to_rl(texte):
+    """Convertit le markdown en texte sécurisé pour ReportLab (sans XML mal formé)."""
+    # Remplacer les caractères XML spéciaux en premier
+    texte = _echapper(texte)
+    # Gérer le gras : toutes les paires ** → <b>...</b>
+    texte = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', texte)
+    # Supprimer les * restants isolés
+    texte = texte.replace('*', '')
+    return texte
+
+
+def create_docx(text_content, prenom, age_str, radar=None):
+    doc = Document()
+    doc.add_heading(f'Compte Rendu WISC-V : {prenom}', 0)
+    doc.add_paragraph(f"Âge au bilan : {age_str}")
+    p = doc.add_paragraph()
+    runner = p.add_run("AVERTISSEMENT : Document de travail. Analyse sous responsabilité du psychologue.")
+    runner.bold = True; runner.italic = True
+    if radar:
+        doc.add_picture(io.BytesIO(radar), width=Cm(8))
+    doc.add_paragraph(text_content)
+    bio = io.BytesIO()
+    doc.save(bio)
+    return bio
+
+
+def create_pdf(text_content, prenom, sexe, age_str, date_bilan_str, radar=None):
+    """Génère un PDF clinique professionnel avec mise en page soignée.
+
+    `radar` : image PNG (octets) du profil des indices, insérée avant l'analyse.
+    """
+    buf = io.BytesIO()
+
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=A4,
+        rightMargin=2*cm, leftMargin=2*cm,
+        topMargin=2.5*cm, bottomMargin=2.5*cm,
+        title=f"Bilan WISC-V - {prenom}",
+        author="Assistant WISC-V"
+    )
+
+    story = []
+
+    # --- En-tête ---
+    story.append(Paragraph("Assistant WISC-V", s_titre))
+    story.append(Paragraph("COMPTE RENDU PSYCHOMÉTRIQUE", s_sous_titre))
+    story.append(HRFlowable(width="100%", thickness=2, color=OR_MEDICAL, spaceAfter=12))
+
+    # --- Tableau identité ---
+    data_id = [
+        ["Prénom", prenom,          "Sexe",       sexe],
+        ["Âge au bilan", age_str,   "Date bilan", date_bilan_str],
+    ]
+    t = Table(data_id, colWidths=[3.5*cm, 6*cm, 3.5*cm, 6*cm])
+    t.setStyle(STYLE_IDENTITE)
+    story.append(t)
+    story.append(Spacer(1, 14))
+
+    # --- Avertissement ---
+    story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX))
+    story.append(Spacer(1, 6))
+    story.append(Paragraph(
+        "AVERTISSEMENT : Document de travail confidentiel — L'analyse clinique et les conclusions restent "
+        "sous la responsabilite exclusive du psychologue.",
+        s_avert))
+    story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX))
+    story.append(Spacer(1, 14))
+
+    # --- Profil des indices ---
+    if radar:
+        story.append(Image(io.BytesIO(radar), width=8*cm, height=8*cm, kind='proportional'))
+        story.append(Spacer(1, 10))
+
+    # --- Contenu de l'analyse ---
+    lignes = text_content.split('\n')
+    for ligne in lignes:
+        ligne = ligne.strip()
+        if not ligne:
+            story.append(Spacer(1, 4))
+        elif ligne.startswith('## ') or ligne.startswith('# '):
+            titre_propre = ligne.lstrip('#').strip()
+            # Nettoyer les balises éventuelles dans les titres
+            titre_propre = re.sub(r'\*+', '', titre_propre)
+            titre_propre = _echapper(titre_propre)
+            story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX, spaceBefore=8))
+            story.append(Paragraph(titre_propre.upper(), s_section))
+        elif ligne.startswith('### '):
+            titre_propre = ligne.lstrip('#').strip()
+            story.append(Paragraph(f"<b>{markdown_to_rl(titre_propre)}</b>", s_corps))
+        elif ligne.startswith('- ') or ligne.startswith('* '):
+            story.append(Paragraph(f"• {markdown_to_rl(ligne[2:])}", s_corps))
+        else:
+            story.append(Paragraph(markdown_to_rl(ligne), s_corps))
+
+    # --- Pied de page ---
+    story.append(Spacer(1, 20))
+    story.append(HRFlowable(width="100%", thickness=1, color=OR_MEDICAL))
+    story.append(Spacer(1, 6))
+    story.append(Paragraph(
+        f"Document généré le {date.today().strftime('%d/%m/%Y')} · Assistant WISC-V · "
+        "Confidentiel — Secret professionnel",
+        s_pied))
+
+    doc.build(story)
+    buf.seek(0)
+    return buf
+
+
+# ==========================================
+# CACHE DES FICHIERS RENDUS
+# ==========================================
+def cle_export(fmt, texte, champs):
+    """Empreinte d'un export : format + texte de l'analyse + champs imprimés."""
+    contenu = json.dumps([VERSION_EXPORTS, fmt, texte, champs], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+def rendre(fmt, texte, champs):
+    """Octets d'un export.
+
+    `champs` : prenom, sexe, age_court, age_long, date_bilan et, en option,
+    indices = [[libellé, valeur], ...] pour le radar (image mémorisée).
+    """
+    radar = radar_png(tuple(map(tuple, champs["indices"]))) if champs.get("indices") else None
+    if fmt == "docx":
+        return create_docx(texte, champs["prenom"], champs["age_court"], radar).getvalue()
+    if fmt == "pdf":
+        return create_pdf(texte, champs["prenom"], champs["sexe"], champs["age_long"],
+                          champs["date_bilan"], radar).getvalue()
+    raise ValueError(f"Format d'export inconnu : {fmt}")
+
+
+class CacheExports:
+    """Fichiers déjà rendus, en mémoire seulement (LRU).
+
+    Rien n'est écrit sur disque : un export contient l'identité de l'enfant et
+    le compte rendu entier ; les dossiers enregistrés gardent les leurs chiffrés
+    (dossiers.py).
+    """
+
+    def __init__(self, lru_max=LRU_EXPORTS):
+        self.lru_max = lru_max
+        self._lru = OrderedDict()      # clé -> octets
+        self._verrou = threading.RLock()
+        # Rendus en clair laissés par les versions qui gardaient une copie disque
+        shutil.rmtree(os.path.join(DOSSIER_CACHE, "exports"), ignore_errors=True)
+
+    def obtenir(self, fmt, texte, champs):
+        """Rendu à la demande : seul le format demandé est produit, une seule fois."""
+        cle = cle_export(fmt, texte, champs)
+        with self._verrou:
+            if cle in self._lru:
+                self._lru.move_to_end(cle)
+                return self._lru[cle]
+        contenu = rendre(fmt, texte, champs)
+        with self._verrou:
+            self._lru[cle] = contenu
+            while len(self._lru) > self.lru_max:
+                self._lru.popitem(last=False)
+        return contenu
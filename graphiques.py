@@ -0,0 +1,94 @@
+# ==========================================
+# GRAPHIQUE RADAR DES INDICES
+# ==========================================
+# Le radar n'est redessiné que si les valeurs des indices changent : l'image
+# PNG est mémorisée par tuple de valeurs (LRU borné) et réutilisée telle
+# quelle par la page et par les exports PDF / DOCX.
+# Même principe pour les radars superposés d'un retest (voir evolution.py).
+#
+# On passe par matplotlib.figure.Figure plutôt que par pyplot : la figure
+# n'entre pas dans le registre global de pyplot et elle est libérée dès que
+# l'image est produite.
+
+import io
+from functools import lru_cache
+
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap, to_hex
+from matplotlib.figure import Figure
+
+RADAR_LRU_MAX = 32
+RADAR_DPI = 120
+# Bilans antérieurs, du plus ancien au plus récent (le bilan en cours reste en bleu foncé)
+COULEURS_ANCIENS = ['#B8C4CE', '#8FA3B5', '#6C8BA6', '#4F7BA3']
+
+
+def couleurs_anciens(n):
+    """Une couleur par bilan antérieur, du plus ancien (clair) au plus récent :
+    les dernières de COULEURS_ANCIENS, interpolées au-delà de leur nombre."""
+    if n <= len(COULEURS_ANCIENS):
+        return COULEURS_ANCIENS[len(COULEURS_ANCIENS) - n:]
+    degrade = LinearSegmentedColormap.from_list("anciens", COULEURS_ANCIENS)
+    return [to_hex(degrade(i / (n - 1))) for i in range(n)]
+
+
+def valeurs_radar(indices_dict):
+    """Clé de mémorisation : ((libellé, valeur), ...) dans l'ordre d'affichage."""
+    return tuple((k, int(v)) for k, v in indices_dict.items())
+
+
+def _radar(labels, series):
+    """PNG d'un radar ; series = [(valeurs, couleur, opacité du remplissage, légende)]."""
+    angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False).tolist()
+    angles += angles[:1]
+    fig = Figure(figsize=(4, 4))
+    ax = fig.add_subplot(polar=True)
+    fig.patch.set_facecolor('#F0EDE8')
+    ax.set_facecolor('#F0EDE8')
+    for values, couleur, remplissage, legende in series:
+        values = list(values) + list(values[:1])
+        if remplissage:
+            ax.fill(angles, values, color='#2D6A9F', alpha=remplissage)
+        ax.plot(angles, values, color=couleur, linewidth=2.5, label=legende)
+    ax.plot(np.linspace(0, 2*np.pi, 100), [100]*100, color='#C9A84C',
+            linestyle='--', linewidth=1.5, label='Norme (100)')
+    ax.set_yticklabels([])
+    ax.set_xticks(angles[:-1])
+    ax.set_xticklabels(labels, fontsize=10, color='#1B3A5C', fontweight='600')
+    ax.set_ylim(40, 160)
+    ax.grid(color='#E8E4DF', linewidth=0.8)
+    ax.spines['polar'].set_color('#E8E4DF')
+    ax.legend(loc='upper right', bbox_to_anchor=(1.35, 1.15), fontsize='small')
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=RADAR_DPI, bbox_inches='tight', facecolor=fig.get_facecolor())
+    fig.clear()
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=RADAR_LRU_MAX)
+def radar_png(valeurs):
+    """Image PNG (octets) du radar pour `valeurs` = ((libellé, valeur), ...).
+
+    None si toutes les valeurs sont nulles.
+    """
+    values = [v for _, v in valeurs]
+    if sum(values) == 0: return None
+    return _radar([k for k, _ in valeurs], [(values, '#1B3A5C', 0.2, 'Enfant')])
+
+
+@lru_cache(maxsize=RADAR_LRU_MAX)
+def radar_evolution_png(bilans):
+    """Radars superposés de plusieurs bilans, du plus ancien au plus récent.
+
+    `bilans` = ((légende, ((libellé, valeur), ...)), ...) ; seuls les indices
+    renseignés dans tous les bilans sont tracés. None s'il en reste moins de 3.
+    """
+    communs = [k for k, v in bilans[-1][1]
+               if v and all(dict(b).get(k) for _, b in bilans[:-1])]
+    if len(communs) < 3: return None
+    anciens = couleurs_anciens(len(bilans) - 1)
+    series = [([dict(b)[k] for k in communs], couleur, 0, legende)
+              for (legende, b), couleur in zip(bilans[:-1], anciens)]
+    legende, b = bilans[-1]
+    series.append(([dict(b)[k] for k in communs], '#1B3A5C', 0.2, legende))
+    return _radar(communs, series)
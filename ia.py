@@ -0,0 +1,441 @@
+# ==========================================
+# APPELS AU MODÈLE (GEMINI)
+# ==========================================
+# Cache des réponses du modèle, indexé par l'empreinte de
+# (nom du modèle + prompt complet + paramètres de génération).
+# Stocké dans une base SQLite locale partagée par toutes les sessions, avec
+# durée de vie (TTL) et éviction des entrées les moins récemment lues quand
+# la taille totale dépasse le plafond.
+#
+# Utilisable hors Streamlit (import par lot, scripts) : la clé API doit alors
+# avoir été passée à genai.configure(). Avec WISC_IA_BACKEND=stub, un backend
+# local déterministe remplace Gemini (fonctionnement hors ligne, tests).
+#
+# Chaque appel (extraction, compte rendu, résumé...) est consigné dans un
+# journal SQLite local : tokens estimés par section du prompt, tokens
+# facturés, latence, modèle, réponse lue en cache ou non.
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import google.generativeai as genai
+
+from bibliotheque import DOSSIER_CACHE
+from recherche import estimer_tokens
+
+MODELE_DEFAUT = 'gemini-2.5-flash'
+TTL_CACHE = 7 * 24 * 3600            # secondes
+TAILLE_MAX_CACHE = 50 * 1024 * 1024  # octets de réponses stockées
+MAX_CONCURRENCE = int(os.environ.get("WISC_IA_CONCURRENCE", "4"))   # appels simultanés, toutes sessions
+TIMEOUT_APPEL = 120                  # secondes par appel
+TENTATIVES_MAX = 4
+ATTENTE_BASE = 1.0                   # secondes (doublée à chaque nouvelle tentative)
+RETENTION_JOURNAL = 30 * 24 * 3600   # secondes d'historique dans le journal des appels
+
+
+def cle_prompt(modele, prompt, params=None):
+    contenu = json.dumps([modele, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+class CacheReponses:
+    """Cache disque (SQLite) des réponses du modèle, avec compteurs hit/miss."""
+
+    def __init__(self, chemin=None, ttl=TTL_CACHE, taille_max=TAILLE_MAX_CACHE):
+        if chemin is None:
+            os.makedirs(DOSSIER_CACHE, exist_ok=True)
+            chemin = os.path.join(DOSSIER_CACHE, "reponses.sqlite")
+        self.chemin = chemin
+        self.ttl = ttl
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self._verrou = threading.Lock()
+        with self._connexion() as cx:
+            cx.execute("""CREATE TABLE IF NOT EXISTS reponses (
+                cle TEXT PRIMARY KEY, modele TEXT, reponse TEXT,
+                taille INTEGER, cree REAL, acces REAL)""")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_reponses_acces ON reponses(acces)")
+
+    @contextmanager
+    def _connexion(self):
+        cx = sqlite3.connect(self.chemin, timeout=10)
+        try:
+            with cx:   # commit / rollback
+                yield cx
+        finally:
+            cx.close()
+
+    def lire(self, cle):
+        """Réponse en cache (None si absente ou expirée)."""
+        maintenant = time.time()
+        with self._connexion() as cx:
+            ligne = cx.execute("SELECT reponse, cree FROM reponses WHERE cle = ?", (cle,)).fetchone()
+            if ligne and maintenant - ligne[1] <= self.ttl:
+                cx.execute("UPDATE reponses SET acces = ? WHERE cle = ?", (maintenant, cle))
+            else:
+                ligne = None
+        with self._verrou:
+            if ligne:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return ligne[0] if ligne else None
+
+    def ecrire(self, cle, modele, reponse):
+        maintenant = time.time()
+        taille = len(reponse.encode("utf-8"))
+        with self._connexion() as cx:
+            cx.execute("INSERT OR REPLACE INTO reponses VALUES (?, ?, ?, ?, ?, ?)",
+                       (cle, modele, reponse, taille, maintenant, maintenant))
+            cx.execute("DELETE FROM reponses WHERE cree < ?", (maintenant - self.ttl,))
+            total = cx.execute("SELECT COALESCE(SUM(taille), 0) FROM reponses").fetchone()[0]
+            if total > self.taille_max:
+                # Éviction LRU : on retire les moins récemment lues jusqu'à repasser sous le plafond
+                for cle_old, taille_old in cx.execute(
+                        "SELECT cle, taille FROM reponses ORDER BY acces").fetchall():
+                    if total <= self.taille_max:
+                        break
+                    cx.execute("DELETE FROM reponses WHERE cle = ?", (cle_old,))
+                    total -= taille_old
+
+    def vider(self):
+        with self._connexion() as cx:
+            cx.execute("DELETE FROM reponses")
+
+    def stats(self):
+        with self._connexion() as cx:
+            n, taille = cx.execute("SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM reponses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entrees": n, "taille": taille}
+
+
+class JournalAppels:
+    """Journal local (SQLite) des appels au modèle, pour le tableau de bord admin."""
+
+    def __init__(self, chemin=None, retention=RETENTION_JOURNAL):
+        if chemin is None:
+            os.makedirs(DOSSIER_CACHE, exist_ok=True)
+            chemin = os.path.join(DOSSIER_CACHE, "journal_ia.sqlite")
+        self.chemin = chemin
+        self.retention = retention
+        with self._connexion() as cx:
+            cx.execute("""CREATE TABLE IF NOT EXISTS appels (
+                ts REAL, nature TEXT, modele TEXT, backend TEXT, source TEXT, sections TEXT,
+                tokens_estimes INTEGER, tokens_entree INTEGER, tokens_sortie INTEGER,
+                latence REAL, erreur INTEGER)""")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_appels_ts ON appels(ts)")
+
+    @contextmanager
+    def _connexion(self):
+        cx = sqlite3.connect(self.chemin, timeout=10)
+        try:
+            with cx:   # commit / rollback
+                yield cx
+        finally:
+            cx.close()
+
+    def noter(self, nature, modele, backend, source, sections, tokens_entree=0, tokens_sortie=0,
+              latence=0.0, erreur=False):
+        maintenant = time.time()
+        with self._connexion() as cx:
+            cx.execute("INSERT INTO appels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (maintenant, nature, modele, backend, source, json.dumps(sections),
+                        sum(sections.values()), tokens_entree, tokens_sortie, latence, int(erreur)))
+            cx.execute("DELETE FROM appels WHERE ts < ?", (maintenant - self.retention,))
+
+    def derniers(self, limite=100):
+        """Appels les plus récents d'abord (sections décodées)."""
+        with self._connexion() as cx:
+            cx.row_factory = sqlite3.Row
+            lignes = cx.execute("SELECT * FROM appels ORDER BY ts DESC LIMIT ?", (limite,)).fetchall()
+        return [{**dict(l), "sections": json.loads(l["sections"])} for l in lignes]
+
+    def synthese(self, depuis=0):
+        """Par nature d'appel : volumes, tokens moyens par section, latences p50 / p95 (hors cache)."""
+        with self._connexion() as cx:
+            lignes = cx.execute("""SELECT nature, source, sections, tokens_entree, tokens_sortie,
+                                   latence, erreur FROM appels WHERE ts >= ?""", (depuis,)).fetchall()
+        par_nature = {}
+        for nature, source, sections, t_in, t_out, latence, erreur in lignes:
+            n = par_nature.setdefault(nature, {"appels": 0, "cache": 0, "erreurs": 0, "tokens_entree": 0,
+                                               "tokens_sortie": 0, "sections": {}, "latences": []})
+            n["appels"] += 1
+            n["cache"] += source == "cache"
+            n["erreurs"] += erreur
+            n["tokens_entree"] += t_in
+            n["tokens_sortie"] += t_out
+            for k, v in json.loads(sections).items():
+                n["sections"][k] = n["sections"].get(k, 0) + v
+            if source != "cache" and not erreur:
+                n["latences"].append(latence)
+        for n in par_nature.values():
+            n["sections"] = {k: v // n["appels"] for k, v in n["sections"].items()}
+            lat = sorted(n.pop("latences"))
+            n["latence_p50"] = lat[len(lat) // 2] if lat else None
+            n["latence_p95"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None
+        return par_nature
+
+    def vider(self):
+        with self._connexion() as cx:
+            cx.execute("DELETE FROM appels")
+
+
+# ==========================================
+# CLIENT PARTAGÉ
+# ==========================================
+# Un seul client par processus (toutes sessions confondues) : modèle
+# construit une fois, plafond de concurrence global, délai maximal par
+# appel, nouvelles tentatives avec attente exponentielle sur les erreurs
+# transitoires (quota, surcharge) et métriques de latence / tokens / erreurs.
+
+class BackendGemini:
+    """Appels réels à l'API Gemini."""
+    nom = "gemini"
+
+    def __init__(self, modele=MODELE_DEFAUT):
+        self.modele = modele
+        self._model = genai.GenerativeModel(modele)
+
+    @staticmethod
+    def _usage(reponse):
+        u = getattr(reponse, "usage_metadata", None)
+        return (getattr(u, "prompt_token_count", 0) or 0, getattr(u, "candidates_token_count", 0) or 0)
+
+    def generer(self, prompt, timeout):
+        """Retourne (texte, tokens entrée, tokens sortie)."""
+        reponse = self._model.generate_content(prompt, request_options={"timeout": timeout})
+        return (reponse.text, *self._usage(reponse))
+
+    def diffuser(self, prompt, timeout, usage):
+        """Itère sur les morceaux de texte ; `usage` reçoit les tokens en fin de flux."""
+        reponse = self._model.generate_content(prompt, stream=True, request_options={"timeout": timeout})
+        for chunk in reponse:
+            try:
+                t = chunk.text
+            except ValueError:   # morceau sans texte (ex. métadonnées de fin)
+                continue
+            if t:
+                yield t
+        usage.extend(self._usage(reponse))
+
+
+class BackendStub:
+    """Backend local déterministe, sans réseau (démonstration, tests, benchmarks).
+
+    Le nom de modèle est préfixé par « stub: » : les réponses simulées ne
+    partagent jamais une clé du cache avec celles de Gemini.
+    """
+    nom = "stub"
+
+    def __init__(self, modele=MODELE_DEFAUT, latence=0.0):
+        self.modele = f"stub:{modele}"
+        self.latence = latence
+
+    def _reponse(self, prompt):
+        if "Renvoie UNIQUEMENT un JSON valide" in prompt:
+            return "{}"
+        empreinte = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return (
+            "## 1. VALIDITÉ DES INDICES GLOBAUX\n"
+            "Texte de démonstration généré hors ligne (backend local).\n\n"
+            "## 2. ANALYSE INTER-INDIVIDUELLE\n"
+            "- Les indices sont décrits par rapport à la norme.\n\n"
+            "## 3. ANALYSE INTRA-INDIVIDUELLE\n"
+            "- Les **forces** et **faiblesses** relatives sont discutées.\n\n"
+            "## 4. SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS\n"
+            f"Réponse simulée (prompt {empreinte}, {len(prompt)} caractères).\n"
+        )
+
+    def generer(self, prompt, timeout):
+        time.sleep(self.latence)
+        texte = self._reponse(prompt)
+        return texte, len(prompt) // 4, len(texte) // 4
+
+    def diffuser(self, prompt, timeout, usage):
+        texte = self._reponse(prompt)
+        for i in range(0, len(texte), 40):
+            time.sleep(self.latence / 10)
+            yield texte[i:i + 40]
+        usage.extend([len(prompt) // 4, len(texte) // 4])
+
+
+def _erreur_transitoire(e):
+    """Quota dépassé, service surchargé, délai dépassé : on peut réessayer."""
+    from google.api_core import exceptions as gexc
+    return isinstance(e, (gexc.ResourceExhausted, gexc.ServiceUnavailable,
+                          gexc.DeadlineExceeded, gexc.InternalServerError, TimeoutError))
+
+
+class ClientIA:
+    """Client modèle partagé : cache, concurrence bornée, délais, tentatives, métriques."""
+
+    def __init__(self, backend, cache=None, max_concurrence=MAX_CONCURRENCE,
+                 timeout=TIMEOUT_APPEL, tentatives=TENTATIVES_MAX, journal=None):
+        self.backend = backend
+        self.cache = cache if cache is not None else CacheReponses()
+        self.journal = journal if journal is not None else JournalAppels()
+        self.timeout = timeout
+        self.tentatives = tentatives
+        self._places = threading.BoundedSemaphore(max_concurrence)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrence, thread_name_prefix="ia")
+        self._verrou = threading.Lock()
+        self._latences = deque(maxlen=500)
+        self._compteurs = {"appels": 0, "erreurs": 0, "nouvelles_tentatives": 0,
+                           "tokens_entree": 0, "tokens_sortie": 0}
+
+    @property
+    def modele(self):
+        return self.backend.modele
+
+    # --- Métriques ---
+    def _noter(self, duree=None, tokens=(0, 0), erreur=False, tentative=False):
+        with self._verrou:
+            if tentative:
+                self._compteurs["nouvelles_tentatives"] += 1
+                return
+            self._compteurs["appels"] += 1
+            self._compteurs["erreurs"] += int(erreur)
+            self._compteurs["tokens_entree"] += tokens[0]
+            self._compteurs["tokens_sortie"] += tokens[1]
+            if duree is not None:
+                self._latences.append(duree)
+
+    def metriques(self):
+        with self._verrou:
+            m = dict(self._compteurs)
+            lat = sorted(self._latences)
+        if lat:
+            m["latence_p50"] = lat[len(lat) // 2]
+            m["latence_p95"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        m["backend"] = self.backend.nom
+        m["cache"] = self.cache.stats()
+        return m
+
+    def _journaliser(self, nature, prompt, sections, t0, source, tokens=(0, 0), erreur=False):
+        try:
+            self.journal.noter(nature, self.modele, self.backend.nom, source,
+                               sections or {"prompt": estimer_tokens(prompt)},
+                               *(tuple(tokens) or (0, 0)), time.perf_counter() - t0, erreur)
+        except sqlite3.Error:
+            pass   # le journal ne doit jamais faire échouer un appel
+
+    # --- Tentatives ---
+    def _attendre(self, essai):
+        self._noter(tentative=True)
+        time.sleep(ATTENTE_BASE * (2 ** essai) + random.uniform(0, ATTENTE_BASE))
+
+    # --- Appels ---
+    def generer(self, prompt, forcer=False, nature="autre", sections=None):
+        """Texte complet (relu dans le cache sauf si `forcer`).
+
+        `nature` et `sections` ({section: tokens estimés}) ne servent qu'au journal.
+        """
+        t0 = time.perf_counter()
+        cle = cle_prompt(self.modele, prompt)
+        if not forcer:
+            texte = self.cache.lire(cle)
+            if texte is not None:
+                self._journaliser(nature, prompt, sections, t0, "cache")
+                return texte
+        for essai in range(self.tentatives):
+            debut = time.perf_counter()
+            try:
+                with self._places:   # place rendue avant l'attente entre deux tentatives
+                    texte, t_in, t_out = self.backend.generer(prompt, self.timeout)
+                break
+            except Exception as e:
+                if essai + 1 < self.tentatives and _erreur_transitoire(e):
+                    self._attendre(essai)
+                    continue
+                self._noter(time.perf_counter() - debut, erreur=True)
+                self._journaliser(nature, prompt, sections, t0, "modele", erreur=True)
+                raise
+        self._noter(time.perf_counter() - debut, (t_in, t_out))
+        self._journaliser(nature, prompt, sections, t0, "modele", (t_in, t_out))
+        self.cache.ecrire(cle, self.modele, texte)
+        return texte
+
+    def diffuser(self, prompt, forcer=False, nature="autre", sections=None):
+        """Itère sur les morceaux de texte. Une réponse en cache arrive en un seul morceau.
+
+        On ne réessaie que si l'erreur survient avant le premier morceau.
+        """
+        t0 = time.perf_counter()
+        cle = cle_prompt(self.modele, prompt)
+        if not forcer:
+            texte = self.cache.lire(cle)
+            if texte is not None:
+                self._journaliser(nature, prompt, sections, t0, "cache")
+                yield texte
+                return
+        for essai in range(self.tentatives):
+            debut = time.perf_counter()
+            usage, morceaux = [], []
+            try:
+                with self._places:   # place rendue avant l'attente entre deux tentatives
+                    for t in self.backend.diffuser(prompt, self.timeout, usage):
+                        morceaux.append(t)
+                        yield t
+                break
+            except Exception as e:
+                if not morceaux and essai + 1 < self.tentatives and _erreur_transitoire(e):
+                    self._attendre(essai)
+                    continue
+                self._noter(time.perf_counter() - debut, erreur=True)
+                self._journaliser(nature, prompt, sections, t0, "modele", erreur=True)
+                raise
+        self._noter(time.perf_counter() - debut, tuple(usage) or (0, 0))
+        self._journaliser(nature, prompt, sections, t0, "modele", usage)
+        texte = "".join(morceaux)
+        if texte:
+            self.cache.ecrire(cle, self.modele, texte)
+
+    def soumettre(self, prompt, forcer=False, **journal):
+        """Appel en arrière-plan : retourne un Future."""
+        return self._pool.submit(self.generer, prompt, forcer, **journal)
+
+    async def agenerer(self, prompt, forcer=False, **journal):
+        """Version asyncio de generer()."""
+        return await asyncio.wrap_future(self.soumettre(prompt, forcer, **journal))
+
+
+def backend_configure():
+    """« stub » si WISC_IA_BACKEND=stub, sinon « gemini »."""
+    return os.environ.get("WISC_IA_BACKEND", "gemini").lower()
+
+
+def configurer(api_key):
+    """Passe la clé API à Gemini (inutile avec le backend local)."""
+    if backend_configure() != "stub":
+        genai.configure(api_key=api_key)
+
+
+_client = None
+_verrou_client = threading.Lock()
+
+
+def get_client():
+    """Client unique du processus (créé au premier appel)."""
+    global _client
+    with _verrou_client:
+        if _client is None:
+            if backend_configure() == "stub":
+                backend = BackendStub(latence=float(os.environ.get("WISC_STUB_LATENCE", "0")))
+            else:
+                backend = BackendGemini()
+            _client = ClientIA(backend)
+        return _client
+
+
+def generer(prompt, forcer=False):
+    """Raccourci : texte complet via le client partagé."""
+    return get_client().generer(prompt, forcer)
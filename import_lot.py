@@ -0,0 +1,163 @@
+# ==========================================
+# IMPORT PAR LOT DES RAPPORTS Q-GLOBAL
+# ==========================================
+# Traite un dossier (ou une liste) de rapports Q-GLOBAL avec un pool de
+# travailleurs borné et produit un enregistrement normalisé par rapport
+# (scores + dates), exportable en CSV ou SQLite.
+#
+# Utilisation en ligne de commande :
+#   python import_lot.py dossier_rapports/ resultats.csv [--workers 4] [--ia]
+#                        [--normes normes/]
+# Les notes composites absentes sont calculées avec les tables de normes du
+# dossier normes/ quand il existe (voir normes.py).
+# --ia complète les champs non résolus avec le modèle (GOOGLE_API_KEY requis,
+# ou WISC_IA_BACKEND=stub pour travailler hors ligne).
+
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from bibliotheque import read_file
+from normes import TablesNormes, DOSSIER_NORMES
+import qglobal
+
+WORKERS_DEFAUT = 4
+COLONNES = ['fichier', 'date_naissance', 'date_passation'] + qglobal.CHAMPS_SCORES
+COLONNES_RAPPORT = ['fichier', 'statut', 'duree', 'erreur', 'manquants', 'champs_ia']
+
+
+def _date_iso(valeur):
+    """JJ/MM/AAAA -> AAAA-MM-JJ (None si absente ou invalide)."""
+    try:
+        j, m, a = (int(x) for x in str(valeur).split('/'))
+        return f"{a:04d}-{m:02d}-{j:02d}"
+    except (TypeError, ValueError):
+        return None
+
+
+def normaliser(nom, donnees):
+    """Enregistrement à plat : une valeur par colonne, None si absente ou nulle."""
+    rec = {'fichier': nom,
+           'date_naissance': _date_iso(donnees.get('date_naissance')),
+           'date_passation': _date_iso(donnees.get('date_passation'))}
+    for k in qglobal.CHAMPS_SCORES:
+        try:
+            v = float(donnees.get(k) or 0)
+        except (TypeError, ValueError):
+            v = 0
+        rec[k] = None if v == 0 else (v if k.startswith('perc') else int(v))
+    return rec
+
+
+def traiter_fichier(nom, contenu, appel_llm=None, normes=None):
+    """Lit et extrait un rapport. Retourne (enregistrement ou None, ligne de rapport)."""
+    debut = time.perf_counter()
+    try:
+        texte = read_file(io.BytesIO(contenu), nom)
+        if not texte.strip():
+            raise ValueError("aucun texte lisible")
+        donnees, sources = qglobal.extraire(texte, appel_llm=appel_llm, normes=normes)
+        rec = normaliser(nom, donnees)
+        manquants = [k for k in COLONNES[1:] if rec[k] is None]
+        rapport = {'statut': 'ok', 'erreur': '', 'manquants': manquants,
+                   'champs_ia': [k for k, v in sources.items() if v == "IA"]}
+    except Exception as e:
+        rec = None
+        rapport = {'statut': 'echec', 'erreur': str(e), 'manquants': [], 'champs_ia': []}
+    rapport.update(fichier=nom, duree=round(time.perf_counter() - debut, 3))
+    return rec, rapport
+
+
+def importer_lot(fichiers, appel_llm=None, workers=WORKERS_DEFAUT, normes=None):
+    """fichiers : liste de (nom, octets). Retourne (enregistrements, rapport)."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultats = list(pool.map(lambda f: traiter_fichier(f[0], f[1], appel_llm, normes), fichiers))
+    enregistrements = [rec for rec, _ in resultats if rec is not None]
+    return enregistrements, [r for _, r in resultats]
+
+
+def lister_rapports(dossier):
+    return [
+        os.path.join(dossier, f) for f in sorted(os.listdir(dossier))
+        if f.lower().endswith(('.pdf', '.txt'))
+    ]
+
+
+# --- Sorties ---
+def en_csv(enregistrements):
+    out = io.StringIO()
+    w = csv.DictWriter(out, fieldnames=COLONNES)
+    w.writeheader()
+    w.writerows(enregistrements)
+    return out.getvalue()
+
+
+def ecrire_sqlite(enregistrements, chemin, table="protocoles"):
+    cx = sqlite3.connect(chemin)
+    try:
+        with cx:
+            cx.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(COLONNES)})")
+            cx.executemany(
+                f"INSERT INTO {table} VALUES ({', '.join('?' * len(COLONNES))})",
+                [[rec[c] for c in COLONNES] for rec in enregistrements],
+            )
+    finally:
+        cx.close()
+
+
+def ecrire(enregistrements, chemin):
+    """Format choisi selon l'extension : .csv, .sqlite / .db."""
+    if chemin.lower().endswith(('.sqlite', '.db')):
+        ecrire_sqlite(enregistrements, chemin)
+    elif chemin.lower().endswith('.csv'):
+        with open(chemin, 'w', encoding='utf-8', newline='') as fh:
+            fh.write(en_csv(enregistrements))
+    else:
+        raise ValueError(f"Format de sortie non géré : {chemin} (.csv, .sqlite, .db)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import par lot de rapports Q-GLOBAL WISC-V.")
+    parser.add_argument("dossier", help="Dossier contenant les rapports PDF/TXT")
+    parser.add_argument("sortie", help="Fichier de sortie (.csv, .sqlite ou .db)")
+    parser.add_argument("--workers", type=int, default=WORKERS_DEFAUT)
+    parser.add_argument("--ia", action="store_true",
+                        help="Compléter les champs non résolus avec le modèle (GOOGLE_API_KEY)")
+    parser.add_argument("--normes", default=DOSSIER_NORMES,
+                        help="Dossier des tables de normes (CSV) pour les notes composites")
+    args = parser.parse_args(argv)
+    normes = TablesNormes.depuis_dossier(args.normes)
+
+    appel_llm = None
+    if args.ia:
+        import ia
+        ia.configurer(os.environ.get("GOOGLE_API_KEY"))
+        appel_llm = partial(ia.get_client().generer, nature="extraction")
+
+    fichiers = []
+    for chemin in lister_rapports(args.dossier):
+        with open(chemin, 'rb') as fh:
+            fichiers.append((os.path.basename(chemin), fh.read()))
+
+    debut = time.perf_counter()
+    enregistrements, rapport = importer_lot(fichiers, appel_llm=appel_llm, workers=args.workers,
+                                          normes=normes)
+    ecrire(enregistrements, args.sortie)
+
+    for r in rapport:
+        detail = r['erreur'] if r['statut'] == 'echec' else f"{len(r['manquants'])} champ(s) manquant(s)"
+        print(f"{r['statut']:5} {r['duree']:7.3f} s  {r['fichier']} — {detail}", file=sys.stderr)
+    echecs = sum(1 for r in rapport if r['statut'] == 'echec')
+    print(f"{len(enregistrements)} enregistrement(s) écrit(s) dans {args.sortie}, "
+          f"{echecs} échec(s), {time.perf_counter() - debut:.2f} s au total.", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
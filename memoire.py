@@ -0,0 +1,92 @@
+# ==========================================
+# MÉMOIRE PAR SESSION
+# ==========================================
+# Ce qui est identique pour toutes les sessions (texte des ouvrages,
+# passages découpés, index BM25, tables de normes, exports rendus) est
+# chargé une fois par processus et partagé en lecture seule ; l'état de
+# session ne garde que des références (identifiants de tâche, de dossier)
+# et de petits enregistrements.
+#
+# Chaque session note après chaque rendu la taille de son état dans un
+# registre du processus, consulté par l'administrateur. Le plafond par
+# session est une alerte : rien n'est effacé d'office dans une saisie.
+
+import os
+import sys
+import threading
+import time
+from dataclasses import fields, is_dataclass
+
+PLAFOND_SESSION = int(os.environ.get("WISC_PLAFOND_SESSION", str(5 * 1024 * 1024)))   # octets
+INACTIVITE_SESSION = 30 * 60   # secondes sans rendu avant d'oublier une session
+
+
+def taille_profonde(objet, deja_vus=None):
+    """Octets occupés par un objet et tout ce qu'il référence (chaque objet compté une fois)."""
+    deja_vus = set() if deja_vus is None else deja_vus
+    if id(objet) in deja_vus or isinstance(objet, type):
+        return 0
+    deja_vus.add(id(objet))
+    taille = sys.getsizeof(objet, 0)
+    if isinstance(objet, (str, bytes, bytearray, int, float, bool)) or objet is None:
+        return taille
+    if isinstance(objet, dict):
+        enfants = [x for kv in objet.items() for x in kv]
+    elif isinstance(objet, (list, tuple, set, frozenset)):
+        enfants = list(objet)
+    elif is_dataclass(objet):
+        enfants = [getattr(objet, f.name) for f in fields(objet)]
+    else:
+        enfants = [getattr(objet, "__dict__", {})]
+    return taille + sum(taille_profonde(x, deja_vus) for x in enfants)
+
+
+def rss_octets(pid="self"):
+    """Mémoire résidente d'un processus (celui-ci par défaut).
+
+    Sans /proc (macOS), pic du processus courant.
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as fh:
+            for ligne in fh:
+                if ligne.startswith("VmRSS:"):
+                    return int(ligne.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pic if sys.platform == "darwin" else pic * 1024
+
+
+class RegistreSessions:
+    """Taille de l'état de chaque session active, pour le tableau de bord admin."""
+
+    def __init__(self, plafond=PLAFOND_SESSION, inactivite=INACTIVITE_SESSION):
+        self.plafond = plafond
+        self.inactivite = inactivite
+        self._verrou = threading.Lock()
+        self._sessions = {}   # id -> {"utilisateur", "vu", "tailles"}
+
+    def noter(self, id_session, utilisateur, etat):
+        """Mesure `etat` (dict clé -> valeur) ; retourne le total en octets."""
+        tailles = {cle: taille_profonde(valeur) for cle, valeur in etat.items()}
+        with self._verrou:
+            self._sessions[id_session] = {"utilisateur": utilisateur, "vu": time.time(), "tailles": tailles}
+        return sum(tailles.values())
+
+    def oublier(self, id_session):
+        with self._verrou:
+            self._sessions.pop(id_session, None)
+
+    def sessions(self):
+        """Sessions actives, les plus lourdes d'abord :
+        [{"id", "utilisateur", "vu", "total", "au_dela", "tailles"}]."""
+        limite = time.time() - self.inactivite
+        with self._verrou:
+            for id_session in [i for i, s in self._sessions.items() if s["vu"] < limite]:
+                del self._sessions[id_session]
+            copie = {i: dict(s) for i, s in self._sessions.items()}
+        lignes = [{"id": i, **s, "total": sum(s["tailles"].values())} for i, s in copie.items()]
+        for l in lignes:
+            l["au_dela"] = l["total"] > self.plafond
+        return sorted(lignes, key=lambda l: l["total"], reverse=True)
@@ -0,0 +1,785 @@
+# ==========================================
+# MOTEUR DE COMPTE RENDU (HORS STREAMLIT)
+# ==========================================
+# Toute la logique du bilan, sans interface : validité / homogénéité,
+# analyse ipsative, mise en forme des scores, prompt, appel au modèle et
+# exports. Utilisé par l'application et par la ligne de commande :
+#
+#   python moteur.py dossiers.json --sortie comptes_rendus/ [--workers 4]
+#                    [--bibliotheque .] [--formats pdf,docx] [--mode deux_temps|sections]
+#
+# dossiers.json : liste d'objets {"identite": {...}, "observations": {...},
+# "scores": {...}, "style_redac": ..., "niveau_detail": ...}. Un CSV produit
+# par import_lot.py est aussi accepté. WISC_IA_BACKEND=stub : sans réseau.
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, make_dataclass
+from datetime import date
+from typing import Optional
+
+from qglobal import CHAMPS_SCORES
+from recherche import (IndexBM25, requete_profil, selectionner_passages, formater_contexte, BUDGET_TOKENS_DEFAUT,
+                       estimer_tokens, sections_prompt, tronquer, TERMES_INDICES, TERMES_MOTIFS)
+from exports import rendre
+from graphiques import valeurs_radar
+from discordances import comparer, formater_comparaisons, TablesEcarts
+from psychometrie import (analyser_lot, matrice, INDICES_PRINCIPAUX, SOMMES,
+                          INCOMPLET, VALIDE, FRAGILE, NON_INTERPRETABLE)
+
+STYLES_REDAC = ["Expert / MDPH (Technique & Clinique)", "Parents / École (Pédagogique)"]
+NIVEAUX_DETAIL = ["Court (1 page)", "Standard (2-3 pages)", "Détaillé (3-5 pages)"]
+# Plafond dur du prompt (tokens estimés) : au-delà, la bibliothèque est rognée
+# en premier, puis l'anamnèse.
+PLAFOND_PROMPT = int(os.environ.get("WISC_PLAFOND_PROMPT", "200000"))
+
+# Correspondance niveau → consigne longueur
+niveau_consigne = {
+    "Court (1 page)":        "Sois CONCIS. Maximum 400 mots. 1 paragraphe par section. Pas de sous-parties.",
+    "Standard (2-3 pages)":  "Longueur standard. 600-900 mots. Structure complète avec sous-parties.",
+    "Détaillé (3-5 pages)":  "Sois EXHAUSTIF. 1200-1800 mots. Développe chaque point avec exemples cliniques et hypothèses détaillées.",
+}
+
+# Paires de subtests qui fondent chaque indice principal
+PAIRES_INDICES = {"ICV": ("sim", "voc"), "IVS": ("cub", "puz"), "IRF": ("mat", "bal"),
+                  "IMT": ("memc", "memi"), "IVT": ("sym", "cod")}
+SUBTESTS_LIBELLES = {
+    "Sim": "sim", "Voc": "voc", "Info": "info", "Comp": "comp",
+    "Cub": "cub", "Puz": "puz", "Mat": "mat", "Bal": "bal",
+    "Arit": "arit", "MemC": "memc", "MemI": "memi", "Seq": "seq",
+    "Cod": "cod", "Sym": "sym", "Bar": "bar"
+}
+
+
+# ==========================================
+# ENTRÉES
+# ==========================================
+@dataclass
+class Identite:
+    prenom: str = ""
+    sexe: str = "Garçon"
+    lateralite: str = "Droitier"
+    creole: str = "-- (Non/Peu)"
+    date_naissance: date = field(default_factory=lambda: date(2015, 1, 1))
+    date_bilan: date = field(default_factory=date.today)
+
+
+@dataclass
+class Observations:
+    obs: list = field(default_factory=list)        # attitude / cognition / graphisme
+    obs_libre: str = ""
+    motifs: list = field(default_factory=list)
+    anamnese: str = ""
+
+
+# Une note par champ de ALL_SCORE_KEYS (0 = non renseigné)
+Scores = make_dataclass(
+    "Scores",
+    [(k, float if k.startswith('perc') else int, 0) for k in CHAMPS_SCORES],
+)
+
+
+@dataclass
+class EntreeBilan:
+    identite: Identite
+    observations: Observations
+    scores: Scores
+    style_redac: str = STYLES_REDAC[0]
+    niveau_detail: str = NIVEAUX_DETAIL[1]
+
+
+# ==========================================
+# CALCULS
+# ==========================================
+def calculer_age(d_naiss, d_bilan):
+    try:
+        if d_bilan < d_naiss: return 0, 0
+        ans = d_bilan.year - d_naiss.year
+        mois = d_bilan.month - d_naiss.month
+        if d_bilan.day < d_naiss.day: mois -= 1
+        if mois < 0: ans -= 1; mois += 12
+        return ans, mois
+    except: return 0, 0
+
+
+@dataclass
+class Analyse:
+    homogeneite: dict          # indice -> (True/False/None, libellé)
+    nb_inv: int
+    statut_validite: str       # "non_interpretable" | "fragile" | "valide" | "incomplet"
+    h_txt: str
+    dispersion: Optional[int]
+    valid_ind: dict            # indices principaux renseignés
+    moy: float
+    et: float
+    ecarts: dict               # indice -> écart à la moyenne personnelle
+    forces: list
+    faiblesses: list
+    intra_txt: str
+    sommes: dict               # aide au calcul IAG / ICC / INV
+
+
+def analyser(scores):
+    """Validité du QIT, homogénéité des indices et analyse ipsative.
+
+    Calcul délégué à psychometrie.analyser_lot sur une matrice 1 × 24.
+    """
+    s = scores
+    r = {k: v[0] for k, v in analyser_lot(matrice([s])).items()}
+
+    homogeneite = {}
+    for j, nom in enumerate(INDICES_PRINCIPAUX):
+        h, ecart = r["homogene"][j], int(r["ecarts_paires"][j])
+        homogeneite[nom] = ((None, "") if h < 0 else
+                            (True, f"✅ {nom} Homogène") if h else
+                            (False, f"⚠️ {nom} Hétérogène (Écart {ecart})"))
+    nb_inv = int(r["nb_inv"])
+
+    statut = str(r["statut"])
+    disp = int(r["dispersion"]) if r["dispersion"] >= 0 else None
+    h_txt = {
+        NON_INTERPRETABLE: f"NON INTERPRÉTABLE (Disp. {disp})",
+        FRAGILE: f"FRAGILE ({nb_inv} ind. hétérogènes)",
+        VALIDE: "Valide et Homogène",
+        INCOMPLET: "N/A",
+    }[statut]
+
+    indices = {"ICV": s.icv, "IVS": s.ivs, "IRF": s.irf, "IMT": s.imt, "IVT": s.ivt}
+    valid_ind = {k: v for k, v in indices.items() if v > 0}
+    moy, et = float(r["moy"]), float(r["et"])
+    intra_txt = f"Moyenne Perso: {moy:.1f}, ET: {et:.1f}." if valid_ind else ""
+
+    ecarts, forces, faiblesses = {}, [], []
+    for j, k in enumerate(INDICES_PRINCIPAUX):
+        if k not in valid_ind:
+            continue
+        ecarts[k] = float(r["ecarts"][j])
+        if r["forces"][j]:
+            intra_txt += f"- {k}: Force relative.\n"
+            forces.append(k)
+        elif r["faiblesses"][j]:
+            intra_txt += f"- {k}: Faiblesse relative.\n"
+            faiblesses.append(k)
+
+    sommes = {k: (int(v) if v >= 0 else "Incomplet") for k, v in zip(SOMMES, r["sommes"])}
+    return Analyse(homogeneite, nb_inv, statut, h_txt, disp, valid_ind, moy, et,
+                   ecarts, forces, faiblesses, intra_txt, sommes)
+
+
+# ==========================================
+# PROMPT
+# ==========================================
+def formater_scores(s, h_txt):
+    """Résumé textuel des scores renseignés, tel qu'injecté dans le prompt."""
+    if s.qit > 0:
+        data = f"QIT: {s.qit} (Perc: {s.perc_qit}, IC: {s.qit_bas}-{s.qit_haut}). Validité: {h_txt}.\n"
+    else:
+        data = "QIT: Non calculé / Non administré.\n"
+
+    data += "Indices Administrés: "
+    indices_data = []
+    for k in ['icv', 'ivs', 'irf', 'imt', 'ivt']:
+        if getattr(s, k) > 0:
+            indices_data.append(f"{k.upper()} {getattr(s, k)} (Perc {getattr(s, 'perc_' + k)}, "
+                                f"IC {getattr(s, k + '_bas')}-{getattr(s, k + '_haut')})")
+    data += ", ".join(indices_data) + ".\n"
+
+    data += "Indices Complémentaires: "
+    compl_data = []
+    for k in ['iag', 'icc', 'inv']:
+        if getattr(s, k) > 0:
+            compl_data.append(f"{k.upper()} {getattr(s, k)} (IC {getattr(s, k + '_bas')}-{getattr(s, k + '_haut')})")
+    data += ", ".join(compl_data) + ".\n"
+
+    data += "Subtests (Notes Standard): "
+    valid_subs = [f"{lib} {getattr(s, k)}" for lib, k in SUBTESTS_LIBELLES.items() if getattr(s, k) > 0]
+    data += ", ".join(valid_subs) + "."
+    return data
+
+
+def construire_prompt(infos, motif_txt, obs_txt, ana, data, intra_txt, style_redac, niveau_detail, moy, valid_ind, knowledge_base):
+    consigne_longueur = niveau_consigne[niveau_detail]
+    return f"""
+            Rôle: Expert Psychologue WISC-V.
+
+            DESTINATAIRE: {style_redac}.
+
+            LONGUEUR : {consigne_longueur}
+
+            DONNÉES ENTRÉE:
+            - Enfant: {infos}
+            - Motif de consultation: {motif_txt}
+            - Obs: {obs_txt}
+            - Anamnèse: {ana}
+            - Scores: {data}
+            - Stats Intra: {intra_txt}
+
+            <BIBLIOTHEQUE_REFERENCE>
+            {knowledge_base}
+            </BIBLIOTHEQUE_REFERENCE>
+
+            CONSIGNE CRUCIALE DE HIERARCHIE :
+            1. Pour la MÉTHODOLOGIE (calculs, validité, homogénéité), tu DOIS suivre scrupuleusement le contenu de <BIBLIOTHEQUE_REFERENCE> (notamment Grégoire, Ozenne).
+            2. Pour le VOCABULAIRE DIAGNOSTIQUE en conclusion, utilise le DSM-5 / CIM-11.
+
+            OBJECTIF QUALITATIF :
+            Ne te contente pas de lister les scores. Tu dois EXPLIQUER et INTERPRÉTER.
+            - Utilise des connecteurs logiques : "ce qui suggère que...", "probablement en raison de...", "ce résultat contraste avec...".
+            - Formule des HYPOTHÈSES sur les mécanismes cognitifs sous-jacents.
+            - Analyse les ÉCARTS significatifs (*) du tableau de comparaisons, déjà calculés (ne les recalcule pas) : qu'est-ce que ça implique concrètement ?
+            - Tiens compte du motif de consultation pour orienter la conclusion et les recommandations.
+
+            STRUCTURE DU COMPTE RENDU :
+
+            1. VALIDITÉ DES INDICES GLOBAUX
+               - Vérifier homogénéité QIT. Si invalide, passer à IAG/ICC/INV.
+
+            2. ANALYSE INTER-INDIVIDUELLE (NORMATIVE) -> FOCUS INDICES UNIQUEMENT
+               - Parle des INDICES (QIT, ICV, etc.) par rapport à la norme (100).
+               - INTERDICTION de parler des subtests ici.
+               *** SYNTHÈSE NORMATIVE & FONCTIONNELLE ***
+               - Paragraphe de synthèse sur l'efficience globale et l'impact sur la vie quotidienne/scolaire.
+
+            3. ANALYSE INTRA-INDIVIDUELLE (IPSATIVE) -> FOCUS SUBTESTS
+               - Analyse les SUBTESTS par rapport à la moyenne de l'enfant ({moy if valid_ind else 'N/A'}).
+               - Lier chaque résultat à une hypothèse cognitive/clinique.
+               *** SYNTHÈSE CLINIQUE & PROCESSUELLE ***
+               - Forces et faiblesses spécifiques + lien avec les symptômes observés.
+
+            4. SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS
+               - Croiser avec l'anamnèse et le motif de consultation.
+               - Hypothèses (TDAH, TSA, etc.).
+               - Conseils pratiques adaptés au motif.
+
+            Rédige avec un ton professionnel, argumenté et clinique.
+            """
+
+
+def contexte_bibliotheque(entree, analyse, index, budget_tokens=BUDGET_TOKENS_DEFAUT):
+    """Passages de la bibliothèque pertinents pour ce profil : (contexte, passages)."""
+    indices_heterogenes = [nom for nom, (v, _) in analyse.homogeneite.items() if v is False]
+    requete = requete_profil(analyse.h_txt, indices_heterogenes, analyse.forces,
+                             analyse.faiblesses, entree.observations.motifs)
+    passages = selectionner_passages(index, requete, budget_tokens=budget_tokens)
+    return formater_contexte(passages), passages
+
+
+def preparer_prompt(entree, analyse, contexte_biblio, tables_ecarts=None, evolution=""):
+    """Prompt complet ; `evolution` : tableau de evolution.formater_evolution (retest)."""
+    return preparer_prompt_mesure(entree, analyse, contexte_biblio, tables_ecarts, evolution)[0]
+
+
+def donnees_prompt(entree, analyse, tables_ecarts=None, evolution=""):
+    """(infos, motif, observations, scores) : textes des données injectées dans les prompts."""
+    idt, o = entree.identite, entree.observations
+    ans, mois = calculer_age(idt.date_naissance, idt.date_bilan)
+    d = idt.date_bilan
+    infos = (f"{idt.prenom}, {idt.sexe}, {ans} ans. Date Bilan: {d.day}/{d.month}/{d.year}. "
+             f"Latéralité: {idt.lateralite}. Créole: {idt.creole}.")
+    motif_txt = ", ".join(o.motifs) if o.motifs else "Non précisé"
+    obs_txt = ", ".join(o.obs) + ". " + o.obs_libre
+    data = formater_scores(entree.scores, analyse.h_txt)
+    comparaisons = formater_comparaisons(comparer(entree.scores, ans * 12 + mois, tables_ecarts))
+    if comparaisons:
+        data += "\n" + comparaisons
+    if evolution:
+        data += "\n" + evolution
+    return infos, motif_txt, obs_txt, data
+
+
+def _plafonner(assembler, contexte_biblio, ana, plafond):
+    """(prompt, bibliothèque, anamnèse, tokens retirés) : prompt ramené sous `plafond`
+    tokens estimés, en rognant la bibliothèque d'abord, puis l'anamnèse."""
+    prompt = assembler(contexte_biblio, ana)
+    if not plafond or estimer_tokens(prompt) <= plafond:
+        return prompt, contexte_biblio, ana, 0
+    avant = estimer_tokens(contexte_biblio) + estimer_tokens(ana)
+    exces = estimer_tokens(prompt) - plafond
+    contexte_biblio = tronquer(contexte_biblio, estimer_tokens(contexte_biblio) - exces)
+    prompt = assembler(contexte_biblio, ana)
+    exces = estimer_tokens(prompt) - plafond
+    if exces > 0:
+        ana = tronquer(ana, estimer_tokens(ana) - exces)
+        prompt = assembler(contexte_biblio, ana)
+    return prompt, contexte_biblio, ana, avant - estimer_tokens(contexte_biblio) - estimer_tokens(ana)
+
+
+def preparer_prompt_mesure(entree, analyse, contexte_biblio, tables_ecarts=None, evolution="",
+                           plafond=PLAFOND_PROMPT):
+    """(prompt, sections, tokens retirés) : prompt ramené sous `plafond` tokens estimés
+    (bibliothèque rognée d'abord, puis anamnèse), tokens estimés par section."""
+    infos, motif_txt, obs_txt, data = donnees_prompt(entree, analyse, tables_ecarts, evolution)
+
+    def assembler(biblio, ana):
+        return construire_prompt(infos, motif_txt, obs_txt, ana, data, analyse.intra_txt,
+                                 entree.style_redac, entree.niveau_detail, analyse.moy,
+                                 analyse.valid_ind, biblio)
+
+    prompt, contexte_biblio, ana, retires = _plafonner(assembler, contexte_biblio,
+                                                       entree.observations.anamnese, plafond)
+    sections = sections_prompt(prompt, bibliotheque=contexte_biblio, scores=data + analyse.intra_txt,
+                               anamnese=infos + motif_txt + obs_txt + ana)
+    return prompt, sections, retires
+
+
+# ==========================================
+# GÉNÉRATION EN DEUX TEMPS
+# ==========================================
+# 1. Interprétation clinique structurée (JSON), avec la bibliothèque mais
+#    sans destinataire ni longueur : son prompt ne dépend que des données du
+#    bilan, la réponse est donc relue dans le cache du client IA quand seul
+#    le style ou le niveau de détail change.
+# 2. Rédaction de cette interprétation pour un destinataire et une longueur,
+#    sans la bibliothèque : prompt court, génération rapide.
+
+MODES_GENERATION = {"deux_temps": "Deux temps (interprétation réutilisée entre styles)",
+                    "direct": "Un seul passage",
+                    "sections": "Sections en parallèle"}
+CLES_INTERPRETATION = ["validite", "normative", "ipsative", "hypotheses", "recommandations"]
+
+
+def construire_prompt_interpretation(infos, motif_txt, obs_txt, ana, data, intra_txt, moy, valid_ind, knowledge_base):
+    return f"""
+            Rôle: Expert Psychologue WISC-V.
+
+            DONNÉES ENTRÉE:
+            - Enfant: {infos}
+            - Motif de consultation: {motif_txt}
+            - Obs: {obs_txt}
+            - Anamnèse: {ana}
+            - Scores: {data}
+            - Stats Intra: {intra_txt}
+
+            <BIBLIOTHEQUE_REFERENCE>
+            {knowledge_base}
+            </BIBLIOTHEQUE_REFERENCE>
+
+            CONSIGNE CRUCIALE DE HIERARCHIE :
+            1. Pour la MÉTHODOLOGIE (calculs, validité, homogénéité), tu DOIS suivre scrupuleusement le contenu de <BIBLIOTHEQUE_REFERENCE> (notamment Grégoire, Ozenne).
+            2. Pour le VOCABULAIRE DIAGNOSTIQUE, utilise le DSM-5 / CIM-11.
+
+            TÂCHE : produis l'INTERPRÉTATION CLINIQUE du bilan, sans mise en forme ni destinataire.
+            Elle sera rédigée ensuite pour différents lecteurs : sois complet, précis et argumenté.
+            - Explique et interprète, formule des HYPOTHÈSES sur les mécanismes cognitifs sous-jacents.
+            - Analyse les ÉCARTS significatifs (*) du tableau de comparaisons, déjà calculés (ne les recalcule pas).
+            - Tiens compte du motif de consultation et de l'anamnèse.
+
+            Format : un objet JSON avec exactement ces clés (valeurs en français) :
+            - "validite" : homogénéité du QIT ; si invalide, indices alternatifs (IAG / ICC / INV) ;
+            - "normative" : les INDICES par rapport à la norme (100) et l'impact fonctionnel (pas de subtests) ;
+            - "ipsative" : les SUBTESTS par rapport à la moyenne de l'enfant ({moy if valid_ind else 'N/A'}), forces et faiblesses, lien avec les observations ;
+            - "hypotheses" : liste des hypothèses diagnostiques argumentées ;
+            - "recommandations" : liste de conseils pratiques adaptés au motif.
+
+            Renvoie UNIQUEMENT un JSON valide.
+            """
+
+
+def preparer_interpretation(entree, analyse, contexte_biblio, tables_ecarts=None, evolution="",
+                            plafond=PLAFOND_PROMPT):
+    """(prompt, sections, tokens retirés) du premier temps (indépendant du style et de la longueur)."""
+    infos, motif_txt, obs_txt, data = donnees_prompt(entree, analyse, tables_ecarts, evolution)
+
+    def assembler(biblio, ana):
+        return construire_prompt_interpretation(infos, motif_txt, obs_txt, ana, data, analyse.intra_txt,
+                                                analyse.moy, analyse.valid_ind, biblio)
+
+    prompt, contexte_biblio, ana, retires = _plafonner(assembler, contexte_biblio,
+                                                       entree.observations.anamnese, plafond)
+    sections = sections_prompt(prompt, bibliotheque=contexte_biblio, scores=data + analyse.intra_txt,
+                               anamnese=infos + motif_txt + obs_txt + ana)
+    return prompt, sections, retires
+
+
+def lire_interpretation(texte):
+    """Réponse du premier temps -> dict (texte brut sous « brouillon » si le JSON est invalide)."""
+    brut = texte.strip()
+    if "```" in brut:
+        brut = brut.split("```")[1].removeprefix("json")
+    try:
+        interpretation = json.loads(brut)
+    except ValueError:
+        interpretation = None
+    return interpretation if isinstance(interpretation, dict) else {"brouillon": texte.strip()}
+
+
+def construire_prompt_redaction(infos, motif_txt, interpretation, data, style_redac, niveau_detail):
+    consigne_longueur = niveau_consigne[niveau_detail]
+    return f"""
+            Rôle: Expert Psychologue WISC-V.
+
+            DESTINATAIRE: {style_redac}.
+
+            LONGUEUR : {consigne_longueur}
+
+            DONNÉES ENTRÉE:
+            - Enfant: {infos}
+            - Motif de consultation: {motif_txt}
+            - Scores: {data}
+
+            INTERPRÉTATION CLINIQUE (déjà établie, à rédiger fidèlement) :
+            {interpretation}
+
+            CONSIGNE : rédige le compte rendu à partir de cette interprétation, adapté au
+            destinataire et à la longueur demandés. N'ajoute aucune conclusion qui n'y figure pas
+            et ne recalcule pas les scores.
+
+            STRUCTURE DU COMPTE RENDU :
+
+            1. VALIDITÉ DES INDICES GLOBAUX
+            2. ANALYSE INTER-INDIVIDUELLE (NORMATIVE) -> FOCUS INDICES UNIQUEMENT
+               *** SYNTHÈSE NORMATIVE & FONCTIONNELLE ***
+            3. ANALYSE INTRA-INDIVIDUELLE (IPSATIVE) -> FOCUS SUBTESTS
+               *** SYNTHÈSE CLINIQUE & PROCESSUELLE ***
+            4. SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS
+
+            Rédige avec un ton professionnel, argumenté et clinique.
+            """
+
+
+def preparer_redaction(entree, analyse, interpretation, tables_ecarts=None, evolution=""):
+    """(prompt, sections) du second temps : mise en forme pour le destinataire, sans bibliothèque."""
+    infos, motif_txt, _, data = donnees_prompt(entree, analyse, tables_ecarts, evolution)
+    texte = json.dumps(interpretation, ensure_ascii=False, indent=1)
+    prompt = construire_prompt_redaction(infos, motif_txt, texte, data, entree.style_redac, entree.niveau_detail)
+    return prompt, sections_prompt(prompt, interpretation=texte, scores=data, anamnese=infos + motif_txt)
+
+
+# ==========================================
+# GÉNÉRATION PAR SECTIONS EN PARALLÈLE
+# ==========================================
+# Les quatre sections du compte rendu sont demandées séparément, chacune avec
+# ses seules données et ses propres passages de bibliothèque, puis assemblées
+# dans l'ordre. Une relecture de cohérence ne renvoie que des corrections
+# ponctuelles (JSON), appliquées au texte assemblé : la durée totale reste
+# proche de celle de la section la plus longue.
+
+# clé -> (titre, consigne, données utiles, termes de recherche bibliothèque)
+SECTIONS_RAPPORT = {
+    "validite": ("1. VALIDITÉ DES INDICES GLOBAUX",
+                 "Vérifier homogénéité QIT. Si invalide, passer à IAG/ICC/INV.",
+                 ("infos", "scores"), ""),
+    "normative": ("2. ANALYSE INTER-INDIVIDUELLE (NORMATIVE)",
+                  "Parle des INDICES (QIT, ICV, etc.) par rapport à la norme (100). INTERDICTION de parler des "
+                  "subtests ici. Termine par *** SYNTHÈSE NORMATIVE & FONCTIONNELLE *** : paragraphe de synthèse "
+                  "sur l'efficience globale et l'impact sur la vie quotidienne/scolaire.",
+                  ("infos", "motif", "scores"), "norme classification efficience intellectuelle"),
+    "ipsative": ("3. ANALYSE INTRA-INDIVIDUELLE (IPSATIVE)",
+                 "Analyse les SUBTESTS par rapport à la moyenne de l'enfant. Lier chaque résultat à une hypothèse "
+                 "cognitive/clinique. Termine par *** SYNTHÈSE CLINIQUE & PROCESSUELLE *** : forces et faiblesses "
+                 "spécifiques + lien avec les symptômes observés.",
+                 ("infos", "obs", "scores", "intra"), "analyse ipsative subtests moyenne personnelle"),
+    "synthese": ("4. SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS",
+                 "Croiser avec l'anamnèse et le motif de consultation. Hypothèses (TDAH, TSA, etc.). "
+                 "Conseils pratiques adaptés au motif. Vocabulaire diagnostique DSM-5 / CIM-11.",
+                 ("infos", "motif", "obs", "anamnese", "scores", "intra"), "diagnostic recommandations aménagements"),
+}
+LIBELLES_DONNEES = {"infos": "Enfant", "motif": "Motif de consultation", "obs": "Obs",
+                    "anamnese": "Anamnèse", "scores": "Scores", "intra": "Stats Intra"}
+
+
+def requete_section(cle, entree, analyse):
+    """Requête BM25 propre à une section du compte rendu."""
+    indices_heterogenes = [nom for nom, (v, _) in analyse.homogeneite.items() if v is False]
+    if cle == "validite":
+        return requete_profil(analyse.h_txt, indices_heterogenes, [], [], [])
+    termes = [SECTIONS_RAPPORT[cle][3]]
+    if cle == "normative":
+        termes += [TERMES_INDICES.get(nom, nom) for nom in analyse.valid_ind]
+    elif cle == "ipsative":
+        termes += ["force faiblesse relative " + TERMES_INDICES.get(nom, nom)
+                   for nom in list(analyse.forces) + list(analyse.faiblesses)]
+    else:
+        termes += [TERMES_MOTIFS.get(m, m) for m in entree.observations.motifs]
+    return " ".join(termes)
+
+
+def contextes_sections(entree, analyse, index, budget_tokens=BUDGET_TOKENS_DEFAUT):
+    """{section: passages formatés} : le budget de contexte est partagé entre les sections."""
+    return {cle: formater_contexte(selectionner_passages(index, requete_section(cle, entree, analyse),
+                                                         budget_tokens=budget_tokens // len(SECTIONS_RAPPORT)))
+            for cle in SECTIONS_RAPPORT}
+
+
+def construire_prompt_section(titre, consigne, donnees, knowledge_base, style_redac, niveau_detail):
+    return f"""
+            Rôle: Expert Psychologue WISC-V.
+
+            DESTINATAIRE: {style_redac}.
+
+            LONGUEUR : cette section représente environ un quart du compte rendu. Compte rendu complet : {niveau_consigne[niveau_detail]}
+
+            DONNÉES ENTRÉE:
+            {donnees}
+
+            <BIBLIOTHEQUE_REFERENCE>
+            {knowledge_base}
+            </BIBLIOTHEQUE_REFERENCE>
+
+            CONSIGNE CRUCIALE DE HIERARCHIE :
+            1. Pour la MÉTHODOLOGIE (calculs, validité, homogénéité), tu DOIS suivre scrupuleusement le contenu de <BIBLIOTHEQUE_REFERENCE> (notamment Grégoire, Ozenne).
+            2. Pour le VOCABULAIRE DIAGNOSTIQUE en conclusion, utilise le DSM-5 / CIM-11.
+
+            TÂCHE : rédige UNIQUEMENT la section ci-dessous ; les autres sections du compte rendu sont rédigées séparément.
+            Explique et interprète, formule des HYPOTHÈSES ; les écarts (*) du tableau de comparaisons sont déjà calculés.
+
+            ## {titre}
+            {consigne}
+
+            Commence directement par le titre « ## {titre} ». Ton professionnel, argumenté et clinique.
+            """
+
+
+def preparer_sections(entree, analyse, contextes, tables_ecarts=None, evolution="", plafond=PLAFOND_PROMPT):
+    """{section: (prompt, sections, tokens retirés)} dans l'ordre du compte rendu.
+
+    `contextes` : {section: contexte} (contextes_sections) ou un contexte commun.
+    """
+    infos, motif_txt, obs_txt, data = donnees_prompt(entree, analyse, tables_ecarts, evolution)
+    textes = {"infos": infos, "motif": motif_txt, "obs": obs_txt, "scores": data,
+              "intra": analyse.intra_txt}
+    prompts = {}
+    for cle, (titre, consigne, utiles, _) in SECTIONS_RAPPORT.items():
+        contexte = contextes[cle] if isinstance(contextes, dict) else contextes
+
+        def assembler(biblio, ana, titre=titre, consigne=consigne, utiles=utiles):
+            donnees = "\n            ".join(f"- {LIBELLES_DONNEES[k]}: {ana if k == 'anamnese' else textes[k]}"
+                                             for k in utiles)
+            return construire_prompt_section(titre, consigne, donnees, biblio,
+                                             entree.style_redac, entree.niveau_detail)
+
+        ana = entree.observations.anamnese if "anamnese" in utiles else ""
+        prompt, contexte, ana, retires = _plafonner(assembler, contexte, ana, plafond)
+        parties = {"bibliotheque": contexte, "scores": "".join(textes[k] for k in utiles if k in ("scores", "intra")),
+                   "anamnese": "".join(textes[k] for k in utiles if k in ("infos", "motif", "obs")) + ana}
+        prompts[cle] = (prompt, sections_prompt(prompt, **parties), retires)
+    return prompts
+
+
+def assembler_sections(textes):
+    """Sections générées -> compte rendu, dans l'ordre de SECTIONS_RAPPORT."""
+    return "\n\n".join(textes[cle].strip() for cle in SECTIONS_RAPPORT if cle in textes)
+
+
+def prompt_coherence(texte):
+    return f"""
+            Rôle: Relecteur expert de comptes rendus WISC-V.
+
+            Le compte rendu ci-dessous a été assemblé à partir de sections rédigées séparément.
+            Repère UNIQUEMENT les incohérences entre sections (chiffres contradictoires, conclusions
+            opposées, redites mot pour mot) et propose pour chacune une correction minimale.
+
+            <COMPTE_RENDU>
+            {texte}
+            </COMPTE_RENDU>
+
+            Format : {{"corrections": [{{"remplacer": "extrait exact du texte", "par": "texte corrigé"}}]}}
+            (liste vide si tout est cohérent ; « par » peut être vide pour supprimer une redite).
+            Renvoie UNIQUEMENT un JSON valide.
+            """
+
+
+def relire_coherence(texte, appel_llm):
+    """Applique les corrections de la relecture de cohérence : (texte corrigé, corrections appliquées).
+
+    Seuls les extraits retrouvés tels quels dans le texte sont remplacés.
+    """
+    reponse = lire_interpretation(appel_llm(prompt_coherence(texte)))
+    appliquees = 0
+    for c in reponse.get("corrections") or []:
+        if isinstance(c, dict) and c.get("remplacer") and c["remplacer"] in texte:
+            texte = texte.replace(c["remplacer"], c.get("par") or "", 1)
+            appliquees += 1
+    return texte, appliquees
+
+
+# ==========================================
+# COMPTE RENDU
+# ==========================================
+@dataclass
+class Rapport:
+    entree: EntreeBilan
+    analyse: Analyse
+    prompt: str
+    texte: str
+    duree: float
+    pdf: Optional[bytes] = None
+    docx: Optional[bytes] = None
+    interpretation: Optional[dict] = None   # premier temps (mode « deux_temps »)
+
+
+def chaines_age(identite):
+    """(« 9a2m », « 9 ans 2 mois ») pour les exports."""
+    ans, mois = calculer_age(identite.date_naissance, identite.date_bilan)
+    return f"{ans}a{mois}m", f"{ans} ans {mois} mois"
+
+
+def champs_export(identite, valid_ind=None):
+    """Champs imprimés dans les exports (et clé de leur cache).
+
+    Le radar n'est joint qu'à partir de 3 indices renseignés, comme à l'écran.
+    """
+    court, long_ = chaines_age(identite)
+    champs = {"prenom": identite.prenom, "sexe": identite.sexe, "age_court": court,
+              "age_long": long_, "date_bilan": identite.date_bilan.strftime('%d/%m/%Y')}
+    if valid_ind and len(valid_ind) >= 3:
+        champs["indices"] = [list(p) for p in valeurs_radar(valid_ind)]
+    return champs
+
+
+def exporter(texte, identite, formats=("pdf", "docx"), valid_ind=None):
+    """Octets des exports demandés : {"pdf": ..., "docx": ...}."""
+    champs = champs_export(identite, valid_ind)
+    return {fmt: rendre(fmt, texte, champs) for fmt in formats}
+
+
+def generate_report(entree, appel_llm=None, contexte_biblio="", formats=("pdf", "docx"),
+                    tables_ecarts=None, mode="direct"):
+    """Produit le compte rendu complet d'un bilan.
+
+    `appel_llm(prompt) -> str` ; par défaut le client IA partagé du processus.
+    `tables_ecarts` : seuils critiques / taux de base (discordances.TablesEcarts).
+    `mode` : clé de MODES_GENERATION. En mode « sections », `contexte_biblio`
+    peut être un dict {section: contexte} (contextes_sections).
+    """
+    def appeler(prompt, nature, sections):
+        if appel_llm is not None:
+            return appel_llm(prompt)
+        from ia import get_client
+        return get_client().generer(prompt, nature=nature, sections=sections)
+
+    analyse = analyser(entree.scores)
+    interpretation = None
+    debut = time.perf_counter()
+    if mode == "deux_temps":
+        prompt, sections, _ = preparer_interpretation(entree, analyse, contexte_biblio, tables_ecarts)
+        interpretation = lire_interpretation(appeler(prompt, "interpretation", sections))
+        prompt, sections = preparer_redaction(entree, analyse, interpretation, tables_ecarts)
+        texte = appeler(prompt, "redaction", sections)
+    elif mode == "sections":
+        prompts = preparer_sections(entree, analyse, contexte_biblio, tables_ecarts)
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            futurs = {cle: pool.submit(appeler, p, f"section_{cle}", sec) for cle, (p, sec, _) in prompts.items()}
+            textes = {cle: f.result() for cle, f in futurs.items()}
+        prompt = "\n".join(p for p, _, _ in prompts.values())
+        texte, _ = relire_coherence(assembler_sections(textes),
+                                    lambda p: appeler(p, "coherence", sections_prompt(p)))
+    else:
+        prompt, sections, _ = preparer_prompt_mesure(entree, analyse, contexte_biblio, tables_ecarts)
+        texte = appeler(prompt, "rapport", sections)
+    duree = time.perf_counter() - debut
+    sorties = exporter(texte, entree.identite, formats, analyse.valid_ind)
+    return Rapport(entree, analyse, prompt, texte, duree, sorties.get("pdf"), sorties.get("docx"),
+                   interpretation)
+
+
+# ==========================================
+# LIGNE DE COMMANDE
+# ==========================================
+def _date(valeur, defaut):
+    if not valeur:
+        return defaut
+    if isinstance(valeur, date):
+        return valeur
+    if "/" in valeur:
+        j, m, a = (int(x) for x in valeur.split("/"))
+        return date(a, m, j)
+    return date.fromisoformat(valeur)
+
+
+def entree_depuis_dict(d):
+    idt = dict(d.get("identite", {}))
+    idt["date_naissance"] = _date(idt.get("date_naissance"), Identite().date_naissance)
+    idt["date_bilan"] = _date(idt.get("date_bilan"), date.today())
+    scores = {k: v for k, v in d.get("scores", {}).items() if k in CHAMPS_SCORES and v not in (None, "")}
+    return EntreeBilan(
+        Identite(**idt),
+        Observations(**d.get("observations", {})),
+        Scores(**scores),
+        d.get("style_redac", STYLES_REDAC[0]),
+        d.get("niveau_detail", NIVEAUX_DETAIL[1]),
+    )
+
+
+def charger_entrees(chemin):
+    """Dossiers depuis un JSON (liste) ou un CSV d'import_lot.py."""
+    if chemin.lower().endswith(".csv"):
+        with open(chemin, encoding="utf-8") as fh:
+            lignes = list(csv.DictReader(fh))
+        return [entree_depuis_dict({
+            "identite": {"prenom": os.path.splitext(l["fichier"])[0],
+                         "date_naissance": l.get("date_naissance"),
+                         "date_bilan": l.get("date_passation")},
+            "scores": {k: float(v) if k.startswith("perc") else int(float(v))
+                       for k, v in l.items() if k in CHAMPS_SCORES and v},
+        }) for l in lignes]
+    with open(chemin, encoding="utf-8") as fh:
+        return [entree_depuis_dict(d) for d in json.load(fh)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération de comptes rendus WISC-V sans interface.")
+    parser.add_argument("entrees", help="Dossiers à traiter (.json ou .csv d'import_lot.py)")
+    parser.add_argument("--sortie", default="comptes_rendus", help="Dossier de sortie")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bibliotheque", help="Dossier des ouvrages de référence (sélection BM25)")
+    parser.add_argument("--budget", type=int, default=BUDGET_TOKENS_DEFAUT, help="Budget contexte (tokens)")
+    parser.add_argument("--formats", default="pdf,docx")
+    parser.add_argument("--mode", choices=list(MODES_GENERATION), default="direct",
+                        help="deux_temps : interprétation mise en cache puis rédaction sans bibliothèque ; "
+                             "sections : les quatre sections en parallèle")
+    args = parser.parse_args(argv)
+
+    import ia
+    ia.configurer(os.environ.get("GOOGLE_API_KEY"))
+
+    index = None
+    if args.bibliotheque:
+        from bibliotheque import Bibliotheque, lister_sources
+        bibli = Bibliotheque()
+        index = IndexBM25.depuis_sources({
+            f: bibli.texte(os.path.join(args.bibliotheque, f)) for f in lister_sources(args.bibliotheque)
+        })
+
+    tables_ecarts = TablesEcarts.depuis_dossier()
+    entrees = charger_entrees(args.entrees)
+    formats = tuple(args.formats.split(","))
+    os.makedirs(args.sortie, exist_ok=True)
+
+    def traiter(numero_entree):
+        numero, entree = numero_entree
+        debut = time.perf_counter()
+        contexte = ""
+        if index is not None and args.mode == "sections":
+            contexte = contextes_sections(entree, analyser(entree.scores), index, args.budget)
+        elif index is not None:
+            contexte, _ = contexte_bibliotheque(entree, analyser(entree.scores), index, args.budget)
+        rapport = generate_report(entree, None, contexte, formats, tables_ecarts, args.mode)
+        base = os.path.join(args.sortie, f"{numero:03d}_Bilan_WISC5_{entree.identite.prenom or 'enfant'}")
+        with open(base + ".md", "w", encoding="utf-8") as fh:
+            fh.write(rapport.texte)
+        for ext in formats:
+            with open(f"{base}.{ext}", "wb") as fh:
+                fh.write(getattr(rapport, ext))
+        return base, time.perf_counter() - debut
+
+    echecs = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futurs = [pool.submit(traiter, x) for x in enumerate(entrees, 1)]
+        for numero, fut in enumerate(futurs, 1):
+            try:
+                base, duree = fut.result()
+                print(f"ok     {duree:7.2f} s  {base}", file=sys.stderr)
+            except Exception as e:
+                echecs += 1
+                print(f"echec  dossier {numero} : {e}", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
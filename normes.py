@@ -0,0 +1,179 @@
+# ==========================================
+# TABLES DE NORMES (CONVERSION DES NOTES COMPOSITES)
+# ==========================================
+# Conversion somme de notes standard -> note composite, rang percentile et
+# IC 95 %, à partir de tables fournies par l'utilisateur (les tables de
+# l'éditeur sont sous licence : elles ne sont pas distribuées avec l'appli).
+#
+# Les tables sont des CSV (séparateur , ou ;) déposés dans le dossier
+# normes/ (ou WISC_NORMES_DIR), une ligne par somme :
+#
+#   indice;somme;note;percentile;ic_bas;ic_haut;tranche
+#   QIT;70;100;50;94;106;
+#   ICV;20;100;50;92;108;6:0-16:11
+#
+# - indice : QIT, ICV, IVS, IRF, IMT, IVT, IAG, ICC ou INV ;
+# - percentile, ic_bas, ic_haut : facultatifs (« <0,1 », « >99,9 » acceptés) ;
+# - tranche : facultative, « A:M-A:M » en années:mois inclus ; vide = tous âges.
+#
+# Chargées une fois, les tables sont rangées dans des tableaux NumPy indexés
+# par [tranche d'âge, somme] : la conversion est une simple lecture.
+
+import csv
+import glob
+import os
+
+import numpy as np
+
+from psychometrie import POSITION, PAIRES, SOMMES, INDICES_PRINCIPAUX, matrice
+from qglobal import INDICES_AVEC_PERCENTILE
+
+DOSSIER_NORMES = os.environ.get("WISC_NORMES_DIR", "normes")
+
+# Subtests dont la somme des notes standard donne chaque note composite
+COMPOSITIONS = {
+    "qit": ["sim", "voc", "cub", "mat", "bal", "memc", "cod"],
+    **{k.lower(): list(p) for k, p in zip(INDICES_PRINCIPAUX, PAIRES)},
+    **{k.lower(): c for k, c in SOMMES.items()},
+}
+SOMME_MAX = 19 * max(len(c) for c in COMPOSITIONS.values())
+TOUS_AGES = (0, 12 * 99)
+CHAMPS = ("note", "percentile", "ic_bas", "ic_haut")
+
+
+def lire_csv(dossier):
+    """Lignes de tous les *.csv du dossier (en-têtes en minuscules). Chaque
+    ligne garde son origine (« fichier.csv, ligne N ») sous la clé _origine."""
+    lignes = []
+    for chemin in sorted(glob.glob(os.path.join(dossier, "*.csv"))):
+        with open(chemin, encoding="utf-8-sig", newline="") as fh:
+            dialecte = csv.Sniffer().sniff(fh.readline(), delimiters=",;\t")
+            fh.seek(0)
+            lecteur = csv.DictReader(fh, dialect=dialecte)
+            for l in lecteur:
+                lignes.append({**{k.strip().lower(): v for k, v in l.items()},
+                               "_origine": f"{os.path.basename(chemin)}, ligne {lecteur.line_num}"})
+    return lignes
+
+
+def signature_normes(dossier=DOSSIER_NORMES):
+    """(fichier, mtime, taille) des tables : change dès qu'une table est modifiée."""
+    return tuple((f, os.path.getmtime(f), os.path.getsize(f))
+                 for f in sorted(glob.glob(os.path.join(dossier, "*.csv"))))
+
+
+def age_en_mois(d_naiss, d_bilan):
+    ans = d_bilan.year - d_naiss.year
+    mois = d_bilan.month - d_naiss.month - (d_bilan.day < d_naiss.day)
+    return max(0, ans * 12 + mois)
+
+
+def nombre(txt):
+    txt = (txt or "").strip().replace(" ", "").lstrip("<>").replace(",", ".")
+    return float(txt) if txt else np.nan
+
+
+def tranche(txt):
+    """« 6:0-6:3 » -> (72, 75) en mois ; vide = tous âges. ValueError si illisible."""
+    txt = (txt or "").strip()
+    if not txt:
+        return TOUS_AGES
+    try:
+        debut, fin = txt.split("-")
+        ages = [(int(a), int(m)) for a, m in (x.split(":") for x in (debut, fin))]
+    except ValueError:
+        raise ValueError(f"tranche d'âge illisible « {txt} »") from None
+    mois = [a * 12 + m for a, m in ages]
+    if not (all(0 <= m < 12 for _, m in ages) and TOUS_AGES[0] <= mois[0] <= mois[1] <= TOUS_AGES[1]):
+        raise ValueError(f"tranche d'âge invalide « {txt} »")
+    return mois[0], mois[1]
+
+
+def lire_ligne(ligne):
+    """(indice, tranche en mois, somme, [note, percentile, ic_bas, ic_haut]) d'une
+    ligne de table. ValueError si un champ est illisible ou hors des bornes."""
+    cle = (ligne.get("indice") or "").strip().lower()
+    if cle not in COMPOSITIONS:
+        raise ValueError(f"indice inconnu « {ligne.get('indice')} »")
+    try:
+        somme = int((ligne.get("somme") or "").strip())
+    except ValueError:
+        raise ValueError(f"somme illisible « {ligne.get('somme')} »") from None
+    if not 0 <= somme <= SOMME_MAX:
+        raise ValueError(f"somme {somme} hors de 0-{SOMME_MAX}")
+    return cle, tranche(ligne.get("tranche")), somme, [nombre(ligne.get(c)) for c in CHAMPS]
+
+
+class TablesNormes:
+    """Tables chargées : tableau [tranche, somme, champ] par note composite."""
+
+    def __init__(self, lignes=()):
+        par_indice = {}
+        for i, ligne in enumerate(lignes, 1):
+            try:
+                cle, bornes_age, somme, valeurs = lire_ligne(ligne)
+            except ValueError as e:
+                raise ValueError(f"Table de normes, {ligne.get('_origine') or f'ligne {i}'} : {e}") from None
+            par_indice.setdefault(cle, []).append((bornes_age, somme, valeurs))
+
+        self.tranches = {}   # indice -> tableau (n, 2) des bornes en mois
+        self.tables = {}     # indice -> tableau (n tranches, SOMME_MAX + 1, 4)
+        for cle, lignes_indice in par_indice.items():
+            bornes = sorted({b for b, _, _ in lignes_indice})
+            table = np.full((len(bornes), SOMME_MAX + 1, len(CHAMPS)), np.nan)
+            for b, somme, valeurs in lignes_indice:
+                table[bornes.index(b), somme] = valeurs
+            self.tranches[cle] = np.array(bornes)
+            self.tables[cle] = table
+
+    @classmethod
+    def depuis_dossier(cls, dossier=DOSSIER_NORMES):
+        """Toutes les tables *.csv du dossier (aucune si le dossier n'existe pas)."""
+        return cls(lire_csv(dossier))
+
+    def __bool__(self):
+        return bool(self.tables)
+
+    @property
+    def indices(self):
+        return list(self.tables)
+
+    def convertir_lot(self, X, ages_mois):
+        """Champs composites pour N protocoles (matrice de psychometrie.matrice).
+
+        Retourne {champ: tableau (N,)} ; NaN quand un subtest manque, que la
+        somme ou l'âge (NaN / None = inconnu) sort de la table.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        ages = np.broadcast_to(np.array(ages_mois, dtype=float), (len(X),))
+        ages = np.where(np.isnan(ages), -1, ages)
+        sorties = {}
+        for cle, table in self.tables.items():
+            sub = X[:, [POSITION[k] for k in COMPOSITIONS[cle]]]
+            somme = sub.sum(axis=1).astype(int)
+            bornes = self.tranches[cle]
+            if len(bornes) == 1 and tuple(bornes[0]) == TOUS_AGES:
+                t = np.zeros(len(X), dtype=int)
+                dans_tranche = np.ones(len(X), dtype=bool)
+            else:
+                t = np.searchsorted(bornes[:, 0], ages, side="right") - 1
+                dans_tranche = (t >= 0) & (ages <= bornes[np.clip(t, 0, None), 1])
+            valide = (sub > 0).all(axis=1) & (somme <= SOMME_MAX) & dans_tranche
+            valeurs = np.full((len(X), len(CHAMPS)), np.nan)
+            valeurs[valide] = table[t[valide], somme[valide]]
+            sorties[cle] = valeurs[:, 0]
+            if cle in INDICES_AVEC_PERCENTILE:
+                sorties[f"perc_{cle}"] = valeurs[:, 1]
+            sorties[f"{cle}_bas"] = valeurs[:, 2]
+            sorties[f"{cle}_haut"] = valeurs[:, 3]
+        return sorties
+
+    def convertir(self, scores, age_mois=None):
+        """Champs composites résolus pour un enfant : {champ: valeur}.
+
+        `scores` : objet Scores ou dict de notes standard. Sans âge, seules
+        les tables « tous âges » sont utilisables.
+        """
+        resultats = self.convertir_lot(matrice([scores]), [age_mois])
+        return {k: (float(v[0]) if k.startswith("perc") else int(v[0]))
+                for k, v in resultats.items() if not np.isnan(v[0])}
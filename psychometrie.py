@@ -0,0 +1,174 @@
+# ==========================================
+# MOTEUR PSYCHOMÉTRIQUE VECTORISÉ (NUMPY)
+# ==========================================
+# Règles de validité appliquées d'un coup à N protocoles : une ligne par
+# enfant, les 15 subtests puis les 9 notes composites (ordre de qglobal).
+# 0 = non renseigné, comme dans l'application.
+#
+# Sert au bilan individuel (moteur.analyser, matrice 1 × 24) et aux
+# exploitations de recherche sur les protocoles archivés :
+#
+#   python psychometrie.py protocoles.csv analyses.csv
+#
+# protocoles.csv : CSV produit par import_lot.py (cases vides = non renseigné).
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from qglobal import SUBTESTS, INDICES
+
+COLONNES_SUBTESTS = list(SUBTESTS)
+COLONNES_INDICES = list(INDICES)
+COLONNES = COLONNES_SUBTESTS + COLONNES_INDICES
+POSITION = {k: i for i, k in enumerate(COLONNES)}
+
+INDICES_PRINCIPAUX = ["ICV", "IVS", "IRF", "IMT", "IVT"]
+# Paires de subtests qui fondent chaque indice principal (ordre de INDICES_PRINCIPAUX)
+PAIRES = [("sim", "voc"), ("cub", "puz"), ("mat", "bal"), ("memc", "memi"), ("sym", "cod")]
+# Aide au calcul des indices complémentaires (somme des notes standard)
+SOMMES = {
+    "IAG": ["sim", "voc", "cub", "mat", "bal"],
+    "ICC": ["memc", "memi", "sym", "cod"],
+    "INV": ["cub", "puz", "mat", "bal", "memi", "cod"],
+}
+
+SEUIL_HETEROGENEITE = 4    # écart entre les deux subtests d'un indice
+SEUIL_DISPERSION = 23      # écart max - min entre indices principaux
+NB_INV_FRAGILE = 2         # indices hétérogènes pour un QIT fragile
+SEUIL_IPSATIF = 10         # écart à la moyenne personnelle (force / faiblesse)
+
+# Statuts de validité du QIT
+INCOMPLET, VALIDE, FRAGILE, NON_INTERPRETABLE = "incomplet", "valide", "fragile", "non_interpretable"
+
+
+def _cols(noms):
+    return [POSITION[k] for k in noms]
+
+
+def _valeur(ligne, k):
+    v = ligne.get(k) if isinstance(ligne, dict) else getattr(ligne, k, 0)
+    return float(v or 0)
+
+
+def matrice(lignes, colonnes=COLONNES):
+    """Tableau N × 24 à partir d'objets Scores ou de dicts (None / vide / absent = 0).
+
+    `colonnes` : autres champs de Scores à lire (IC, percentiles...).
+    """
+    return np.array([[_valeur(ligne, k) for k in colonnes] for ligne in lignes],
+                    dtype=float).reshape(len(lignes), len(colonnes))
+
+
+def analyser_lot(X):
+    """Validité, dispersion, analyse ipsative et sommes pour toutes les lignes de X.
+
+    Retourne un dict de tableaux (N lignes) :
+      ecarts_paires (N×5)   écart absolu entre les subtests de chaque indice
+      homogene (N×5)        1 homogène, 0 hétérogène, -1 paire incomplète
+      nb_inv (N)            nombre d'indices hétérogènes
+      dispersion (N)        max - min des indices principaux (-1 si incomplet)
+      statut (N)            INCOMPLET / VALIDE / FRAGILE / NON_INTERPRETABLE
+      moy, et (N)           moyenne et écart-type personnels (indices renseignés)
+      ecarts (N×5)          écart de chaque indice à la moyenne (NaN si absent)
+      forces, faiblesses (N×5)
+      sommes (N×3)          IAG, ICC, INV ; -1 si un subtest manque
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X[None, :]
+
+    # Homogénéité des indices principaux
+    a = X[:, _cols([p[0] for p in PAIRES])]
+    b = X[:, _cols([p[1] for p in PAIRES])]
+    complet = (a > 0) & (b > 0)
+    ecarts_paires = np.abs(a - b)
+    heterogene = complet & (ecarts_paires >= SEUIL_HETEROGENEITE)
+    homogene = np.where(complet, np.where(heterogene, 0, 1), -1)
+    nb_inv = heterogene.sum(axis=1)
+
+    # Dispersion et validité du QIT
+    ind = X[:, _cols([k.lower() for k in INDICES_PRINCIPAUX])]
+    renseigne = ind > 0
+    tous = renseigne.all(axis=1)
+    dispersion = np.where(tous, ind.max(axis=1) - ind.min(axis=1), -1)
+    statut = np.select(
+        [~tous, dispersion >= SEUIL_DISPERSION, nb_inv >= NB_INV_FRAGILE],
+        [INCOMPLET, NON_INTERPRETABLE, FRAGILE],
+        default=VALIDE,
+    )
+
+    # Analyse ipsative sur les indices renseignés
+    ind_nan = np.where(renseigne, ind, np.nan)
+    n = renseigne.sum(axis=1)
+    moy = np.zeros(len(X))
+    et = np.zeros(len(X))
+    lignes = n > 0
+    moy[lignes] = np.nanmean(ind_nan[lignes], axis=1)
+    et[lignes] = np.nanstd(ind_nan[lignes], axis=1)
+    ecarts = ind_nan - moy[:, None]
+    forces = ecarts >= SEUIL_IPSATIF
+    faiblesses = ecarts <= -SEUIL_IPSATIF
+
+    # Sommes de notes standard (aide au calcul)
+    sommes = np.stack([
+        np.where((X[:, _cols(c)] > 0).all(axis=1), X[:, _cols(c)].sum(axis=1), -1)
+        for c in SOMMES.values()
+    ], axis=1)
+
+    return {"ecarts_paires": ecarts_paires, "homogene": homogene, "nb_inv": nb_inv,
+            "dispersion": dispersion, "statut": statut, "moy": moy, "et": et,
+            "ecarts": ecarts, "forces": forces, "faiblesses": faiblesses, "sommes": sommes}
+
+
+# ==========================================
+# EXPORT RECHERCHE
+# ==========================================
+COLONNES_SORTIE = (["fichier", "statut", "dispersion", "nb_inv", "moy", "et"]
+                   + [f"homogene_{k}" for k in INDICES_PRINCIPAUX]
+                   + [f"ecart_{k}" for k in INDICES_PRINCIPAUX]
+                   + [f"profil_{k}" for k in INDICES_PRINCIPAUX]
+                   + [f"somme_{k}" for k in SOMMES])
+
+
+def lignes_resultats(noms, r):
+    """Une ligne à plat par protocole (cases vides = non calculable)."""
+    for i, nom in enumerate(noms):
+        ligne = {"fichier": nom, "statut": r["statut"][i],
+                 "dispersion": int(r["dispersion"][i]) if r["dispersion"][i] >= 0 else "",
+                 "nb_inv": int(r["nb_inv"][i]),
+                 "moy": round(float(r["moy"][i]), 2), "et": round(float(r["et"][i]), 2)}
+        for j, k in enumerate(INDICES_PRINCIPAUX):
+            h = r["homogene"][i, j]
+            ligne[f"homogene_{k}"] = "" if h < 0 else int(h)
+            e = r["ecarts"][i, j]
+            ligne[f"ecart_{k}"] = "" if np.isnan(e) else round(float(e), 2)
+            ligne[f"profil_{k}"] = ("force" if r["forces"][i, j] else
+                                    "faiblesse" if r["faiblesses"][i, j] else "")
+        for j, k in enumerate(SOMMES):
+            s = r["sommes"][i, j]
+            ligne[f"somme_{k}"] = int(s) if s >= 0 else ""
+        yield ligne
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse psychométrique par lot (CSV d'import_lot.py).")
+    parser.add_argument("protocoles", help="CSV des protocoles (une ligne par enfant)")
+    parser.add_argument("sortie", help="CSV des analyses")
+    args = parser.parse_args(argv)
+
+    with open(args.protocoles, encoding="utf-8", newline="") as fh:
+        protocoles = list(csv.DictReader(fh))
+    resultats = analyser_lot(matrice(protocoles))
+    with open(args.sortie, "w", encoding="utf-8", newline="") as fh:
+        w = csv.DictWriter(fh, fieldnames=COLONNES_SORTIE)
+        w.writeheader()
+        w.writerows(lignes_resultats([p.get("fichier", i) for i, p in enumerate(protocoles)], resultats))
+    print(f"{len(protocoles)} protocole(s) analysé(s) -> {args.sortie}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# ==========================================
+# IMPORT DES RAPPORTS Q-GLOBAL (WISC-V)
+# ==========================================
+# Parser local des tableaux de synthèse Q-GLOBAL (notes standard des
+# subtests, notes composites, rangs percentiles, IC 95 %, dates).
+# Les notes composites absentes du texte sont calculées à partir des subtests
+# quand des tables de normes sont chargées (normes.py) ; le modèle n'est
+# sollicité que pour les champs restants.
+
+import json
+import re
+from datetime import datetime
+
+SUBTESTS = {
+    'sim': ("SIM", "Similitudes"),
+    'voc': ("VOC", "Vocabulaire"),
+    'info': ("INF", "Information"),
+    'comp': ("COM", "Compréhension"),
+    'cub': ("CUB", "Cubes"),
+    'puz': ("PUZ", "Puzzles visuels"),
+    'mat': ("MAT", "Matrices"),
+    'bal': ("BAL", "Balances"),
+    'arit': ("ARI", "Arithmétique"),
+    'memc': ("MCH", "Mémoire des chiffres"),
+    'memi': ("MIM", "Mémoire des images"),
+    'seq': ("SLC", "Séquence lettres-chiffres"),
+    'cod': ("COD", "Code"),
+    'sym': ("SYM", "Symboles"),
+    'bar': ("BAR", "Barrage"),
+}
+
+INDICES = {
+    'qit': ("QIT", "Échelle totale"),
+    'icv': ("ICV", "Compréhension verbale"),
+    'ivs': ("IVS", "Visuospatial"),
+    'irf': ("IRF", "Raisonnement fluide"),
+    'imt': ("IMT", "Mémoire de travail"),
+    'ivt': ("IVT", "Vitesse de traitement"),
+    'iag': ("IAG", "Aptitude générale"),
+    'icc': ("ICC", "Compétence cognitive"),
+    'inv': ("INV", "Non verbal"),
+}
+INDICES_AVEC_PERCENTILE = ['qit', 'icv', 'ivs', 'irf', 'imt', 'ivt']
+
+CHAMPS_SCORES = list(SUBTESTS)
+for _k in INDICES:
+    CHAMPS_SCORES += ([_k, f'perc_{_k}'] if _k in INDICES_AVEC_PERCENTILE else [_k]) + [f'{_k}_bas', f'{_k}_haut']
+CHAMPS_DATES = ['date_naissance', 'date_passation']
+CHAMPS_QGLOBAL = CHAMPS_SCORES + CHAMPS_DATES
+
+LIMITE_TEXTE_IA = 30000
+
+# --- Expressions des tableaux ---
+_NB = r"(\d{1,3})"
+_PERC = r"([<>]?\s*\d{1,2}(?:[.,]\d+)?)"
+_IC = r"(\d{2,3})\s*[-–à]\s*(\d{2,3})"
+# Composite : [somme NS] note percentile IC (la somme est absente de certains tableaux)
+RE_COMPOSITE = [
+    re.compile(rf"^\s*{_NB}\s+(\d{{2,3}})\s+{_PERC}\s+{_IC}"),
+    re.compile(rf"^\s*(\d{{2,3}})\s+{_PERC}\s+{_IC}"),
+]
+# Indices complémentaires sans percentile dans l'appli : [somme] note [percentile] IC
+RE_COMPOSITE_SANS_PERC = re.compile(rf"^\s*(?:{_NB}\s+)?(\d{{2,3}})\s+(?:{_PERC}\s+)?{_IC}")
+RE_SUBTEST = re.compile(r"^\s*(\d{1,3})\s+(\d{1,2})\b")
+RE_DATE = r"(\d{1,2})\s*[/.-]\s*(\d{1,2})\s*[/.-]\s*(\d{4})"
+DATES = {
+    'date_naissance': re.compile(rf"Date\s+de\s+naissance\s*:?\s*{RE_DATE}", re.IGNORECASE),
+    'date_passation': re.compile(
+        rf"Date\s+(?:d(?:e\s+(?:la\s+|l[’'])?|[’'])\s*(?:passation|évaluation|examen)|du\s+test)\s*:?\s*{RE_DATE}",
+        re.IGNORECASE),
+}
+
+
+def _libelle(abrev, nom):
+    """Libellé de ligne : abréviation en majuscules ou nom complet (mot entier)."""
+    return re.compile(rf"(?:\b{abrev}\b|(?i:{re.escape(nom)})\b)")
+
+
+LIBELLES = {cle: _libelle(abrev, nom) for cle, (abrev, nom) in {**INDICES, **SUBTESTS}.items()}
+
+
+def _percentile(txt):
+    return float(txt.replace(" ", "").lstrip("<>").replace(",", "."))
+
+
+def _apres_libelle(ligne, libelle):
+    m = libelle.search(ligne)
+    if not m:
+        return None
+    reste = ligne[m.end():]
+    # Abréviation qui suit le nom complet (« Similitudes SIM 28 12 ... »)
+    return re.sub(r"^\s*\(?[A-Z]{3}\)?", "", reste)
+
+
+def analyser_rapport(texte):
+    """Extrait les champs reconnus dans le texte d'un rapport Q-GLOBAL.
+
+    Retourne un dict {champ: valeur} limité aux champs résolus ; les dates
+    sont au format JJ/MM/AAAA.
+    """
+    lignes = [re.sub(r"\s+", " ", l) for l in texte.splitlines()]
+    donnees = {}
+
+    for cle in INDICES:
+        for ligne in lignes:
+            reste = _apres_libelle(ligne, LIBELLES[cle])
+            if reste is None:
+                continue
+            if cle in INDICES_AVEC_PERCENTILE:
+                for motif in RE_COMPOSITE:
+                    m = motif.match(reste)
+                    if m:
+                        note, perc, bas, haut = m.groups()[-4:]
+                        donnees.update({cle: int(note), f'perc_{cle}': _percentile(perc),
+                                        f'{cle}_bas': int(bas), f'{cle}_haut': int(haut)})
+                        break
+            else:
+                m = RE_COMPOSITE_SANS_PERC.match(reste)
+                if m:
+                    note, bas, haut = m.group(2), m.group(4), m.group(5)
+                    donnees.update({cle: int(note), f'{cle}_bas': int(bas), f'{cle}_haut': int(haut)})
+            if cle in donnees and 40 <= donnees[cle] <= 160:
+                break
+            for k in [cle, f'perc_{cle}', f'{cle}_bas', f'{cle}_haut']:
+                donnees.pop(k, None)
+
+    for cle in SUBTESTS:
+        for ligne in lignes:
+            reste = _apres_libelle(ligne, LIBELLES[cle])
+            if reste is None:
+                continue
+            m = RE_SUBTEST.match(reste)   # note brute puis note standard
+            if m and 1 <= int(m.group(2)) <= 19:
+                donnees[cle] = int(m.group(2))
+                break
+
+    for cle, motif in DATES.items():
+        m = motif.search(texte)
+        if m:
+            j, mo, a = (int(x) for x in m.groups())
+            donnees[cle] = f"{j:02d}/{mo:02d}/{a}"
+
+    return donnees
+
+
+def prompt_extraction(texte, champs):
+    """Prompt de secours : ne demande au modèle que les champs manquants."""
+    return f"""
+        Extrais les données WISC-V du texte ci-dessous en JSON.
+        IMPORTANT: Si une valeur est manquante, mets 0 (ou "" pour les dates).
+
+        Champs demandés UNIQUEMENT : {", ".join(champs)}
+        (Subtests = Note Standard 1-19 ; Indices = Note Composite ; perc_* = Rang percentile ;
+        *_bas / *_haut = IC 95 % ; dates au format JJ/MM/AAAA.)
+
+        TEXTE: {texte[:LIMITE_TEXTE_IA]}
+        Renvoie UNIQUEMENT un JSON valide.
+        """
+
+
+def _age_mois(donnees):
+    """Âge au bilan en mois d'après les dates extraites (None si inconnu)."""
+    try:
+        dn, dp = (datetime.strptime(donnees[k], "%d/%m/%Y") for k in CHAMPS_DATES)
+    except (KeyError, ValueError):
+        return None
+    return max(0, (dp.year - dn.year) * 12 + dp.month - dn.month - (dp.day < dn.day))
+
+
+def extraire(texte, appel_llm=None, normes=None):
+    """Parser local, puis tables de normes, puis modèle pour les champs restants.
+
+    `appel_llm(prompt) -> str` renvoie la réponse brute du modèle ; `normes`
+    est un normes.TablesNormes (facultatif).
+    Retourne (donnees, sources) où sources[champ] vaut "parser", "normes" ou "IA".
+    """
+    donnees = analyser_rapport(texte)
+    sources = {k: "parser" for k in donnees}
+    if normes:
+        for k, v in normes.convertir(donnees, _age_mois(donnees)).items():
+            if k not in donnees:
+                donnees[k] = v
+                sources[k] = "normes"
+    manquants = [k for k in CHAMPS_QGLOBAL if k not in donnees]
+    if manquants and appel_llm is not None:
+        json_str = appel_llm(prompt_extraction(texte, manquants)).strip()
+        if "```json" in json_str:
+            json_str = json_str.split("```json")[1].split("```")[0]
+        for k, v in json.loads(json_str).items():
+            if k in manquants:
+                donnees[k] = v
+                sources[k] = "IA"
+    return donnees, sources
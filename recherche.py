@@ -0,0 +1,190 @@
+# ==========================================
+# RECHERCHE DANS LA BIBLIOTHÈQUE (BM25)
+# ==========================================
+# Au lieu d'injecter toute la bibliothèque dans le prompt, on découpe les
+# ouvrages en passages, on les indexe (BM25 sur des tokens français
+# normalisés) et on ne retient que les passages pertinents pour le profil de
+# l'enfant, dans la limite d'un budget de tokens.
+
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+logger = logging.getLogger("wisc.recherche")
+
+MOTS_PAR_PASSAGE = 180
+CHEVAUCHEMENT = 30
+BUDGET_TOKENS_DEFAUT = 12000
+TOP_K_DEFAUT = 24
+
+MOTS_VIDES = set("""
+a au aux avec ce ces cet cette dans de des du elle elles en est et etre eu il ils
+je la le les leur leurs lui ma mais me meme mes moi mon ne nos notre nous on ou
+par pas pour qu que qui sa se ses si son sont sur ta te tes toi ton tu un une vos
+votre vous y c d j l m n s t plus peut sont ont ete fait cela ainsi entre tres
+comme dont lors alors aussi donc car bien sans sous chez tout tous toute toutes
+""".split())
+
+SUFFIXES = ('ements', 'ement', 'ations', 'ation', 'ites', 'ite', 'euses', 'euse',
+            'eux', 'ives', 'ive', 'ifs', 'if', 'es', 's', 'x', 'e')
+
+
+def tokens_pour_caracteres(nb_caracteres):
+    """Estimation grossière (≈ 4 caractères par token)."""
+    return nb_caracteres // 4
+
+
+def estimer_tokens(texte):
+    return tokens_pour_caracteres(len(texte))
+
+
+def sections_prompt(prompt, **parties):
+    """Tokens estimés par section : {nom: tokens} pour chaque texte de `parties`,
+    le reste du prompt (consignes, gabarit) compté dans « instructions »."""
+    sections = {nom: estimer_tokens(texte) for nom, texte in parties.items()}
+    sections["instructions"] = max(0, estimer_tokens(prompt) - sum(sections.values()))
+    return sections
+
+
+def tronquer(texte, budget_tokens):
+    """Texte ramené à `budget_tokens`, coupé en fin de ligne quand c'est possible."""
+    limite = max(0, budget_tokens) * 4
+    if len(texte) <= limite:
+        return texte
+    coupe = texte.rfind("\n", 0, limite)
+    return texte[:coupe if coupe > limite // 2 else limite]
+
+
+@lru_cache(maxsize=50000)
+def _racine(mot):
+    for suf in SUFFIXES:
+        if mot.endswith(suf) and len(mot) - len(suf) >= 4:
+            return mot[:-len(suf)]
+    return mot
+
+
+def normaliser_tokens(texte):
+    """Minuscules, sans accents, sans mots vides, racinisation légère."""
+    texte = unicodedata.normalize('NFKD', texte.lower()).encode('ascii', 'ignore').decode('ascii')
+    return [_racine(m) for m in re.findall(r"[a-z0-9]+", texte)
+            if len(m) > 1 and m not in MOTS_VIDES]
+
+
+def decouper(source, texte, mots_par_passage=MOTS_PAR_PASSAGE, chevauchement=CHEVAUCHEMENT):
+    """Découpe un texte en fenêtres de mots qui se chevauchent."""
+    mots = texte.split()
+    pas = max(1, mots_par_passage - chevauchement)
+    passages = []
+    for debut in range(0, len(mots), pas):
+        morceau = mots[debut:debut + mots_par_passage]
+        if len(morceau) < 20 and passages:
+            break
+        passages.append({"source": source, "numero": len(passages) + 1, "texte": " ".join(morceau)})
+        if debut + mots_par_passage >= len(mots):
+            break
+    return passages
+
+
+class IndexBM25:
+    """Index lexical BM25 sur les passages de la bibliothèque."""
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.longueurs = []
+        self.postings = defaultdict(list)   # terme -> [(id passage, tf)]
+        for i, p in enumerate(passages):
+            tokens = normaliser_tokens(p["texte"])
+            self.longueurs.append(len(tokens))
+            for terme, tf in Counter(tokens).items():
+                self.postings[terme].append((i, tf))
+        n = len(passages)
+        self.longueur_moy = (sum(self.longueurs) / n) if n else 0.0
+        self.idf = {t: math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5))
+                    for t, post in self.postings.items()}
+
+    @classmethod
+    def depuis_sources(cls, sources):
+        """sources : dict {nom de fichier: texte}."""
+        passages = []
+        for nom, texte in sources.items():
+            passages.extend(decouper(nom, texte))
+        return cls(passages)
+
+    def rechercher(self, requete, top_k=TOP_K_DEFAUT):
+        scores = defaultdict(float)
+        for terme, poids in Counter(normaliser_tokens(requete)).items():
+            idf = self.idf.get(terme)
+            if idf is None:
+                continue
+            for i, tf in self.postings[terme]:
+                norme = self.k1 * (1 - self.b + self.b * self.longueurs[i] / self.longueur_moy)
+                scores[i] += poids * idf * tf * (self.k1 + 1) / (tf + norme)
+        meilleurs = sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+        return [(self.passages[i], s) for i, s in meilleurs]
+
+
+# --- Construction de la requête à partir du profil ---
+TERMES_INDICES = {
+    "ICV": "indice compréhension verbale ICV raisonnement verbal langage vocabulaire similitudes",
+    "IVS": "indice visuospatial IVS cubes puzzles visuels traitement visuospatial",
+    "IRF": "indice raisonnement fluide IRF matrices balances raisonnement",
+    "IMT": "indice mémoire de travail IMT mémoire chiffres images séquences",
+    "IVT": "indice vitesse de traitement IVT code symboles vitesse graphomotrice",
+}
+
+TERMES_MOTIFS = {
+    "Difficultés scolaires": "apprentissages scolaires difficultés scolaires troubles des apprentissages",
+    "Suspicion TDAH": "TDAH attention déficit hyperactivité impulsivité fonctions exécutives",
+    "Suspicion TSA": "autisme TSA trouble du spectre autistique communication sociale",
+    "Suspicion HPI/Douance": "haut potentiel intellectuel HPI douance précocité",
+    "Orientation MDPH/RQTH": "déficience intellectuelle handicap retard mental orientation",
+    "Bilan de rééducation": "rééducation orthophonie dyslexie dyspraxie",
+}
+
+REQUETE_METHODO = "validité homogénéité interprétation indices écart significatif QIT"
+
+
+def requete_profil(h_txt, indices_heterogenes, forces, faiblesses, motifs):
+    """Assemble la requête BM25 (les termes répétés pèsent davantage)."""
+    morceaux = [REQUETE_METHODO]
+    if h_txt.startswith("NON INTERPRÉTABLE"):
+        morceaux.append("QIT non interprétable dispersion hétérogénéité indice aptitude générale IAG "
+                        "indice compétence cognitive ICC indice non verbal INV")
+    elif h_txt.startswith("FRAGILE"):
+        morceaux.append("indice hétérogène écart subtests interprétation prudente")
+    for nom in indices_heterogenes:
+        morceaux.append("hétérogène " + TERMES_INDICES.get(nom, nom))
+    for nom in list(forces) + list(faiblesses):
+        morceaux.append("force faiblesse relative ipsative " + TERMES_INDICES.get(nom, nom))
+    for m in motifs:
+        morceaux.append(TERMES_MOTIFS.get(m, m))
+    return " ".join(morceaux)
+
+
+def selectionner_passages(index, requete, budget_tokens=BUDGET_TOKENS_DEFAUT, top_k=TOP_K_DEFAUT):
+    """Meilleurs passages dans la limite du budget, remis dans l'ordre de lecture."""
+    retenus = []
+    total = 0
+    for passage, score in index.rechercher(requete, top_k=top_k):
+        cout = estimer_tokens(passage["texte"])
+        if total + cout > budget_tokens:
+            continue
+        retenus.append((passage, score))
+        total += cout
+    retenus.sort(key=lambda x: (x[0]["source"], x[0]["numero"]))
+    for passage, score in retenus:
+        logger.info("Passage retenu : %s #%d (score %.2f)", passage["source"], passage["numero"], score)
+    logger.info("%d passages retenus, ~%d tokens (budget %d)", len(retenus), total, budget_tokens)
+    return retenus
+
+
+def formater_contexte(retenus):
+    return "".join(
+        f"\n--- SOURCE PRIORITAIRE: {p['source']} (passage {p['numero']}) ---\n{p['texte']}\n"
+        for p, _ in retenus
+    )
@@ -1,21 +1,29 @@
 import streamlit as st
-import google.generativeai as genai
-import os
-import io
-import json
-import re
-import numpy as np
-import matplotlib.pyplot as plt
-from io import StringIO
-from pypdf import PdfReader
-from docx import Document
-from datetime import date, datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable, Table, TableStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
+import csv
+import time
+import uuid
+from datetime import date
+from bibliotheque import Bibliotheque, lister_sources
+from recherche import IndexBM25, estimer_tokens, tokens_pour_caracteres, sections_prompt, BUDGET_TOKENS_DEFAUT
+from ia import get_client, backend_configure, configurer
+import qglobal
+from import_lot import en_csv, COLONNES_RAPPORT
+from normes import TablesNormes, signature_normes, age_en_mois
+from discordances import TablesEcarts, DOSSIER_ECARTS, comparer
+from moteur import (Identite, Observations, Scores, EntreeBilan, calculer_age,
+                    analyser, contexte_bibliotheque, preparer_prompt_mesure, champs_export, PLAFOND_PROMPT,
+                    MODES_GENERATION, preparer_interpretation, preparer_redaction,
+                    SECTIONS_RAPPORT, contextes_sections, preparer_sections)
+from exports import CacheExports, FORMATS
+from graphiques import radar_png, radar_evolution_png, valeurs_radar
+from dossiers import Dossiers, normaliser_nom
+from evolution import comparer_bilans, formater_evolution
+from memoire import RegistreSessions, rss_octets
+from diagnostics import Diagnostics
+from taches import FileTaches, EN_COURS, tache_extraction, tache_import_lot, tache_rapport, tache_resume
+from functools import partial
+
+DEBUT_PAGE = time.perf_counter()
 
 # ==========================================
 # 0. ADMINISTRATION & UTILISATEURS
@@ -62,10 +70,28 @@ st.set_page_config(
     }
 )
 
+# Temps par bloc du rendu (page de diagnostics de l'administrateur)
+@st.cache_resource
+def get_diagnostics():
+    """Spans agrégés pour tout le processus, journal tournant dans .cache_wisc/."""
+    return Diagnostics()
+
+st.session_state.setdefault('id_session', uuid.uuid4().hex[:8])
+
+def span(bloc):
+    """Chronomètre un bloc du rendu pour la session courante (sans effet si désactivé)."""
+    return get_diagnostics().span(bloc, st.session_state.get('id_session'), st.session_state.get('user_nom', ""))
+
+def noter_span(bloc, debut):
+    """Comme span(), pour un bloc commencé à `debut` (time.perf_counter())."""
+    get_diagnostics().noter(bloc, time.perf_counter() - debut, st.session_state.get('id_session'),
+                            st.session_state.get('user_nom', ""))
+
 # ==========================================
 # 2. THÈME CSS PROFESSIONNEL
 # ==========================================
-st.markdown("""
+with span("Thème CSS"):
+    st.markdown("""
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Libre+Baskerville:ital,wght@0,400;0,700;1,400&family=DM+Sans:opsz,wght@9..40,300;9..40,400;9..40,500;9..40,600&display=swap');
 
@@ -467,11 +493,14 @@ if 'authenticated' not in st.session_state:
 #     afficher_login()
 #     st.stop()
 
-try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except:
-    st.error("⛔ Clé API manquante dans les secrets Streamlit.")
-    st.stop()
+if backend_configure() == "stub":
+    st.info("🧪 Mode hors ligne : les textes sont simulés par le backend IA local.")
+else:
+    try:
+        configurer(st.secrets["GOOGLE_API_KEY"])
+    except:
+        st.error("⛔ Clé API manquante dans les secrets Streamlit.")
+        st.stop()
 
 # ==========================================
 # 5. GESTION DU RESET
@@ -493,7 +522,7 @@ ALL_SCORE_KEYS = [
     'iag', 'iag_bas', 'iag_haut',
     'icc', 'icc_bas', 'icc_haut',
     'inv', 'inv_bas', 'inv_haut',
-    'import_status'
+    'import_status', 'dossier_id'
 ]
 
 def reset_all():
@@ -538,238 +567,441 @@ if 'ab' not in st.session_state: st.session_state['ab'] = date.today().year
 # ==========================================
 # 7. FONCTIONS
 # ==========================================
-def calculer_age(d_naiss, d_bilan):
+# --- Lecture de la saisie ---
+# Chaque section est un fragment : une saisie ne réexécute que sa section.
+# Les fragments ne partagent pas leurs variables locales, la génération relit
+# donc tout dans st.session_state (widgets à clé).
+OBSERVATIONS = {
+    "Attitude": [("Anxiété", "Anxiété perf."), ("Opposition", "Opposition"),
+                 ("Agitation", "Agitation"), ("Impulsivité", "Impulsivité")],
+    "Cognition": [("Fatigabilité", "Fatigabilité"), ("Inattention", "Inattention"),
+                  ("Besoin relance", "Besoin relance"), ("Verbal +++", "Logorrhée"),
+                  ("Verbal ---", "Mutisme/Pauvreté")],
+    "Graphisme": [("Crispation", "Crispation"), ("Lenteur graph.", "Lenteur graph.")],
+}
+MOTIFS_CONSULTATION = [
+    [("Difficultés scolaires", "Difficultés scolaires"), ("Suspicion TDAH", "Suspicion TDAH"),
+     ("Suspicion TSA", "Suspicion TSA"), ("Suspicion HPI / Douance", "Suspicion HPI/Douance")],
+    [("Orientation MDPH / RQTH", "Orientation MDPH/RQTH"), ("Bilan de rééducation", "Bilan de rééducation"),
+     ("Suivi psy / thérapeutique", "Suivi psy/thérapeutique"), ("Autre motif", "Autre (voir anamnèse)")],
+]
+CHOIX_CREOLE = ["-- (Non/Peu)", "+- (Moyen)", "++ (Dominant)"]
+
+def _date_saisie(j, m, a):
+    try: return date(st.session_state[a], st.session_state[m], st.session_state[j])
+    except: return date.today()
+
+def identite_saisie():
+    ss = st.session_state
+    return Identite(ss.get('prenom', ""), ss.get('sexe', "Garçon"), ss.get('lateralite', "Droitier"),
+                    ss.get('creole', CHOIX_CREOLE[0]), _date_saisie('jn', 'mn', 'an'), _date_saisie('jb', 'mb', 'ab'))
+
+def observations_saisies():
+    ss = st.session_state
+    obs = [v for cases in OBSERVATIONS.values() for libelle, v in cases if ss.get(f"obs_{libelle}")]
+    motifs = [v for cases in MOTIFS_CONSULTATION for libelle, v in cases if ss.get(f"motif_{libelle}")]
+    return Observations(obs, ss.get('obs_libre', ""), motifs, ss.get('anamnese', ""))
+
+def scores_saisis():
+    return Scores(**{k: st.session_state[k] for k in qglobal.CHAMPS_SCORES})
+
+@st.cache_resource
+def get_cache_exports():
+    """Fichiers DOCX / PDF déjà rendus, partagés entre sessions."""
+    return CacheExports()
+
+def export_differe(fmt, texte, champs):
+    """Rendu d'un export pour download_button : appelé au clic, hors du script, et chronométré."""
+    cache, diagnostics = get_cache_exports(), get_diagnostics()
+    session, utilisateur = st.session_state.get('id_session'), st.session_state.get('user_nom', "")
+    def rendre():
+        with diagnostics.span(f"Export {fmt}", session, utilisateur):
+            return cache.obtenir(fmt, texte, champs)
+    return rendre
+
+@st.cache_resource
+def get_bibliotheque():
+    """Cache bibliothèque partagé par toutes les sessions (préchauffé une fois par processus)."""
+    bibli = Bibliotheque()
+    bibli.prechauffer('.')
+    return bibli
+
+@st.cache_resource(max_entries=2)
+def get_normes(signature):
+    """Tables de normes chargées une fois, rechargées si un fichier de normes/ change."""
+    return TablesNormes.depuis_dossier()
+
+def normes_chargees():
     try:
-        if d_bilan < d_naiss: return 0, 0
-        ans = d_bilan.year - d_naiss.year
-        mois = d_bilan.month - d_naiss.month
-        if d_bilan.day < d_naiss.day: mois -= 1
-        if mois < 0: ans -= 1; mois += 12
-        return ans, mois
-    except: return 0, 0
-
-def check_homogeneite_indice(val1, val2, nom_indice):
-    if val1 == 0 or val2 == 0: return None, ""
-    ecart = abs(val1 - val2)
-    if ecart >= 4: return False, f"⚠️ {nom_indice} Hétérogène (Écart {ecart})"
-    else: return True, f"✅ {nom_indice} Homogène"
-
-def plot_radar_chart(indices_dict):
-    labels = list(indices_dict.keys())
-    values = list(indices_dict.values())
-    if sum(values) == 0: return None
-    values += values[:1]
-    angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False).tolist()
-    angles += angles[:1]
-    fig, ax = plt.subplots(figsize=(4, 4), subplot_kw=dict(polar=True))
-    fig.patch.set_facecolor('#F0EDE8')
-    ax.set_facecolor('#F0EDE8')
-    ax.fill(angles, values, color='#2D6A9F', alpha=0.2)
-    ax.plot(angles, values, color='#1B3A5C', linewidth=2.5, label='Enfant')
-    ax.plot(np.linspace(0, 2*np.pi, 100), [100]*100, color='#C9A84C',
-            linestyle='--', linewidth=1.5, label='Norme (100)')
-    ax.set_yticklabels([])
-    ax.set_xticks(angles[:-1])
-    ax.set_xticklabels(labels, fontsize=10, color='#1B3A5C', fontweight='600')
-    ax.set_ylim(40, 160)
-    ax.grid(color='#E8E4DF', linewidth=0.8)
-    ax.spines['polar'].set_color('#E8E4DF')
-    ax.legend(loc='upper right', bbox_to_anchor=(1.35, 1.15), fontsize='small')
-    return fig
-
-def read_file(file_obj, filename):
-    text = ""
+        return get_normes(signature_normes())
+    except (OSError, ValueError, KeyError, csv.Error) as e:
+        st.error(f"Tables de normes illisibles : {e}")
+        return TablesNormes()
+
+def remplir_indices_normes():
+    """Callback : notes composites, percentiles et IC calculés depuis les subtests."""
+    identite = identite_saisie()
+    resolus = get_normes(signature_normes()).convertir(
+        scores_saisis(), age_en_mois(identite.date_naissance, identite.date_bilan))
+    for k, v in resolus.items():
+        st.session_state[k] = v
+    st.session_state['normes_resolus'] = len(resolus)
+
+@st.cache_resource(max_entries=2)
+def get_tables_ecarts(signature):
+    """Seuils critiques et taux de base (normes/ecarts/), rechargés si un fichier change."""
+    return TablesEcarts.depuis_dossier()
+
+def tables_ecarts_chargees():
     try:
-        if filename.lower().endswith('.pdf'):
-            pdf_reader = PdfReader(file_obj)
-            for page in pdf_reader.pages:
-                t = page.extract_text()
-                text += t + "\n" if t else ""
-        else:
-            stringio = StringIO(file_obj.getvalue().decode("utf-8"))
-            text = stringio.read()
-    except: pass
-    return text
-
-def extract_qglobal_data(text_content):
+        return get_tables_ecarts(signature_normes(DOSSIER_ECARTS))
+    except (OSError, ValueError, KeyError, csv.Error) as e:
+        st.error(f"Tables d'écarts critiques illisibles : {e}")
+        return TablesEcarts()
+
+@st.cache_resource
+def get_registre_sessions():
+    """Taille de l'état des sessions actives (tableau de bord admin)."""
+    return RegistreSessions()
+
+def cle_dossiers():
+    """Secret Streamlit WISC_CLE_DOSSIERS (octets) s'il existe ; sinon None (cle_chiffrement())."""
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
-        Extrais les données WISC-V du texte ci-dessous en JSON.
-        IMPORTANT: Si une valeur est manquante, mets 0 (ou "" pour les dates).
-
-        Variables Scores (Note Standard 1-19): sim, voc, info, comp, cub, puz, mat, bal, arit, memc, memi, seq, cod, sym, bar
-        Indices (Note Composite): qit, icv, ivs, irf, imt, ivt, iag, icc, inv
-        Percentiles: perc_qit, perc_icv, perc_ivs, perc_irf, perc_imt, perc_ivt
-        IC 95% (Bas/Haut): qit_bas, qit_haut, icv_bas, icv_haut... (etc pour tous les indices).
-
-        DATES (Format JJ/MM/AAAA) : date_naissance, date_passation
-
-        TEXTE: {text_content[:9000]}
-        Renvoie UNIQUEMENT un JSON valide.
-        """
-        response = model.generate_content(prompt)
-        json_str = response.text.strip()
-        if "```json" in json_str:
-            json_str = json_str.split("```json")[1].split("```")[0]
-        return json.loads(json_str)
-    except Exception as e:
-        st.error(f"Erreur extraction : {e}")
-        return None
-
-def create_docx(text_content, prenom, age_str):
-    doc = Document()
-    doc.add_heading(f'Compte Rendu WISC-V : {prenom}', 0)
-    doc.add_paragraph(f"Âge au bilan : {age_str}")
-    p = doc.add_paragraph()
-    runner = p.add_run("AVERTISSEMENT : Document de travail. Analyse sous responsabilité du psychologue.")
-    runner.bold = True; runner.italic = True
-    doc.add_paragraph(text_content)
-    bio = io.BytesIO()
-    doc.save(bio)
-    return bio
-
-def create_pdf(text_content, prenom, sexe, age_str, date_bilan_str):
-    """Génère un PDF clinique professionnel avec mise en page soignée."""
-    buf = io.BytesIO()
-
-    # Couleurs
-    BLEU_MARINE  = colors.HexColor('#1B3A5C')
-    BLEU_MOYEN   = colors.HexColor('#2D6A9F')
-    OR_MEDICAL   = colors.HexColor('#C9A84C')
-    GRIS_DOUX    = colors.HexColor('#E8E4DF')
-    GRIS_TEXTE   = colors.HexColor('#6B7280')
-    FOND_CLAIR   = colors.HexColor('#F5F2EE')
-
-    doc = SimpleDocTemplate(
-        buf,
-        pagesize=A4,
-        rightMargin=2*cm, leftMargin=2*cm,
-        topMargin=2.5*cm, bottomMargin=2.5*cm,
-        title=f"Bilan WISC-V - {prenom}",
-        author="Assistant WISC-V"
-    )
+        cle = st.secrets.get("WISC_CLE_DOSSIERS")
+    except FileNotFoundError:   # pas de fichier de secrets
+        cle = None
+    return cle.encode("ascii") if cle else None
+
+@st.cache_resource
+def get_dossiers():
+    """Base locale chiffrée des dossiers patients (une connexion par opération)."""
+    return Dossiers(cle=cle_dossiers())
+
+def clinicien_connecte():
+    return st.session_state.get('user_id', st.session_state.get('user_nom', ""))
+
+def enregistrer_dossier():
+    """Bilan en cours (saisie, analyse, résumé, exports) -> dossier patient."""
+    ss = st.session_state
+    entree = EntreeBilan(identite_saisie(), observations_saisies(), scores_saisis(),
+                         style_redac, ss.get('niveau_detail', "Standard (2-3 pages)"))
+    analyse_texte, champs = ss.get('derniere_analyse', ""), ss.get('identite_export')
+    exports = None
+    if analyse_texte and champs:
+        exports = {fmt: get_cache_exports().obtenir(fmt, analyse_texte, champs) for fmt in FORMATS}
+    ss['dossier_id'] = get_dossiers().enregistrer(
+        entree, clinicien_connecte(), analyse_texte, ss.get('dernier_resume', ""), champs,
+        exports, ss.get('dossier_id'))
+    ss.pop('historique_enfant', None)
+
+def charger_dossier(id_dossier):
+    """Callback : remet un dossier enregistré dans la saisie (avant le rendu des widgets)."""
+    dossier = get_dossiers().ouvrir(id_dossier)
+    if dossier is None:
+        return
+    ss = st.session_state
+    entree = dossier['entree']
+    idt, obs = entree.identite, entree.observations
+    ss['prenom'], ss['sexe'], ss['lateralite'], ss['creole'] = idt.prenom, idt.sexe, idt.lateralite, idt.creole
+    ss['jn'], ss['mn'], ss['an'] = idt.date_naissance.day, idt.date_naissance.month, idt.date_naissance.year
+    ss['jb'], ss['mb'], ss['ab'] = idt.date_bilan.day, idt.date_bilan.month, idt.date_bilan.year
+    for cases in OBSERVATIONS.values():
+        for libelle, v in cases:
+            ss[f"obs_{libelle}"] = v in obs.obs
+    for cases in MOTIFS_CONSULTATION:
+        for libelle, v in cases:
+            ss[f"motif_{libelle}"] = v in obs.motifs
+    ss['obs_libre'], ss['anamnese'] = obs.obs_libre, obs.anamnese
+    for k in qglobal.CHAMPS_SCORES:
+        ss[k] = getattr(entree.scores, k)
+    for k in ('derniere_analyse', 'identite_export', 'dernier_resume', 'import_status'):
+        ss.pop(k, None)
+    if dossier['analyse']:
+        ans, mois = calculer_age(idt.date_naissance, idt.date_bilan)
+        ss['derniere_analyse'] = dossier['analyse']
+        ss['prenom_analyse'], ss['age_analyse'] = idt.prenom, f"{ans}a{mois}m"
+        ss['niveau_detail'] = entree.niveau_detail
+        ss['identite_export'] = dossier['champs_export'] or champs_export(idt)
+    if dossier['resume']:
+        ss['dernier_resume'] = dossier['resume']
+    ss['dossier_id'] = id_dossier
+
+def cle_identite():
+    """Ce dont dépendent l'analyse et l'historique : prénom, dates de naissance et du bilan."""
+    identite = identite_saisie()
+    return normaliser_nom(identite.prenom), identite.date_naissance, identite.date_bilan
+
+def historique_enfant(identite):
+    """Dossiers de l'enfant (prénom + date de naissance), déchiffrés une fois par session
+    et par enfant plutôt qu'à chaque saisie ; oubliés à l'enregistrement d'un dossier."""
+    ss = st.session_state
+    cle = (normaliser_nom(identite.prenom), identite.date_naissance)
+    if ss.get('historique_enfant', (None, None))[0] != cle:
+        ss['historique_enfant'] = (cle, get_dossiers().historique(identite.prenom, identite.date_naissance))
+    return ss['historique_enfant'][1]
+
+def bilans_anterieurs():
+    """Dossiers enregistrés du même enfant (prénom + date de naissance), antérieurs au bilan en cours."""
+    identite = identite_saisie()
+    if not identite.prenom.strip():
+        return []
+    try:
+        dossiers = historique_enfant(identite)
+    except (OSError, ValueError):
+        return []
+    return [d for d in dossiers if d['id'] != st.session_state.get('dossier_id')
+            and d['entree'].identite.date_bilan < identite.date_bilan]
+
+def evolution_saisie(anterieurs=None):
+    """(dates, scores, lignes) des bilans antérieurs retenus puis du bilan en cours."""
+    anterieurs = bilans_anterieurs() if anterieurs is None else anterieurs
+    retenus = [d['entree'] for d in anterieurs if d['id'] in st.session_state.get('bilans_evolution', [])]
+    if not retenus:
+        return [], [], []
+    identite, scores = identite_saisie(), [e.scores for e in retenus] + [scores_saisis()]
+    dates = [e.identite.date_bilan.strftime('%d/%m/%Y') for e in retenus] + [identite.date_bilan.strftime('%d/%m/%Y')]
+    return dates, scores, comparer_bilans(scores)
+
+@st.cache_resource(max_entries=4)
+def get_contexte_complet(selection):
+    """Bibliothèque entière pour le prompt, assemblée une fois par processus et par sélection.
+
+    `selection` : ((fichier, empreinte, erreur de lecture ou None), ...). Toutes
+    les sessions partagent la même chaîne au lieu d'en reconstruire une par rendu.
+    """
+    bibli = get_bibliotheque()
+    return "".join(f"\n--- SOURCE PRIORITAIRE: {f} ---\n{bibli.texte(f) if erreur is None else erreur}\n"
+                   for f, _, erreur in selection)
+
+@st.cache_resource(max_entries=4)
+def get_index_bm25(fichiers, empreintes):
+    """Index BM25 partagé, reconstruit seulement si la sélection d'ouvrages (ou leur contenu) change."""
+    bibli = get_bibliotheque()
+    return IndexBM25.depuis_sources({f: bibli.texte(f) for f in fichiers})
+
+# --- Tâches de fond ---
+# Extraction, compte rendu et résumé tournent dans la file du processus : la
+# session soumet, suit l'avancement dans un fragment actualisé, puis reprend
+# le résultat au rendu suivant. Chaque tâche garde la session qui l'a lancée
+# et l'identité du bilan : son résultat n'est appliqué qu'au même bilan, et
+# une autre session (page rechargée, autre onglet, même compte) ne la reprend
+# que sur demande explicite, en rechargeant l'identité et les scores du bilan
+# d'origine.
+INTERVALLE_SUIVI = 1.0   # secondes entre deux actualisations d'une tâche en cours
+RECENCE_TACHES = 24 * 3600   # tâches d'autres sessions proposées à la reprise (secondes)
+NATURES_BILAN = ("extraction", "rapport", "resume")   # tâches dont le résultat modifie le bilan en cours
+LIBELLES_TACHES = {"extraction": "Extraction du rapport", "import_lot": "Import par lot",
+                   "rapport": "Compte rendu", "resume": "Résumé"}
+
+@st.cache_resource
+def get_file_taches():
+    """File des tâches de fond, partagée par toutes les sessions (chiffrée avec la clé des dossiers)."""
+    return FileTaches(cle=cle_dossiers())
+
+def bilan_courant():
+    """Identité du bilan en cours : dossier enregistré, prénom normalisé et date du bilan."""
+    identite = identite_saisie()
+    return {'dossier': st.session_state.get('dossier_id'), 'prenom': normaliser_nom(identite.prenom),
+            'date_bilan': identite.date_bilan.isoformat()}
+
+def saisie_bilan():
+    """Identité et scores saisis, de quoi rouvrir le bilan depuis une autre session."""
+    ss = st.session_state
+    saisie = {k: ss.get(k) for k in ('prenom', 'sexe', 'lateralite', 'creole', 'jn', 'mn', 'an', 'jb', 'mb', 'ab')}
+    saisie['scores'] = {k: ss[k] for k in qglobal.CHAMPS_SCORES}
+    return saisie
+
+def restaurer_saisie(saisie):
+    """Inverse de saisie_bilan() (avant le rendu des widgets) : le bilan en cours est remplacé."""
+    ss = st.session_state
+    for k, v in saisie.items():
+        if k != 'scores' and v is not None:
+            ss[k] = v
+    ss.update(saisie.get('scores', {}))
+    for k in ('derniere_analyse', 'identite_export', 'dernier_resume', 'import_status', 'dossier_id'):
+        ss.pop(k, None)
+
+def meme_bilan(a, b):
+    """Deux dossiers enregistrés se comparent par identifiant, sinon par prénom et date du bilan."""
+    if a.get('dossier') and b.get('dossier'):
+        return a['dossier'] == b['dossier']
+    return (a.get('prenom'), a.get('date_bilan')) == (b.get('prenom'), b.get('date_bilan'))
+
+def tache_du_bilan(tache):
+    """Vrai si la tâche peut s'appliquer au bilan en cours (l'import par lot n'y touche pas)."""
+    return tache['nature'] not in NATURES_BILAN or meme_bilan(tache['contexte'].get('bilan') or {}, bilan_courant())
+
+def lancer_tache(nature, fonction, *args, contexte=None, **kwargs):
+    """Soumet une tâche au nom du clinicien connecté, avec la session et le bilan
+    qui l'ont lancée ; la session la suit par nature."""
+    ss = st.session_state
+    ss.pop(f'echec_{nature}', None)
+    contexte = {**(contexte or {}), 'session': ss['id_session'], 'bilan': bilan_courant(), 'saisie': saisie_bilan()}
+    ss.setdefault('taches', {})[nature] = get_file_taches().soumettre(
+        nature, fonction, *args, proprietaire=clinicien_connecte(), contexte=contexte, **kwargs)
+
+def tache_en_cours(nature):
+    return nature in st.session_state.get('taches', {})
+
+def appliquer_extraction(donnees, sources):
+    """Champs extraits d'un rapport Q-GLOBAL -> saisie (dates et scores)."""
+    if not donnees:
+        st.session_state['import_status'] = {'success': False, 'msg': "Échec extraction IA.", 'missing': []}
+        return
+    missing = []; count = 0
+    for k, v in donnees.items():
+        if k == 'date_naissance' and v:
+            try:
+                d = v.split('/')
+                st.session_state['jn'] = int(d[0])
+                st.session_state['mn'] = int(d[1])
+                st.session_state['an'] = int(d[2])
+                count += 1
+            except: pass
+        elif k == 'date_passation' and v:
+            try:
+                d = v.split('/')
+                st.session_state['jb'] = int(d[0])
+                st.session_state['mb'] = int(d[1])
+                st.session_state['ab'] = int(d[2])
+                count += 1
+            except: pass
+        elif k in st.session_state:
+            try:
+                if v is None or v == "":
+                    val = 0; missing.append(k)
+                else:
+                    val = float(v)
+                if val == 0 and k not in missing:
+                    missing.append(k)
+                if 'perc' in k:
+                    st.session_state[k] = val
+                else:
+                    st.session_state[k] = int(val)
+                count += 1
+            except:
+                st.session_state[k] = 0
+                missing.append(k)
+    st.session_state['import_status'] = {
+        'success': True,
+        'msg': f"✅ {count} champs importés.",
+        'missing': missing,
+        'sources': sources
+    }
 
-    # Styles
-    styles = getSampleStyleSheet()
-
-    s_titre = ParagraphStyle('titre',
-        fontSize=18, textColor=BLEU_MARINE,
-        fontName='Helvetica-Bold', alignment=TA_LEFT,
-        spaceAfter=4)
-
-    s_sous_titre = ParagraphStyle('sous_titre',
-        fontSize=9, textColor=OR_MEDICAL,
-        fontName='Helvetica-Bold', alignment=TA_LEFT,
-        spaceAfter=16, letterSpacing=1.5)
-
-    s_section = ParagraphStyle('section',
-        fontSize=10, textColor=BLEU_MARINE,
-        fontName='Helvetica-Bold', alignment=TA_LEFT,
-        spaceBefore=14, spaceAfter=6,
-        borderPad=4)
-
-    s_corps = ParagraphStyle('corps',
-        fontSize=9.5, textColor=colors.HexColor('#1a2a3a'),
-        fontName='Helvetica', alignment=TA_JUSTIFY,
-        spaceAfter=8, leading=15)
-
-    s_avert = ParagraphStyle('avert',
-        fontSize=8, textColor=GRIS_TEXTE,
-        fontName='Helvetica-Oblique', alignment=TA_CENTER,
-        spaceAfter=6)
-
-    s_pied = ParagraphStyle('pied',
-        fontSize=7.5, textColor=GRIS_TEXTE,
-        fontName='Helvetica', alignment=TA_CENTER)
-
-    story = []
-
-    # --- En-tête ---
-    story.append(Paragraph("Assistant WISC-V", s_titre))
-    story.append(Paragraph("COMPTE RENDU PSYCHOMÉTRIQUE", s_sous_titre))
-    story.append(HRFlowable(width="100%", thickness=2, color=OR_MEDICAL, spaceAfter=12))
-
-    # --- Tableau identité ---
-    data_id = [
-        ["Prénom", prenom,          "Sexe",       sexe],
-        ["Âge au bilan", age_str,   "Date bilan", date_bilan_str],
-    ]
-    t = Table(data_id, colWidths=[3.5*cm, 6*cm, 3.5*cm, 6*cm])
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (0,-1), FOND_CLAIR),
-        ('BACKGROUND', (2,0), (2,-1), FOND_CLAIR),
-        ('TEXTCOLOR',  (0,0), (0,-1), BLEU_MARINE),
-        ('TEXTCOLOR',  (2,0), (2,-1), BLEU_MARINE),
-        ('FONTNAME',   (0,0), (0,-1), 'Helvetica-Bold'),
-        ('FONTNAME',   (2,0), (2,-1), 'Helvetica-Bold'),
-        ('FONTSIZE',   (0,0), (-1,-1), 9),
-        ('GRID',       (0,0), (-1,-1), 0.5, GRIS_DOUX),
-        ('PADDING',    (0,0), (-1,-1), 6),
-        ('ROWBACKGROUNDS', (0,0), (-1,-1), [colors.white, colors.white]),
-    ]))
-    story.append(t)
-    story.append(Spacer(1, 14))
-
-    # --- Avertissement ---
-    story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX))
-    story.append(Spacer(1, 6))
-    story.append(Paragraph(
-        "AVERTISSEMENT : Document de travail confidentiel — L'analyse clinique et les conclusions restent "
-        "sous la responsabilite exclusive du psychologue.",
-        s_avert))
-    story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX))
-    story.append(Spacer(1, 14))
-
-    # --- Contenu de l'analyse ---
-    def markdown_to_rl(texte):
-        """Convertit le markdown en texte sécurisé pour ReportLab (sans XML mal formé)."""
-        import re
-        # Remplacer les caractères XML spéciaux en premier
-        texte = texte.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        # Gérer le gras : toutes les paires ** → <b>...</b>
-        texte = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', texte)
-        # Supprimer les * restants isolés
-        texte = texte.replace('*', '')
-        return texte
-
-    lignes = text_content.split('\n')
-    for ligne in lignes:
-        ligne = ligne.strip()
-        if not ligne:
-            story.append(Spacer(1, 4))
-        elif ligne.startswith('## ') or ligne.startswith('# '):
-            titre_propre = ligne.lstrip('#').strip()
-            # Nettoyer les balises éventuelles dans les titres
-            titre_propre = re.sub(r'\*+', '', titre_propre)
-            titre_propre = titre_propre.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            story.append(HRFlowable(width="100%", thickness=0.5, color=GRIS_DOUX, spaceBefore=8))
-            story.append(Paragraph(titre_propre.upper(), s_section))
-        elif ligne.startswith('### '):
-            titre_propre = ligne.lstrip('#').strip()
-            story.append(Paragraph(f"<b>{markdown_to_rl(titre_propre)}</b>", s_corps))
-        elif ligne.startswith('- ') or ligne.startswith('* '):
-            story.append(Paragraph(f"• {markdown_to_rl(ligne[2:])}", s_corps))
+def csv_import_lot(id_tache):
+    """CSV d'un import par lot, produit au téléchargement depuis la table des tâches."""
+    return en_csv(get_file_taches().etat(id_tache)['resultat']['enregistrements'])
+
+def appliquer_tache(tache):
+    """Résultat d'une tâche terminée -> st.session_state (avant le rendu des widgets).
+    Retourne False, sans rien modifier, si la tâche porte sur un autre bilan."""
+    ss = st.session_state
+    if not tache_du_bilan(tache):
+        return False
+    nature, resultat, contexte = tache['nature'], tache['resultat'], tache['contexte']
+    if tache['debut'] and tache['fin']:
+        get_diagnostics().noter("Import par lot" if nature == "import_lot" else f"Appel IA · {nature}",
+                                tache['fin'] - tache['debut'], ss.get('id_session'), ss.get('user_nom', ""))
+    if nature == "import_lot":
+        ss['import_lot'] = tache['id']   # résultat volumineux : laissé dans la table
+    elif tache['statut'] != "termine":
+        if nature == "extraction":
+            ss['import_status'] = {'success': False, 'msg': f"Échec extraction IA : {tache['erreur']}", 'missing': []}
         else:
-            story.append(Paragraph(markdown_to_rl(ligne), s_corps))
-
-    # --- Pied de page ---
-    story.append(Spacer(1, 20))
-    story.append(HRFlowable(width="100%", thickness=1, color=OR_MEDICAL))
-    story.append(Spacer(1, 6))
-    story.append(Paragraph(
-        f"Document généré le {date.today().strftime('%d/%m/%Y')} · Assistant WISC-V · "
-        "Confidentiel — Secret professionnel",
-        s_pied))
+            ss[f'echec_{nature}'] = tache['erreur']
+    elif nature == "extraction":
+        appliquer_extraction(resultat['donnees'], resultat['sources'])
+    elif nature == "rapport":
+        ss['derniere_analyse'] = resultat.pop('texte')
+        ss['prenom_analyse'], ss['age_analyse'] = contexte['prenom'], contexte['age']
+        ss['niveau_detail'] = contexte['niveau_detail']
+        ss['identite_export'] = contexte['identite_export']
+        ss['passages_selectionnes'] = contexte['passages']
+        ss['latence_analyse'] = {'ttft': resultat['ttft'], 'total': resultat['duree']}
+        ss['mesures_analyse'] = {**resultat, 'retires': contexte['retires'], 'plafond': contexte['plafond']}
+    elif nature == "resume":
+        ss['dernier_resume'] = resultat['texte']
+        ss['latence_resume'] = {'ttft': resultat['ttft'], 'total': resultat['duree']}
+    return True
+
+def reprendre_tache(id_tache):
+    """Callback : la session adopte une tâche lancée depuis une autre session. Si elle
+    porte sur un autre bilan, celui-ci est d'abord rouvert (dossier enregistré, sinon
+    identité et scores saisis au lancement) pour que le résultat s'y applique."""
+    tache = get_file_taches().etat(id_tache)
+    if tache is None:
+        return
+    if not tache_du_bilan(tache):
+        id_dossier = (tache['contexte'].get('bilan') or {}).get('dossier')
+        if id_dossier:
+            charger_dossier(id_dossier)
+        if not tache_du_bilan(tache) and tache['contexte'].get('saisie'):   # pas de dossier (ou supprimé)
+            restaurer_saisie(tache['contexte']['saisie'])
+    st.session_state.setdefault('taches_reprises', []).append(id_tache)
+
+def abandonner_tache(id_tache):
+    """Callback : résultat non repris, retiré de la liste des tâches à récupérer."""
+    get_file_taches().marquer_recuperee(id_tache)
+
+def recuperer_taches():
+    """Tâches lancées (ou reprises) par cette session : résultats terminés repris dans
+    la saisie s'ils portent sur le bilan en cours, tâches en cours suivies.
+
+    Les autres restent dans la file : celles de cette session attendent le retour à
+    leur bilan (ss['taches_en_suspens']) ; les tâches récentes des autres sessions du
+    clinicien (page rechargée, autre onglet) sont proposées à la reprise
+    (ss['taches_autres']), quel que soit le bilan affiché.
+    """
+    ss = st.session_state
+    file_taches = get_file_taches()
+    reprises = ss.get('taches_reprises', [])
+    ss['taches_en_suspens'], ss['taches_autres'] = [], []
+    for tache in file_taches.a_recuperer(clinicien_connecte()):
+        resume = {'id': tache['id'], 'nature': tache['nature'], 'statut': tache['statut'], 'cree': tache['cree'],
+                  'prenom': (tache['contexte'].get('saisie') or {}).get('prenom', ""),
+                  'ce_bilan': tache_du_bilan(tache)}
+        if tache['contexte'].get('session') != ss['id_session'] and tache['id'] not in reprises:
+            if tache['cree'] >= time.time() - RECENCE_TACHES:
+                ss['taches_autres'].append(resume)
+            continue
+        if tache['statut'] in EN_COURS:
+            ss.setdefault('taches', {})[tache['nature']] = tache['id']
+            continue
+        if ss.get('taches', {}).get(tache['nature']) == tache['id']:
+            del ss['taches'][tache['nature']]
+        if appliquer_tache(tache):
+            file_taches.marquer_recuperee(tache['id'])
+        else:
+            ss['taches_en_suspens'].append(resume)
+
+@st.fragment(run_every=INTERVALLE_SUIVI)
+def suivre_tache(nature, message):
+    """Avancement d'une tâche (texte partiel compris), actualisé sans bloquer la page ;
+    la page entière est relancée à la fin pour en reprendre le résultat."""
+    taches = st.session_state.get('taches', {})
+    tache = get_file_taches().etat(taches[nature]) if nature in taches else None
+    if tache is None or tache['statut'] not in EN_COURS:
+        taches.pop(nature, None)
+        st.rerun()
+    if tache['statut'] == "attente":
+        st.caption(f"⏳ {message} : en attente d'un créneau...")
+        if st.button("Annuler", key=f"annuler_{nature}") and get_file_taches().annuler(tache['id']):
+            taches.pop(nature, None)
+            st.rerun()
+        return
+    st.caption(f"⏳ {message} ({time.time() - tache['debut']:.0f} s) · vous pouvez continuer la saisie.")
+    if tache['partiel']:
+        st.markdown(tache['partiel'] + " ▌")
 
-    doc.build(story)
-    buf.seek(0)
-    return buf
+recuperer_taches()
 
 # ==========================================
 # 8. SIDEBAR
 # ==========================================
 knowledge_base = ""
+sources_actives = []
+selection_ciblee, budget_contexte = False, BUDGET_TOKENS_DEFAUT
 with st.sidebar:
     # --- Utilisateur connecté ---
     st.markdown(f"""
@@ -803,6 +1035,21 @@ with st.sidebar:
             del st.session_state[key]
         st.rerun()
 
+    # --- Tâches non reprises (autre bilan, autre session) ---
+    if st.session_state['taches_en_suspens'] or st.session_state['taches_autres']:
+        with st.expander("🕓 Tâches non reprises"):
+            for t in st.session_state['taches_en_suspens']:
+                st.caption(f"{LIBELLES_TACHES[t['nature']]} · {time.strftime('%H:%M', time.localtime(t['cree']))} · "
+                           "lancée pour un autre bilan : reprise au retour sur ce bilan.")
+                st.button("Abandonner", key=f"abandonner_{t['id']}", on_click=abandonner_tache, args=(t['id'],))
+            for t in st.session_state['taches_autres']:
+                etat = "en cours" if t['statut'] in EN_COURS else "terminée"
+                bilan = "ce bilan" if t['ce_bilan'] else f"le bilan de {t['prenom'] or 'un enfant sans prénom'}"
+                st.caption(f"{LIBELLES_TACHES[t['nature']]} · {time.strftime('%H:%M', time.localtime(t['cree']))} · "
+                           f"{etat}, lancée depuis une autre session pour {bilan}.")
+                st.button("Reprendre" if t['ce_bilan'] else "Rouvrir ce bilan et reprendre",
+                          key=f"reprendre_{t['id']}", on_click=reprendre_tache, args=(t['id'],))
+
     st.header("⚙️ Configuration")
     style_redac = st.radio(
         "Destinataire / Style",
@@ -822,86 +1069,139 @@ with st.sidebar:
         status = st.session_state['import_status']
         if status['success']:
             st.success(status['msg'])
+            sources_import = status.get('sources', {})
+            if sources_import:
+                par_ia = [k for k, v in sources_import.items() if v == "IA"]
+                par_normes = sum(1 for v in sources_import.values() if v == "normes")
+                st.caption(f"🔎 Parser local : {len(sources_import) - len(par_ia) - par_normes} champs · "
+                           f"🧮 Normes : {par_normes} champs · 🤖 IA : {len(par_ia)} champs")
+                if par_ia:
+                    with st.expander("Champs complétés par l'IA"):
+                        st.text(", ".join(par_ia))
             if status['missing']:
                 st.warning(f"⚠️ Manquant (mis à 0) :\n" + ", ".join(status['missing']))
         else:
             st.error(status['msg'])
 
-    if uploaded_qglobal and st.button("🚀 Extraire Données", type="primary"):
-        with st.spinner("Analyse IA en cours..."):
-            raw = read_file(uploaded_qglobal, uploaded_qglobal.name)
-            data_ex = extract_qglobal_data(raw)
-            missing = []; count = 0
-            if data_ex:
-                for k, v in data_ex.items():
-                    if k == 'date_naissance' and v:
-                        try:
-                            d = v.split('/')
-                            st.session_state['jn'] = int(d[0])
-                            st.session_state['mn'] = int(d[1])
-                            st.session_state['an'] = int(d[2])
-                            count += 1
-                        except: pass
-                    elif k == 'date_passation' and v:
-                        try:
-                            d = v.split('/')
-                            st.session_state['jb'] = int(d[0])
-                            st.session_state['mb'] = int(d[1])
-                            st.session_state['ab'] = int(d[2])
-                            count += 1
-                        except: pass
-                    elif k in st.session_state:
-                        try:
-                            if v is None or v == "":
-                                val = 0; missing.append(k)
-                            else:
-                                val = float(v)
-                            if val == 0 and k not in missing:
-                                missing.append(k)
-                            if 'perc' in k:
-                                st.session_state[k] = val
-                            else:
-                                st.session_state[k] = int(val)
-                            count += 1
-                        except:
-                            st.session_state[k] = 0
-                            missing.append(k)
-                st.session_state['import_status'] = {
-                    'success': True,
-                    'msg': f"✅ {count} champs importés.",
-                    'missing': missing
-                }
-                st.rerun()
+    if tache_en_cours("extraction"):
+        suivre_tache("extraction", "Extraction du rapport")
+    elif uploaded_qglobal and st.button("🚀 Extraire Données", type="primary"):
+        lancer_tache("extraction", tache_extraction, uploaded_qglobal.name, uploaded_qglobal.getvalue(),
+                     normes=normes_chargees())
+        st.rerun()
+
+    with st.expander("📦 Import par lot"):
+        rapports_lot = st.file_uploader(
+            "Rapports Q-GLOBAL",
+            type=['pdf', 'txt'],
+            accept_multiple_files=True,
+            key=f"lot_{st.session_state.uploader_key}"
+        )
+        ia_lot = st.checkbox("Compléter les champs manquants avec l'IA", value=False, key="lot_ia")
+        if rapports_lot and st.button("📦 Lancer l'import par lot", disabled=tache_en_cours("import_lot")):
+            lancer_tache("import_lot", tache_import_lot, [(f.name, f.getvalue()) for f in rapports_lot],
+                         ia=ia_lot, normes=normes_chargees())
+
+        if tache_en_cours("import_lot"):
+            suivre_tache("import_lot", "Import par lot")
+        elif st.session_state.get('import_lot'):
+            # Résultat relu dans la table des tâches : la session n'en garde que l'identifiant
+            tache_lot = get_file_taches().etat(st.session_state['import_lot'])
+            if tache_lot is None:
+                st.session_state.pop('import_lot')
+            elif tache_lot['statut'] != "termine":
+                st.error(f"Erreur import par lot : {tache_lot['erreur']}")
             else:
-                st.session_state['import_status'] = {
-                    'success': False,
-                    'msg': "Échec extraction IA.",
-                    'missing': []
-                }
+                rapport_lot = tache_lot['resultat']['rapport']
+                st.success(f"✅ {len(tache_lot['resultat']['enregistrements'])} / {len(rapport_lot)} rapports importés.")
+                st.dataframe([
+                    {c: ", ".join(r[c]) if isinstance(r[c], list) else r[c] for c in COLONNES_RAPPORT}
+                    for r in rapport_lot
+                ])
+                st.download_button(
+                    "⬇️ Télécharger les résultats (.csv)",
+                    partial(csv_import_lot, tache_lot['id']),
+                    "import_lot_wisc.csv",
+                    "text/csv",
+                    on_click="ignore"
+                )
+
+    with st.expander("🗂️ Dossiers patients"):
+        try:
+            dossiers = get_dossiers()
+        except (OSError, ValueError) as e:
+            st.error(f"Base des dossiers indisponible : {e}")
+        else:
+            id_courant = st.session_state.get('dossier_id')
+            if st.button("💾 Mettre à jour le dossier" if id_courant else "💾 Enregistrer le bilan en cours",
+                         use_container_width=True):
+                try:
+                    enregistrer_dossier()
+                    st.success(f"✅ Dossier n° {st.session_state['dossier_id']} enregistré.")
+                except (OSError, ValueError) as e:
+                    st.error(f"Enregistrement impossible : {e}")
+            nom_recherche = st.text_input("Prénom (recherche exacte, sans accents ni casse)", key="recherche_dossier")
+            mes_dossiers = st.checkbox("Mes dossiers uniquement", value=True, key="mes_dossiers")
+            try:
+                liste_dossiers = dossiers.lister(nom=nom_recherche.strip() or None,
+                                                 clinicien=clinicien_connecte() if mes_dossiers else None)
+            except ValueError as e:
+                st.error(str(e))
+                liste_dossiers = []
+            if liste_dossiers:
+                choix_dossier = st.selectbox(
+                    "Dossiers récents", liste_dossiers,
+                    format_func=lambda d: f"{d['prenom'] or '(sans prénom)'} · {d['age']} · bilan du {d['date_bilan']}",
+                    key="choix_dossier")
+                st.button("📂 Ouvrir", on_click=charger_dossier, args=(choix_dossier['id'],),
+                          use_container_width=True)
+                for fmt in choix_dossier['formats']:
+                    st.download_button(
+                        f"⬇️ Export enregistré (.{fmt})",
+                        partial(dossiers.export, choix_dossier['id'], fmt),
+                        f"Bilan_WISC5_{choix_dossier['prenom']}.{fmt}",
+                        FORMATS[fmt],
+                        on_click="ignore",
+                        key=f"export_dossier_{fmt}",
+                        use_container_width=True
+                    )
+            else:
+                st.caption("Aucun dossier enregistré.")
 
     st.divider()
     st.header("📚 Bibliothèque")
-    local_files = [
-        f for f in os.listdir('.')
-        if f.lower().endswith(('.pdf', '.txt'))
-        and f not in ["requirements.txt", "app.py"]
-    ]
-    if local_files:
-        for f in local_files:
-            if st.checkbox(f"📄 {f}", value=True, key=f):
-                try:
-                    with open(f, 'rb') as fh:
-                        import io as _io
-                        file_obj = _io.BytesIO(fh.read())
-                    c = read_file(file_obj, f)
-                except Exception as e:
-                    c = f"[Erreur lecture {f} : {e}]"
-                knowledge_base += f"\n--- SOURCE PRIORITAIRE: {f} ---\n{c}\n"
-        st.caption(f"Contexte : {len(knowledge_base)} chars")
-        with st.expander("👀 Vérifier le contenu lu par l'IA"):
-            st.text(knowledge_base[:3000] + "...")
-    else:
-        st.warning("Aucun PDF importé. Importez vos ouvrages de référence ci-dessous.")
+    with span("Bibliothèque (barre latérale)"):
+        bibliotheque = get_bibliotheque()
+        local_files = lister_sources('.')
+        if local_files:
+            lignes_stats, selection = [], []
+            for f in local_files:
+                if st.checkbox(f"📄 {f}", value=True, key=f):
+                    try:
+                        selection.append((f, bibliotheque.empreinte(f), None))
+                        n = bibliotheque.stats(f)
+                    except Exception as e:
+                        selection.append((f, None, f"[Erreur lecture {f} : {e}]"))
+                    else:
+                        sources_actives.append(f)
+                        lignes_stats.append(
+                            f"{f[:28]} : {n['brut']:,} → {n['net']:,} car. "
+                            f"(~{tokens_pour_caracteres(n['brut']):,} → ~{tokens_pour_caracteres(n['net']):,} tokens)"
+                            .replace(",", " ")
+                        )
+            knowledge_base = get_contexte_complet(tuple(selection))
+            st.caption("  \n".join(
+                [f"Contexte : {len(knowledge_base):,} chars (~{estimer_tokens(knowledge_base):,} tokens)".replace(",", " ")]
+                + lignes_stats
+            ))
+            selection_ciblee = st.checkbox("🎯 Sélection ciblée des passages", value=True,
+                help="N'envoie à l'IA que les passages de la bibliothèque pertinents pour le profil")
+            budget_contexte = st.number_input("Budget contexte (tokens)", 1000, 200000,
+                BUDGET_TOKENS_DEFAUT, step=1000, disabled=not selection_ciblee)
+            with st.expander("👀 Vérifier le contenu lu par l'IA"):
+                st.text(knowledge_base[:3000] + "...")
+        else:
+            st.warning("Aucun PDF importé. Importez vos ouvrages de référence ci-dessous.")
 
     st.divider()
     st.header("📖 Ressources recommandées")
@@ -967,6 +1267,29 @@ with st.sidebar:
 
     st.caption("⚠️ Ces ouvrages sont vendus par leurs éditeurs. Vous êtes responsable de votre licence d'utilisation.")
 
+    if st.session_state.get('user_role') == "admin":
+        st.divider()
+        st.header("🔧 Client IA")
+        metriques_ia = get_client().metriques()
+        stats_cache = metriques_ia['cache']
+        st.caption(
+            f"Backend : **{metriques_ia['backend']}** · Appels : **{metriques_ia['appels']}** · "
+            f"Erreurs : **{metriques_ia['erreurs']}** · Nouvelles tentatives : **{metriques_ia['nouvelles_tentatives']}**  \n"
+            f"Latence p50 / p95 : {metriques_ia.get('latence_p50', 0):.1f} s / {metriques_ia.get('latence_p95', 0):.1f} s  \n"
+            f"Tokens entrée / sortie : {metriques_ia['tokens_entree']} / {metriques_ia['tokens_sortie']}  \n"
+            f"Cache — Hits : **{stats_cache['hits']}** · Misses : **{stats_cache['misses']}** · "
+            f"{stats_cache['entrees']} réponses ({stats_cache['taille'] / 1024:.0f} Ko)"
+        )
+        if st.button("Vider le cache IA"):
+            get_client().cache.vider()
+            st.rerun()
+        st.number_input("Plafond du prompt (tokens)", 1000, 1000000, PLAFOND_PROMPT, step=10000,
+                        key="plafond_prompt", help="Au-delà, la bibliothèque est rognée en premier, puis l'anamnèse")
+        st.toggle("📊 Tableau de bord des appels IA", key="afficher_tableau_ia")
+        st.toggle("⏱️ Temps serveur par section", key="afficher_chronos")
+        st.toggle("🧮 Mémoire par session", key="afficher_memoire")
+        st.toggle("🩺 Diagnostics (temps par bloc)", key="afficher_diagnostics")
+
     st.divider()
     if not st.session_state.reset_confirm:
         if st.button("🗑️ Nouvelle Analyse (Reset)", type="secondary"):
@@ -986,539 +1309,671 @@ with st.sidebar:
 # ==========================================
 # 9. INTERFACE PRINCIPALE
 # ==========================================
+def chrono_section(nom, debut):
+    """Temps serveur d'une section, affiché si l'administrateur l'a demandé."""
+    ms = (time.perf_counter() - debut) * 1000
+    st.session_state.setdefault('chronos', {})[nom] = ms
+    noter_span(f"Section · {nom}", debut)
+    if st.session_state.get('afficher_chronos'):
+        st.caption(f"⏱️ {nom} : {ms:.0f} ms")
+
+def couleur_note(val):
+    """Retourne une couleur selon la note standard."""
+    if val == 0: return ""
+    if val <= 6:   return "🔴"
+    if val <= 9:   return "🟠"
+    if val <= 12:  return "🟡"
+    if val <= 15:  return "🟢"
+    return "🔵"
 
 # --- Section 1 : Identité ---
-st.markdown("""
-<div style="
-    background: white;
-    border-radius: 12px;
-    padding: 1.2rem 1.5rem 0.5rem 1.5rem;
-    border: 1px solid #E8E4DF;
-    box-shadow: 0 2px 12px rgba(0,0,0,0.05);
-    margin-bottom: 1rem;
-">
-<h2 style="margin-top:0 !important;">1. Identité</h2>
-""", unsafe_allow_html=True)
+@st.fragment
+def section_identite():
+    debut = time.perf_counter()
+    st.markdown("""
+    <div style="
+        background: white;
+        border-radius: 12px;
+        padding: 1.2rem 1.5rem 0.5rem 1.5rem;
+        border: 1px solid #E8E4DF;
+        box-shadow: 0 2px 12px rgba(0,0,0,0.05);
+        margin-bottom: 1rem;
+    ">
+    <h2 style="margin-top:0 !important;">1. Identité</h2>
+    """, unsafe_allow_html=True)
 
-c1, c2, c3 = st.columns(3)
-with c1:
-    st.markdown("**Prénom**")
-    prenom = st.text_input("Prénom", placeholder="Ex : Lucas", label_visibility="collapsed")
-    st.markdown("**Sexe**")
-    sexe = st.radio("Sexe", ["Garçon", "Fille"], horizontal=True, label_visibility="collapsed")
-    st.markdown("**Latéralité**")
-    lateralite = st.radio("Latéralité", ["Droitier", "Gaucher"], horizontal=True, label_visibility="collapsed")
-with c2:
-    st.markdown("**Date de naissance**")
-    cj, cm, ca = st.columns([1, 1, 1.5])
-    with cj: jn = st.number_input("Jour", 1, 31, key="jn")
-    with cm: mn = st.number_input("Mois", 1, 12, key="mn")
-    with ca: an = st.number_input("Année", 2000, 2030, key="an")
-    try: dn = date(an, mn, jn)
-    except: dn = date.today()
-with c3:
-    st.markdown("**Date du bilan**")
-    cj, cm, ca = st.columns([1, 1, 1.5])
-    with cj: jb = st.number_input("Jour ", 1, 31, key="jb")
-    with cm: mb = st.number_input("Mois ", 1, 12, key="mb")
-    with ca: ab = st.number_input("Année ", 2020, 2030, key="ab")
-    try: dt = date(ab, mb, jb)
-    except: dt = date.today()
-    ans, mois = calculer_age(dn, dt)
-    st.markdown("**Âge au bilan**")
-    st.success(f"{ans} ans {mois} mois")
-
-st.markdown("</div>", unsafe_allow_html=True)
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.markdown("**Prénom**")
+        st.text_input("Prénom", placeholder="Ex : Lucas", key="prenom", label_visibility="collapsed")
+        st.markdown("**Sexe**")
+        st.radio("Sexe", ["Garçon", "Fille"], horizontal=True, key="sexe", label_visibility="collapsed")
+        st.markdown("**Latéralité**")
+        st.radio("Latéralité", ["Droitier", "Gaucher"], horizontal=True, key="lateralite", label_visibility="collapsed")
+    with c2:
+        st.markdown("**Date de naissance**")
+        cj, cm, ca = st.columns([1, 1, 1.5])
+        with cj: jn = st.number_input("Jour", 1, 31, key="jn")
+        with cm: mn = st.number_input("Mois", 1, 12, key="mn")
+        with ca: an = st.number_input("Année", 2000, 2030, key="an")
+        try: dn = date(an, mn, jn)
+        except: dn = date.today()
+    with c3:
+        st.markdown("**Date du bilan**")
+        cj, cm, ca = st.columns([1, 1, 1.5])
+        with cj: jb = st.number_input("Jour ", 1, 31, key="jb")
+        with cm: mb = st.number_input("Mois ", 1, 12, key="mb")
+        with ca: ab = st.number_input("Année ", 2020, 2030, key="ab")
+        try: dt = date(ab, mb, jb)
+        except: dt = date.today()
+        ans, mois = calculer_age(dn, dt)
+        st.markdown("**Âge au bilan**")
+        st.success(f"{ans} ans {mois} mois")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+    chrono_section("Identité", debut)
+    # Prénom ou dates modifiés : l'analyse (comparaisons selon l'âge, historique)
+    # est dans le fragment de psychométrie, toute la page est relancée.
+    if cle_identite() != st.session_state.get('identite_rendue'):
+        st.rerun()
+
+st.session_state['identite_rendue'] = cle_identite()   # identité vue par ce rendu complet
+section_identite()
 
 # --- Section 2 : Clinique ---
-st.markdown("""
-<div style="
-    background: white;
-    border-radius: 12px;
-    padding: 1.2rem 1.5rem 0.5rem 1.5rem;
-    border: 1px solid #E8E4DF;
-    box-shadow: 0 2px 12px rgba(0,0,0,0.05);
-    margin-bottom: 1rem;
-">
-<h2 style="margin-top:0 !important;">2. Observations Cliniques</h2>
-""", unsafe_allow_html=True)
+@st.fragment
+def section_observations():
+    debut = time.perf_counter()
+    st.markdown("""
+    <div style="
+        background: white;
+        border-radius: 12px;
+        padding: 1.2rem 1.5rem 0.5rem 1.5rem;
+        border: 1px solid #E8E4DF;
+        box-shadow: 0 2px 12px rgba(0,0,0,0.05);
+        margin-bottom: 1rem;
+    ">
+    <h2 style="margin-top:0 !important;">2. Observations Cliniques</h2>
+    """, unsafe_allow_html=True)
 
-c1, c2, c3 = st.columns(3)
-obs = []
-with c1:
-    st.markdown("**Attitude**")
-    if st.checkbox("Anxiété"): obs.append("Anxiété perf.")
-    if st.checkbox("Opposition"): obs.append("Opposition")
-    if st.checkbox("Agitation"): obs.append("Agitation")
-    if st.checkbox("Impulsivité"): obs.append("Impulsivité")
-with c2:
-    st.markdown("**Cognition**")
-    if st.checkbox("Fatigabilité"): obs.append("Fatigabilité")
-    if st.checkbox("Inattention"): obs.append("Inattention")
-    if st.checkbox("Besoin relance"): obs.append("Besoin relance")
-    if st.checkbox("Verbal +++"): obs.append("Logorrhée")
-    if st.checkbox("Verbal ---"): obs.append("Mutisme/Pauvreté")
-with c3:
-    st.markdown("**Graphisme**")
-    if st.checkbox("Crispation"): obs.append("Crispation")
-    if st.checkbox("Lenteur graph."): obs.append("Lenteur graph.")
+    c1, c2, c3 = st.columns(3)
+    for col, (groupe, cases) in zip((c1, c2, c3), OBSERVATIONS.items()):
+        with col:
+            st.markdown(f"**{groupe}**")
+            for libelle, _ in cases:
+                st.checkbox(libelle, key=f"obs_{libelle}")
+    with c3:
+        st.markdown("---")
+        st.markdown("🗣️ **Langue / Créole**")
+        st.radio(
+            "Usage créole",
+            CHOIX_CREOLE,
+            index=0,
+            key="creole",
+            label_visibility="collapsed"
+        )
+
+    st.markdown("**🎯 Motif de consultation**")
+    motifs_col1, motifs_col2 = st.columns(2)
+    for col, cases in zip((motifs_col1, motifs_col2), MOTIFS_CONSULTATION):
+        with col:
+            for libelle, _ in cases:
+                st.checkbox(libelle, key=f"motif_{libelle}")
     st.markdown("---")
-    st.markdown("🗣️ **Langue / Créole**")
-    creole = st.radio(
-        "Usage créole",
-        ["-- (Non/Peu)", "+- (Moyen)", "++ (Dominant)"],
-        index=0,
-        label_visibility="collapsed"
+    st.text_area("Observations libres", height=70, key="obs_libre")
+    st.text_area(
+        "📋 Anamnèse (contexte développemental, scolarité, antécédents...)",
+        placeholder="Ex : Suivi orthophonique depuis 6 ans, redoublement en CE2, parents séparés, fratrie...",
+        height=100,
+        key="anamnese"
     )
 
-st.markdown("**🎯 Motif de consultation**")
-motifs_col1, motifs_col2 = st.columns(2)
-motifs = []
-with motifs_col1:
-    if st.checkbox("Difficultés scolaires"): motifs.append("Difficultés scolaires")
-    if st.checkbox("Suspicion TDAH"): motifs.append("Suspicion TDAH")
-    if st.checkbox("Suspicion TSA"): motifs.append("Suspicion TSA")
-    if st.checkbox("Suspicion HPI / Douance"): motifs.append("Suspicion HPI/Douance")
-with motifs_col2:
-    if st.checkbox("Orientation MDPH / RQTH"): motifs.append("Orientation MDPH/RQTH")
-    if st.checkbox("Bilan de rééducation"): motifs.append("Bilan de rééducation")
-    if st.checkbox("Suivi psy / thérapeutique"): motifs.append("Suivi psy/thérapeutique")
-    if st.checkbox("Autre motif"): motifs.append("Autre (voir anamnèse)")
-st.markdown("---")
-obs_libre = st.text_area("Observations libres", height=70)
-ana = st.text_area(
-    "📋 Anamnèse (contexte développemental, scolarité, antécédents...)",
-    placeholder="Ex : Suivi orthophonique depuis 6 ans, redoublement en CE2, parents séparés, fratrie...",
-    height=100
-)
+    st.markdown("</div>", unsafe_allow_html=True)
+    chrono_section("Observations", debut)
 
-st.markdown("</div>", unsafe_allow_html=True)
+section_observations()
 
 # --- Section 3 : Psychométrie ---
-st.markdown("""
-<div style="
-    background: white;
-    border-radius: 12px;
-    padding: 1.2rem 1.5rem 1rem 1.5rem;
-    border: 1px solid #E8E4DF;
-    box-shadow: 0 2px 12px rgba(0,0,0,0.05);
-    margin-bottom: 1rem;
-">
-<h2 style="margin-top:0 !important;">3. Psychométrie</h2>
-""", unsafe_allow_html=True)
+@st.fragment
+def section_psychometrie():
+    debut = time.perf_counter()
+    st.markdown("""
+    <div style="
+        background: white;
+        border-radius: 12px;
+        padding: 1.2rem 1.5rem 1rem 1.5rem;
+        border: 1px solid #E8E4DF;
+        box-shadow: 0 2px 12px rgba(0,0,0,0.05);
+        margin-bottom: 1rem;
+    ">
+    <h2 style="margin-top:0 !important;">3. Psychométrie</h2>
+    """, unsafe_allow_html=True)
 
-st.subheader("A. Subtests (Notes Standard)")
+    st.subheader("A. Subtests (Notes Standard)")
 
-def couleur_note(val):
-    """Retourne une couleur selon la note standard."""
-    if val == 0: return ""
-    if val <= 6:   return "🔴"
-    if val <= 9:   return "🟠"
-    if val <= 12:  return "🟡"
-    if val <= 15:  return "🟢"
-    return "🔵"
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.number_input(f"SIM {couleur_note(st.session_state.get('sim',0))}", 0, 19, key="sim")
+    with c2: st.number_input(f"VOC {couleur_note(st.session_state.get('voc',0))}", 0, 19, key="voc")
+    with c3: st.number_input(f"INF {couleur_note(st.session_state.get('info',0))}", 0, 19, key="info")
+    with c4: st.number_input(f"COM {couleur_note(st.session_state.get('comp',0))}", 0, 19, key="comp")
+
+    c1, c2 = st.columns(2)
+    with c1: st.number_input(f"CUB {couleur_note(st.session_state.get('cub',0))}", 0, 19, key="cub")
+    with c2: st.number_input(f"PUZ {couleur_note(st.session_state.get('puz',0))}", 0, 19, key="puz")
 
-c1, c2, c3, c4 = st.columns(4)
-with c1: sim  = st.number_input(f"SIM {couleur_note(st.session_state.get('sim',0))}", 0, 19, key="sim")
-with c2: voc  = st.number_input(f"VOC {couleur_note(st.session_state.get('voc',0))}", 0, 19, key="voc")
-with c3: info = st.number_input(f"INF {couleur_note(st.session_state.get('info',0))}", 0, 19, key="info")
-with c4: comp = st.number_input(f"COM {couleur_note(st.session_state.get('comp',0))}", 0, 19, key="comp")
-
-c1, c2 = st.columns(2)
-with c1: cub = st.number_input(f"CUB {couleur_note(st.session_state.get('cub',0))}", 0, 19, key="cub")
-with c2: puz = st.number_input(f"PUZ {couleur_note(st.session_state.get('puz',0))}", 0, 19, key="puz")
-
-c1, c2, c3 = st.columns(3)
-with c1: mat  = st.number_input(f"MAT {couleur_note(st.session_state.get('mat',0))}", 0, 19, key="mat")
-with c2: bal  = st.number_input(f"BAL {couleur_note(st.session_state.get('bal',0))}", 0, 19, key="bal")
-with c3: arit = st.number_input(f"ARI {couleur_note(st.session_state.get('arit',0))}", 0, 19, key="arit")
-
-c1, c2, c3 = st.columns(3)
-with c1: memc = st.number_input(f"MCH {couleur_note(st.session_state.get('memc',0))}", 0, 19, key="memc")
-with c2: memi = st.number_input(f"MIM {couleur_note(st.session_state.get('memi',0))}", 0, 19, key="memi")
-with c3: seq  = st.number_input(f"SLC {couleur_note(st.session_state.get('seq',0))}", 0, 19, key="seq")
-
-c1, c2, c3 = st.columns(3)
-with c1: cod = st.number_input(f"COD {couleur_note(st.session_state.get('cod',0))}", 0, 19, key="cod")
-with c2: sym = st.number_input(f"SYM {couleur_note(st.session_state.get('sym',0))}", 0, 19, key="sym")
-with c3: bar = st.number_input(f"BAR {couleur_note(st.session_state.get('bar',0))}", 0, 19, key="bar")
-
-st.caption("🔴 ≤6 Très faible · 🟠 7-9 Faible · 🟡 10-12 Moyen · 🟢 13-15 Supérieur · 🔵 ≥16 Très supérieur")
-
-st.markdown("---")
-st.subheader("B. Indices (Note / Percentile / Intervalle de confiance)")
-
-# Homogénéité
-vicv, ticv = check_homogeneite_indice(sim, voc, "ICV")
-vivs, tivs = check_homogeneite_indice(cub, puz, "IVS")
-virf, tirf = check_homogeneite_indice(mat, bal, "IRF")
-vimt, timt = check_homogeneite_indice(memc, memi, "IMT")
-vivt, tivt = check_homogeneite_indice(sym, cod, "IVT")
-nb_inv = sum([1 for x in [vicv, vivs, virf, vimt, vivt] if x is False])
-
-# --- Indices principaux (en premier) ---
-c1, c2, c3, c4, c5 = st.columns(5)
-with c1:
-    st.markdown("**ICV**")
-    icv = st.number_input("Note ICV", 0, 160, key="icv", label_visibility="collapsed")
-    perc_icv = st.number_input("P_ICV", 0, 100, key="perc_icv", label_visibility="collapsed")
-    icv_bas = st.number_input("IC Bas ICV", 0, 160, key="icv_bas")
-    icv_haut = st.number_input("IC Haut ICV", 0, 160, key="icv_haut")
-    if ticv: st.caption(ticv)
-with c2:
-    st.markdown("**IVS**")
-    ivs = st.number_input("Note IVS", 0, 160, key="ivs", label_visibility="collapsed")
-    perc_ivs = st.number_input("P_IVS", 0, 100, key="perc_ivs", label_visibility="collapsed")
-    ivs_bas = st.number_input("IC Bas IVS", 0, 160, key="ivs_bas")
-    ivs_haut = st.number_input("IC Haut IVS", 0, 160, key="ivs_haut")
-    if tivs: st.caption(tivs)
-with c3:
-    st.markdown("**IRF**")
-    irf = st.number_input("Note IRF", 0, 160, key="irf", label_visibility="collapsed")
-    perc_irf = st.number_input("P_IRF", 0, 100, key="perc_irf", label_visibility="collapsed")
-    irf_bas = st.number_input("IC Bas IRF", 0, 160, key="irf_bas")
-    irf_haut = st.number_input("IC Haut IRF", 0, 160, key="irf_haut")
-    if tirf: st.caption(tirf)
-with c4:
-    st.markdown("**IMT**")
-    imt = st.number_input("Note IMT", 0, 160, key="imt", label_visibility="collapsed")
-    perc_imt = st.number_input("P_IMT", 0, 100, key="perc_imt", label_visibility="collapsed")
-    imt_bas = st.number_input("IC Bas IMT", 0, 160, key="imt_bas")
-    imt_haut = st.number_input("IC Haut IMT", 0, 160, key="imt_haut")
-    if timt: st.caption(timt)
-with c5:
-    st.markdown("**IVT**")
-    ivt = st.number_input("Note IVT", 0, 160, key="ivt", label_visibility="collapsed")
-    perc_ivt = st.number_input("P_IVT", 0, 100, key="perc_ivt", label_visibility="collapsed")
-    ivt_bas = st.number_input("IC Bas IVT", 0, 160, key="ivt_bas")
-    ivt_haut = st.number_input("IC Haut IVT", 0, 160, key="ivt_haut")
-    if tivt: st.caption(tivt)
-
-# --- Validité globale ---
-st.markdown("---")
-chk = [icv, ivs, irf, imt, ivt]
-if all(i > 0 for i in chk):
-    disp = max(chk) - min(chk)
-    if disp >= 23:
-        st.error(f"⚠️ **QIT NON INTERPRÉTABLE** — Dispersion entre indices : {disp} points")
-        h_txt = f"NON INTERPRÉTABLE (Disp. {disp})"
-    elif nb_inv >= 2:
+    c1, c2, c3 = st.columns(3)
+    with c1: st.number_input(f"MAT {couleur_note(st.session_state.get('mat',0))}", 0, 19, key="mat")
+    with c2: st.number_input(f"BAL {couleur_note(st.session_state.get('bal',0))}", 0, 19, key="bal")
+    with c3: st.number_input(f"ARI {couleur_note(st.session_state.get('arit',0))}", 0, 19, key="arit")
+
+    c1, c2, c3 = st.columns(3)
+    with c1: st.number_input(f"MCH {couleur_note(st.session_state.get('memc',0))}", 0, 19, key="memc")
+    with c2: st.number_input(f"MIM {couleur_note(st.session_state.get('memi',0))}", 0, 19, key="memi")
+    with c3: st.number_input(f"SLC {couleur_note(st.session_state.get('seq',0))}", 0, 19, key="seq")
+
+    c1, c2, c3 = st.columns(3)
+    with c1: st.number_input(f"COD {couleur_note(st.session_state.get('cod',0))}", 0, 19, key="cod")
+    with c2: st.number_input(f"SYM {couleur_note(st.session_state.get('sym',0))}", 0, 19, key="sym")
+    with c3: st.number_input(f"BAR {couleur_note(st.session_state.get('bar',0))}", 0, 19, key="bar")
+
+    st.caption("🔴 ≤6 Très faible · 🟠 7-9 Faible · 🟡 10-12 Moyen · 🟢 13-15 Supérieur · 🔵 ≥16 Très supérieur")
+
+    st.markdown("---")
+    st.subheader("B. Indices (Note / Percentile / Intervalle de confiance)")
+
+    if normes_chargees():
+        st.button("🧮 Calculer les indices depuis les subtests (tables de normes)",
+                  on_click=remplir_indices_normes,
+                  help="Remplit notes composites, percentiles et IC 95 % à partir des notes standard et de l'âge.")
+        if 'normes_resolus' in st.session_state:
+            st.caption(f"🧮 {st.session_state.pop('normes_resolus')} champs calculés depuis les tables de normes")
+
+    # Homogénéité, validité et analyse ipsative (moteur vectorisé, valeurs de session_state)
+    with span("Validité et analyse ipsative"):
+        scores = scores_saisis()
+        analyse = analyser(scores)
+    nb_inv = analyse.nb_inv
+    ticv, tivs, tirf, timt, tivt = (analyse.homogeneite[k][1] for k in ("ICV", "IVS", "IRF", "IMT", "IVT"))
+
+    # --- Indices principaux (en premier) ---
+    c1, c2, c3, c4, c5 = st.columns(5)
+    with c1:
+        st.markdown("**ICV**")
+        st.number_input("Note ICV", 0, 160, key="icv", label_visibility="collapsed")
+        st.number_input("P_ICV", 0, 100, key="perc_icv", label_visibility="collapsed")
+        st.number_input("IC Bas ICV", 0, 160, key="icv_bas")
+        st.number_input("IC Haut ICV", 0, 160, key="icv_haut")
+        if ticv: st.caption(ticv)
+    with c2:
+        st.markdown("**IVS**")
+        st.number_input("Note IVS", 0, 160, key="ivs", label_visibility="collapsed")
+        st.number_input("P_IVS", 0, 100, key="perc_ivs", label_visibility="collapsed")
+        st.number_input("IC Bas IVS", 0, 160, key="ivs_bas")
+        st.number_input("IC Haut IVS", 0, 160, key="ivs_haut")
+        if tivs: st.caption(tivs)
+    with c3:
+        st.markdown("**IRF**")
+        st.number_input("Note IRF", 0, 160, key="irf", label_visibility="collapsed")
+        st.number_input("P_IRF", 0, 100, key="perc_irf", label_visibility="collapsed")
+        st.number_input("IC Bas IRF", 0, 160, key="irf_bas")
+        st.number_input("IC Haut IRF", 0, 160, key="irf_haut")
+        if tirf: st.caption(tirf)
+    with c4:
+        st.markdown("**IMT**")
+        st.number_input("Note IMT", 0, 160, key="imt", label_visibility="collapsed")
+        st.number_input("P_IMT", 0, 100, key="perc_imt", label_visibility="collapsed")
+        st.number_input("IC Bas IMT", 0, 160, key="imt_bas")
+        st.number_input("IC Haut IMT", 0, 160, key="imt_haut")
+        if timt: st.caption(timt)
+    with c5:
+        st.markdown("**IVT**")
+        st.number_input("Note IVT", 0, 160, key="ivt", label_visibility="collapsed")
+        st.number_input("P_IVT", 0, 100, key="perc_ivt", label_visibility="collapsed")
+        st.number_input("IC Bas IVT", 0, 160, key="ivt_bas")
+        st.number_input("IC Haut IVT", 0, 160, key="ivt_haut")
+        if tivt: st.caption(tivt)
+
+    # --- Validité globale ---
+    st.markdown("---")
+    if analyse.statut_validite == "non_interpretable":
+        st.error(f"⚠️ **QIT NON INTERPRÉTABLE** — Dispersion entre indices : {analyse.dispersion} points")
+    elif analyse.statut_validite == "fragile":
         st.warning(f"🟠 **QIT FRAGILE** — {nb_inv} indice(s) hétérogène(s)")
-        h_txt = f"FRAGILE ({nb_inv} ind. hétérogènes)"
-    else:
+    elif analyse.statut_validite == "valide":
         st.success("✅ **Profil homogène** — QIT interprétable")
-        h_txt = "Valide et Homogène"
-else:
-    st.info("ℹ️ Renseignez les 5 indices pour évaluer la validité du QIT")
-    h_txt = "N/A"
-
-# --- QIT en dernier ---
-st.markdown("**QIT (Quotient Intellectuel Total)**")
-col_qit1, col_qit2, col_qit3, col_qit4 = st.columns(4)
-with col_qit1: qit = st.number_input("Note QIT", 0, 160, key="qit")
-with col_qit2: perc_qit = st.number_input("Percentile", 0, 100, key="perc_qit")
-with col_qit3: qit_bas = st.number_input("IC Bas QIT", 0, 160, key="qit_bas")
-with col_qit4: qit_haut = st.number_input("IC Haut QIT", 0, 160, key="qit_haut")
-
-st.markdown("---")
-st.subheader("C. Indices Complémentaires")
-
-def safe_sum(values):
-    if all(v > 0 for v in values): return sum(values)
-    return "Incomplet"
-
-s_iag = safe_sum([sim, voc, cub, mat, bal])
-s_icc = safe_sum([memc, memi, sym, cod])
-s_inv = safe_sum([cub, puz, mat, bal, memi, cod])
-
-st.caption(f"🧮 **Aide calcul (Somme Notes Standard) :** IAG = **{s_iag}** | ICC = **{s_icc}** | INV = **{s_inv}**")
-
-c1, c2, c3 = st.columns(3)
-with c1:
-    st.markdown("**IAG**")
-    iag = st.number_input("IAG", 0, key="iag")
-    iag_bas = st.number_input("IB_IAG", 0, key="iag_bas", label_visibility="collapsed")
-    iag_haut = st.number_input("IH_IAG", 0, key="iag_haut", label_visibility="collapsed")
-with c2:
-    st.markdown("**ICC**")
-    icc = st.number_input("ICC", 0, key="icc")
-    icc_bas = st.number_input("IB_ICC", 0, key="icc_bas", label_visibility="collapsed")
-    icc_haut = st.number_input("IH_ICC", 0, key="icc_haut", label_visibility="collapsed")
-with c3:
-    st.markdown("**INV**")
-    inv = st.number_input("INV", 0, key="inv")
-    inv_bas = st.number_input("IB_INV", 0, key="inv_bas", label_visibility="collapsed")
-    inv_haut = st.number_input("IH_INV", 0, key="inv_haut", label_visibility="collapsed")
-
-st.markdown("</div>", unsafe_allow_html=True)
+    else:
+        st.info("ℹ️ Renseignez les 5 indices pour évaluer la validité du QIT")
+
+    # --- QIT en dernier ---
+    st.markdown("**QIT (Quotient Intellectuel Total)**")
+    col_qit1, col_qit2, col_qit3, col_qit4 = st.columns(4)
+    with col_qit1: st.number_input("Note QIT", 0, 160, key="qit")
+    with col_qit2: st.number_input("Percentile", 0, 100, key="perc_qit")
+    with col_qit3: st.number_input("IC Bas QIT", 0, 160, key="qit_bas")
+    with col_qit4: st.number_input("IC Haut QIT", 0, 160, key="qit_haut")
+
+    st.markdown("---")
+    st.subheader("C. Indices Complémentaires")
+
+    s_iag, s_icc, s_inv = analyse.sommes["IAG"], analyse.sommes["ICC"], analyse.sommes["INV"]
+
+    st.caption(f"🧮 **Aide calcul (Somme Notes Standard) :** IAG = **{s_iag}** | ICC = **{s_icc}** | INV = **{s_inv}**")
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.markdown("**IAG**")
+        st.number_input("IAG", 0, key="iag")
+        st.number_input("IB_IAG", 0, key="iag_bas", label_visibility="collapsed")
+        st.number_input("IH_IAG", 0, key="iag_haut", label_visibility="collapsed")
+    with c2:
+        st.markdown("**ICC**")
+        st.number_input("ICC", 0, key="icc")
+        st.number_input("IB_ICC", 0, key="icc_bas", label_visibility="collapsed")
+        st.number_input("IH_ICC", 0, key="icc_haut", label_visibility="collapsed")
+    with c3:
+        st.markdown("**INV**")
+        st.number_input("INV", 0, key="inv")
+        st.number_input("IB_INV", 0, key="inv_bas", label_visibility="collapsed")
+        st.number_input("IH_INV", 0, key="inv_haut", label_visibility="collapsed")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+    noter_span("Saisie des scores", debut)
+
+    section_analyse(analyse)
+    chrono_section("Psychométrie + analyse", debut)
 
 # ==========================================
 # 10. ANALYSE & GRAPHIQUE
 # ==========================================
-st.divider()
-indices = {"ICV": icv, "IVS": ivs, "IRF": irf, "IMT": imt, "IVT": ivt}
-valid_ind = {k: v for k, v in indices.items() if v > 0}
-
-# Initialisation sécurisée de moy et intra_txt (utilisés plus bas dans le prompt)
-if valid_ind:
-    vals = list(valid_ind.values())
-    moy = float(np.mean(vals))
-    et  = float(np.std(vals))
-    intra_txt = f"Moyenne Perso: {moy:.1f}, ET: {et:.1f}."
-else:
-    moy = 0.0
-    et  = 0.0
-    intra_txt = ""
-
-c1, c2 = st.columns([1, 1.5])
-with c1:
-    if len(valid_ind) >= 3:
-        st.pyplot(plot_radar_chart(valid_ind))
-with c2:
-    if valid_ind:
-        st.info(f"Moyenne Perso : **{moy:.1f}** | Écart-Type : **{et:.1f}**")
-        for k, v in valid_ind.items():
-            d = v - moy
-            if d >= 10:
-                st.write(f"🟢 **{k}** : Force relative (+{d:.1f})")
-                intra_txt += f"- {k}: Force relative.\n"
-            elif d <= -10:
-                st.write(f"🔴 **{k}** : Faiblesse relative ({d:.1f})")
-                intra_txt += f"- {k}: Faiblesse relative.\n"
+def section_analyse(analyse):
+    """Radar et forces / faiblesses : suit le fragment de psychométrie."""
+    st.divider()
+    valid_ind, moy, et = analyse.valid_ind, analyse.moy, analyse.et
+
+    c1, c2 = st.columns([1, 1.5])
+    with c1:
+        if len(valid_ind) >= 3:
+            with span("Radar"):
+                st.image(radar_png(valeurs_radar(valid_ind)))
+    with c2:
+        if valid_ind:
+            st.info(f"Moyenne Perso : **{moy:.1f}** | Écart-Type : **{et:.1f}**")
+            for k, d in analyse.ecarts.items():
+                if k in analyse.forces:
+                    st.write(f"🟢 **{k}** : Force relative (+{d:.1f})")
+                elif k in analyse.faiblesses:
+                    st.write(f"🔴 **{k}** : Faiblesse relative ({d:.1f})")
+
+    identite = identite_saisie()
+    comparaisons = comparer(scores_saisis(), age_en_mois(identite.date_naissance, identite.date_bilan),
+                            tables_ecarts_chargees())
+    if comparaisons:
+        with st.expander(f"📐 Comparaisons par paires ({sum(c['significatif'] for c in comparaisons)} écart(s) significatif(s))"):
+            st.dataframe(
+                [{"Paire": c["paire"], "Écart": c["ecart"], "Seuil critique": c["critique"],
+                  "Significatif": "✔" if c["significatif"] else "",
+                  "Taux de base (%)": c["taux_base"]} for c in comparaisons],
+                hide_index=True, use_container_width=True
+            )
+
+    anterieurs = bilans_anterieurs()
+    if anterieurs:
+        with st.expander(f"📈 Évolution depuis les bilans précédents ({len(anterieurs)})"):
+            libelles = {d['id']: f"Bilan du {d['entree'].identite.date_bilan.strftime('%d/%m/%Y')}" for d in anterieurs}
+            st.multiselect("Bilans comparés au bilan en cours", list(libelles), default=list(libelles),
+                           format_func=libelles.get, key="bilans_evolution")
+            st.checkbox("Inclure l'évolution dans le compte rendu", value=True, key="inclure_evolution")
+            dates, scores_bilans, lignes = evolution_saisie(anterieurs)
+            if lignes:
+                radar = radar_evolution_png(tuple(
+                    (d, valeurs_radar(analyser(s).valid_ind)) for d, s in zip(dates, scores_bilans)))
+                if radar:
+                    st.image(radar)
+                st.dataframe(
+                    [{"Note": l["note"], **{f"Bilan du {d}": v or None for d, v in zip(dates, l["valeurs"])},
+                      "Écart": l["delta"], "Au-delà de l'erreur de mesure": "✔" if l["hors_erreur"] else ""}
+                     for l in lignes],
+                    hide_index=True, use_container_width=True
+                )
+                st.caption("Indices : IC 95 % disjoints. Subtests : écart d'au moins 3 points (un écart-type).")
+
+section_psychometrie()
 
 # ==========================================
 # 11. GÉNÉRATION IA
 # ==========================================
-st.divider()
-
-if not knowledge_base:
-    st.error("⛔ **Bibliothèque vide !** Aucun PDF de référence n'est chargé dans la sidebar. L'analyse sera moins précise sur le plan méthodologique.")
-
-# --- Options de génération ---
-col_opt1, col_opt2 = st.columns([2, 1])
-with col_opt1:
-    niveau_detail = st.radio(
-        "📊 Niveau de détail du compte rendu",
-        ["Court (1 page)", "Standard (2-3 pages)", "Détaillé (3-5 pages)"],
-        index=1,
-        horizontal=True
-    )
-with col_opt2:
-    st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
-    generer = st.button("✨ GÉNÉRER L'ANALYSE EXPERT", type="primary", use_container_width=True)
-    regenerer = st.button("🔄 RÉGÉNÉRER", use_container_width=True,
-        disabled='derniere_analyse' not in st.session_state,
-        help="Génère une nouvelle version de l'analyse avec les mêmes données")
-
-# Correspondance niveau → consigne longueur
-niveau_consigne = {
-    "Court (1 page)":        "Sois CONCIS. Maximum 400 mots. 1 paragraphe par section. Pas de sous-parties.",
-    "Standard (2-3 pages)":  "Longueur standard. 600-900 mots. Structure complète avec sous-parties.",
-    "Détaillé (3-5 pages)":  "Sois EXHAUSTIF. 1200-1800 mots. Développe chaque point avec exemples cliniques et hypothèses détaillées.",
-}
+LIBELLES_SECTIONS = {"bibliotheque": "bibliothèque", "anamnese": "anamnèse", "instructions": "consignes",
+                     "interpretation": "interprétation"}
 
-def construire_prompt(infos, motif_txt, obs_txt, ana, data, intra_txt, style_redac, niveau_detail, moy, valid_ind, knowledge_base):
-    consigne_longueur = niveau_consigne[niveau_detail]
-    return f"""
-            Rôle: Expert Psychologue WISC-V.
-
-            DESTINATAIRE: {style_redac}.
-
-            LONGUEUR : {consigne_longueur}
-
-            DONNÉES ENTRÉE:
-            - Enfant: {infos}
-            - Motif de consultation: {motif_txt}
-            - Obs: {obs_txt}
-            - Anamnèse: {ana}
-            - Scores: {data}
-            - Stats Intra: {intra_txt}
-
-            <BIBLIOTHEQUE_REFERENCE>
-            {knowledge_base}
-            </BIBLIOTHEQUE_REFERENCE>
-
-            CONSIGNE CRUCIALE DE HIERARCHIE :
-            1. Pour la MÉTHODOLOGIE (calculs, validité, homogénéité), tu DOIS suivre scrupuleusement le contenu de <BIBLIOTHEQUE_REFERENCE> (notamment Grégoire, Ozenne).
-            2. Pour le VOCABULAIRE DIAGNOSTIQUE en conclusion, utilise le DSM-5 / CIM-11.
-
-            OBJECTIF QUALITATIF :
-            Ne te contente pas de lister les scores. Tu dois EXPLIQUER et INTERPRÉTER.
-            - Utilise des connecteurs logiques : "ce qui suggère que...", "probablement en raison de...", "ce résultat contraste avec...".
-            - Formule des HYPOTHÈSES sur les mécanismes cognitifs sous-jacents.
-            - Analyse les ÉCARTS : Si l'ICV est > IVS, qu'est-ce que ça implique concrètement ?
-            - Tiens compte du motif de consultation pour orienter la conclusion et les recommandations.
-
-            STRUCTURE DU COMPTE RENDU :
-
-            1. VALIDITÉ DES INDICES GLOBAUX
-               - Vérifier homogénéité QIT. Si invalide, passer à IAG/ICC/INV.
-
-            2. ANALYSE INTER-INDIVIDUELLE (NORMATIVE) -> FOCUS INDICES UNIQUEMENT
-               - Parle des INDICES (QIT, ICV, etc.) par rapport à la norme (100).
-               - INTERDICTION de parler des subtests ici.
-               *** SYNTHÈSE NORMATIVE & FONCTIONNELLE ***
-               - Paragraphe de synthèse sur l'efficience globale et l'impact sur la vie quotidienne/scolaire.
-
-            3. ANALYSE INTRA-INDIVIDUELLE (IPSATIVE) -> FOCUS SUBTESTS
-               - Analyse les SUBTESTS par rapport à la moyenne de l'enfant ({moy if valid_ind else 'N/A'}).
-               - Lier chaque résultat à une hypothèse cognitive/clinique.
-               *** SYNTHÈSE CLINIQUE & PROCESSUELLE ***
-               - Forces et faiblesses spécifiques + lien avec les symptômes observés.
-
-            4. SYNTHÈSE DIAGNOSTIQUE & RECOMMANDATIONS
-               - Croiser avec l'anamnèse et le motif de consultation.
-               - Hypothèses (TDAH, TSA, etc.).
-               - Conseils pratiques adaptés au motif.
-
-            Rédige avec un ton professionnel, argumenté et clinique.
-            """
+@st.fragment
+def section_generation(knowledge_base, sources_actives, selection_ciblee, budget_contexte, style_redac):
+    """Compte rendu : réglages de la sidebar en arguments (repris tels quels quand le fragment se relance seul)."""
+    debut = time.perf_counter()
+    st.divider()
 
-if generer or regenerer:
-    infos = f"{prenom}, {sexe}, {ans} ans. Date Bilan: {st.session_state.jb}/{st.session_state.mb}/{st.session_state.ab}. Latéralité: {lateralite}. Créole: {creole}."
-    motif_txt = ", ".join(motifs) if motifs else "Non précisé"
-    obs_txt = ", ".join(obs) + ". " + obs_libre
+    if not knowledge_base:
+        st.error("⛔ **Bibliothèque vide !** Aucun PDF de référence n'est chargé dans la sidebar. L'analyse sera moins précise sur le plan méthodologique.")
+
+    # --- Options de génération ---
+    col_opt1, col_opt2 = st.columns([2, 1])
+    with col_opt1:
+        niveau_detail = st.radio(
+            "📊 Niveau de détail du compte rendu",
+            ["Court (1 page)", "Standard (2-3 pages)", "Détaillé (3-5 pages)"],
+            index=1,
+            horizontal=True
+        )
+        st.radio("⚙️ Mode de génération", list(MODES_GENERATION), format_func=MODES_GENERATION.get,
+                 horizontal=True, key="mode_generation",
+                 help="Deux temps : l'interprétation clinique (avec la bibliothèque) est gardée en cache ; "
+                      "changer de destinataire ou de longueur ne relance que la rédaction, sans la bibliothèque")
+    with col_opt2:
+        st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
+        generer = st.button("✨ GÉNÉRER L'ANALYSE EXPERT", type="primary", use_container_width=True,
+                            disabled=tache_en_cours("rapport"))
+        regenerer = st.button("🔄 RÉGÉNÉRER", use_container_width=True,
+            disabled='derniere_analyse' not in st.session_state or tache_en_cours("rapport"),
+            help="Génère une nouvelle version de l'analyse avec les mêmes données")
+
+    if generer or regenerer:
+        identite = identite_saisie()
+        scores = scores_saisis()
+        analyse = analyser(scores)
+        ans, mois = calculer_age(identite.date_naissance, identite.date_bilan)
+        entree = EntreeBilan(
+            identite,
+            observations_saisies(),
+            scores,
+            style_redac,
+            niveau_detail,
+        )
+
+        # Contexte bibliothèque : passages pertinents pour ce profil (ou bibliothèque entière)
+        debut_prompt = time.perf_counter()
+        contexte_biblio = knowledge_base
+        if selection_ciblee and sources_actives:
+            bibli = get_bibliotheque()
+            index_bm25 = get_index_bm25(tuple(sources_actives),
+                                        tuple(bibli.empreinte(f) for f in sources_actives))
+            contexte_biblio, passages = contexte_bibliotheque(entree, analyse, index_bm25, budget_contexte)
+            st.session_state['passages_selectionnes'] = [
+                f"{p['source']} #{p['numero']} (score {score:.1f})" for p, score in passages
+            ]
 
-    if qit > 0:
-        data = f"QIT: {qit} (Perc: {perc_qit}, IC: {qit_bas}-{qit_haut}). Validité: {h_txt}.\n"
-    else:
-        data = "QIT: Non calculé / Non administré.\n"
-
-    data += "Indices Administrés: "
-    indices_data = []
-    if icv > 0: indices_data.append(f"ICV {icv} (Perc {perc_icv}, IC {icv_bas}-{icv_haut})")
-    if ivs > 0: indices_data.append(f"IVS {ivs} (Perc {perc_ivs}, IC {ivs_bas}-{ivs_haut})")
-    if irf > 0: indices_data.append(f"IRF {irf} (Perc {perc_irf}, IC {irf_bas}-{irf_haut})")
-    if imt > 0: indices_data.append(f"IMT {imt} (Perc {perc_imt}, IC {imt_bas}-{imt_haut})")
-    if ivt > 0: indices_data.append(f"IVT {ivt} (Perc {perc_ivt}, IC {ivt_bas}-{ivt_haut})")
-    data += ", ".join(indices_data) + ".\n"
-
-    data += "Indices Complémentaires: "
-    compl_data = []
-    if iag > 0: compl_data.append(f"IAG {iag} (IC {iag_bas}-{iag_haut})")
-    if icc > 0: compl_data.append(f"ICC {icc} (IC {icc_bas}-{icc_haut})")
-    if inv > 0: compl_data.append(f"INV {inv} (IC {inv_bas}-{inv_haut})")
-    data += ", ".join(compl_data) + ".\n"
-
-    data += "Subtests (Notes Standard): "
-    subs_map = {
-        "Sim": sim, "Voc": voc, "Info": info, "Comp": comp,
-        "Cub": cub, "Puz": puz, "Mat": mat, "Bal": bal,
-        "Arit": arit, "MemC": memc, "MemI": memi, "Seq": seq,
-        "Cod": cod, "Sym": sym, "Bar": bar
-    }
-    valid_subs = [f"{k} {v}" for k, v in subs_map.items() if v > 0]
-    data += ", ".join(valid_subs) + "."
-
-    spinner_msg = "🔄 Nouvelle analyse en cours..." if regenerer else "🧠 Analyse approfondie en cours..."
-    with st.spinner(spinner_msg):
         try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            prompt = construire_prompt(infos, motif_txt, obs_txt, ana, data, intra_txt,
-                                       style_redac, niveau_detail, moy, valid_ind, knowledge_base)
-            res = model.generate_content(prompt)
-            analyse_texte = res.text
+            evolution = ""
+            if st.session_state.get('inclure_evolution', True):
+                dates_evolution, _, lignes_evolution = evolution_saisie()
+                evolution = formater_evolution(dates_evolution, lignes_evolution)
+            plafond = st.session_state.get('plafond_prompt', PLAFOND_PROMPT)
+            mode = st.session_state.get('mode_generation', "deux_temps")
+            travail = {}
+            if mode == "sections":
+                contextes = contexte_biblio
+                if selection_ciblee and sources_actives:
+                    contextes = contextes_sections(entree, analyse, index_bm25, budget_contexte)
+                travail['prompts_sections'] = preparer_sections(entree, analyse, contextes, tables_ecarts_chargees(),
+                                                                evolution, plafond)
+                retires = sum(r for _, _, r in travail['prompts_sections'].values())
+            elif mode == "deux_temps":
+                travail['prompt'], travail['sections'], retires = preparer_interpretation(
+                    entree, analyse, contexte_biblio, tables_ecarts_chargees(), evolution, plafond)
+                travail['rediger'] = partial(preparer_redaction, entree, analyse,
+                                             tables_ecarts=tables_ecarts_chargees(), evolution=evolution)
+            else:
+                travail['prompt'], travail['sections'], retires = preparer_prompt_mesure(
+                    entree, analyse, contexte_biblio, tables_ecarts_chargees(), evolution, plafond)
+            noter_span("Construction du prompt", debut_prompt)
+            lancer_tache("rapport", tache_rapport, mode, forcer=regenerer, **travail, contexte={
+                'prenom': identite.prenom, 'age': f"{ans}a{mois}m", 'niveau_detail': niveau_detail,
+                'identite_export': champs_export(entree.identite, analyse.valid_ind),
+                'passages': st.session_state.get('passages_selectionnes', []) if selection_ciblee else [],
+                'retires': retires, 'plafond': plafond})
+        except Exception as e:
+            st.error(f"Erreur lors de la génération : {e}")
 
-            st.session_state['derniere_analyse'] = analyse_texte
-            st.session_state['prenom_analyse'] = prenom
-            st.session_state['age_analyse'] = f"{ans}a{mois}m"
-            st.session_state['niveau_detail'] = niveau_detail
+    if st.session_state.get('echec_rapport'):
+        st.error(f"Erreur lors de la génération : {st.session_state['echec_rapport']}")
 
+    if tache_en_cours("rapport") or 'derniere_analyse' in st.session_state:
+        st.markdown("""
+        <div style="
+            background: white;
+            border-radius: 12px;
+            padding: 1.5rem 2rem;
+            border: 1px solid #E8E4DF;
+            border-left: 4px solid #1B3A5C;
+            box-shadow: 0 4px 20px rgba(0,0,0,0.06);
+            margin-top: 1rem;
+        ">
+        """, unsafe_allow_html=True)
+        if tache_en_cours("rapport"):
+            suivre_tache("rapport", "Analyse approfondie en cours")
+        else:
+            st.markdown(st.session_state['derniere_analyse'])
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    mesures = st.session_state.get('mesures_analyse')
+    if mesures and not tache_en_cours("rapport") and 'derniere_analyse' in st.session_state:
+        if mesures['retires']:
+            st.warning(f"✂️ Prompt au-delà du plafond ({mesures['plafond']:,} tokens) : ~{mesures['retires']:,} tokens "
+                       "retirés (bibliothèque d'abord).".replace(",", " "))
+        sections = mesures['sections']
+        detail_sections = " · ".join(f"{LIBELLES_SECTIONS.get(k, k)} {v:,}" for k, v in sections.items())
+        st.caption((f"🧩 Interprétation : {mesures['duree_interpretation']:.1f} s · "
+                    if mesures['duree_interpretation'] is not None else "")
+                   + (f"🧵 {len(SECTIONS_RAPPORT)} sections en parallèle, {mesures['corrections']} correction(s) de cohérence · "
+                      if mesures['corrections'] is not None else "")
+                   + f"⏱️ {'Première section' if mesures['corrections'] is not None else 'Premier token'} : {mesures['ttft']:.1f} s · "
+                   f"Génération complète : {mesures['duree']:.1f} s · "
+                   f"~{sum(sections.values()):,} tokens envoyés ({detail_sections})".replace(",", " "))
+        if st.session_state.get('passages_selectionnes'):
+            with st.expander(f"📑 Passages de la bibliothèque utilisés ({len(st.session_state['passages_selectionnes'])})"):
+                st.text("\n".join(st.session_state['passages_selectionnes']))
+
+    # Export Word + PDF côte à côte : rendu au clic, gardé par empreinte de l'analyse
+    if 'derniere_analyse' in st.session_state and 'identite_export' in st.session_state:
+        identite_export = st.session_state['identite_export']
+        col_word, col_pdf = st.columns(2)
+        for col_export, fmt, libelle in ((col_word, "docx", "📄 Télécharger (.docx)"),
+                                         (col_pdf, "pdf", "📋 Télécharger (.pdf)")):
+            with col_export:
+                st.download_button(
+                    libelle,
+                    export_differe(fmt, st.session_state['derniere_analyse'], identite_export),
+                    f"Bilan_WISC5_{identite_export['prenom']}.{fmt}",
+                    FORMATS[fmt],
+                    on_click="ignore",
+                    use_container_width=True
+                )
+
+    # --- 12. Résumé 10 lignes (Point 8) ---
+    if 'derniere_analyse' in st.session_state:
+        st.divider()
+        st.markdown("### 📋 Résumé synthétique")
+        st.caption("Utile pour courriers, transmissions MDPH, comptes rendus rapides.")
+        if st.button("✍️ Générer un résumé en 10 lignes maximum", type="secondary",
+                     disabled=tache_en_cours("resume")):
+            prompt_resume = f"""
+            À partir de cette analyse WISC-V complète, rédige un résumé synthétique 
+            destiné à un courrier professionnel (médecin, école, MDPH).
+    
+            Contraintes STRICTES :
+            - 10 lignes MAXIMUM
+            - Ton professionnel, phrases complètes
+            - Inclure : efficience globale, points forts, points faibles, 1-2 recommandations clés
+            - Ne pas utiliser de titres ni de bullet points, uniquement des paragraphes
+            - Commencer par "À l'issue du bilan psychométrique de {st.session_state.get('prenom_analyse','cet enfant')}..."
+    
+            ANALYSE SOURCE :
+            {st.session_state['derniere_analyse']}
+            """
+            lancer_tache("resume", tache_resume, prompt_resume,
+                         sections=sections_prompt(prompt_resume, analyse=st.session_state['derniere_analyse']))
+
+        if st.session_state.get('echec_resume'):
+            st.error(f"Erreur résumé : {st.session_state['echec_resume']}")
+        if tache_en_cours("resume") or 'dernier_resume' in st.session_state:
             st.markdown("""
             <div style="
-                background: white;
-                border-radius: 12px;
-                padding: 1.5rem 2rem;
+                background: #F5F2EE;
+                border-radius: 10px;
+                padding: 1.2rem 1.5rem;
                 border: 1px solid #E8E4DF;
-                border-left: 4px solid #1B3A5C;
-                box-shadow: 0 4px 20px rgba(0,0,0,0.06);
-                margin-top: 1rem;
+                border-left: 4px solid #C9A84C;
+                margin-top: 0.5rem;
             ">
             """, unsafe_allow_html=True)
-            st.markdown(analyse_texte)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-            # Export Word + PDF côte à côte
-            col_word, col_pdf = st.columns(2)
-            with col_word:
-                try:
-                    f_word = create_docx(analyse_texte, prenom, f"{ans}a{mois}m")
-                    f_word.seek(0)
-                    st.download_button(
-                        "📄 Télécharger (.docx)",
-                        f_word.read(),
-                        f"Bilan_WISC5_{prenom}.docx",
-                        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        use_container_width=True
-                    )
-                except Exception as e_word:
-                    st.error(f"Erreur export Word : {e_word}")
-
-            with col_pdf:
-                try:
-                    date_bilan_str = f"{st.session_state.jb:02d}/{st.session_state.mb:02d}/{st.session_state.ab}"
-                    f_pdf = create_pdf(analyse_texte, prenom, sexe, f"{ans} ans {mois} mois", date_bilan_str)
-                    f_pdf.seek(0)
-                    st.download_button(
-                        "📋 Télécharger (.pdf)",
-                        f_pdf.read(),
-                        f"Bilan_WISC5_{prenom}.pdf",
-                        "application/pdf",
-                        use_container_width=True
-                    )
-                except Exception as e_pdf:
-                    st.error(f"Erreur export PDF : {e_pdf}")
-
-        except Exception as e:
-            st.error(f"Erreur lors de la génération : {e}")
-
-# ==========================================
-# 12. RÉSUMÉ 10 LIGNES (Point 8)
-# ==========================================
-if 'derniere_analyse' in st.session_state:
-    st.divider()
-    st.markdown("### 📋 Résumé synthétique")
-    st.caption("Utile pour courriers, transmissions MDPH, comptes rendus rapides.")
-    if st.button("✍️ Générer un résumé en 10 lignes maximum", type="secondary"):
-        with st.spinner("Rédaction du résumé..."):
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                prompt_resume = f"""
-                À partir de cette analyse WISC-V complète, rédige un résumé synthétique 
-                destiné à un courrier professionnel (médecin, école, MDPH).
-                
-                Contraintes STRICTES :
-                - 10 lignes MAXIMUM
-                - Ton professionnel, phrases complètes
-                - Inclure : efficience globale, points forts, points faibles, 1-2 recommandations clés
-                - Ne pas utiliser de titres ni de bullet points, uniquement des paragraphes
-                - Commencer par "À l'issue du bilan psychométrique de {st.session_state.get('prenom_analyse','cet enfant')}..."
-                
-                ANALYSE SOURCE :
-                {st.session_state['derniere_analyse']}
-                """
-                res_resume = model.generate_content(prompt_resume)
-
-                st.markdown("""
-                <div style="
-                    background: #F5F2EE;
-                    border-radius: 10px;
-                    padding: 1.2rem 1.5rem;
-                    border: 1px solid #E8E4DF;
-                    border-left: 4px solid #C9A84C;
-                    margin-top: 0.5rem;
-                ">
-                """, unsafe_allow_html=True)
-                st.markdown(res_resume.text)
+            if tache_en_cours("resume"):
+                suivre_tache("resume", "Rédaction du résumé")
                 st.markdown("</div>", unsafe_allow_html=True)
+            else:
+                resume_texte = st.session_state['dernier_resume']
+                st.markdown(resume_texte)
+                st.markdown("</div>", unsafe_allow_html=True)
+                latence = st.session_state.get('latence_resume')
+                if latence:
+                    st.caption(f"⏱️ Premier token : {latence['ttft']:.1f} s · Génération complète : {latence['total']:.1f} s")
 
                 # Bouton copier (via text_area sélectionnable)
                 st.text_area(
                     "📋 Sélectionner tout pour copier :",
-                    res_resume.text,
+                    resume_texte,
                     height=200,
                     key="resume_copie"
                 )
 
-            except Exception as e:
-                st.error(f"Erreur résumé : {e}")
+    chrono_section("Génération", debut)
+
+section_generation(knowledge_base, tuple(sources_actives), selection_ciblee, budget_contexte, style_redac)
+
+# ==========================================
+# 12. TABLEAU DE BORD IA (ADMIN)
+# ==========================================
+PERIODES_JOURNAL = {"24 heures": 24 * 3600, "7 jours": 7 * 24 * 3600, "30 jours": 30 * 24 * 3600}
+
+@st.fragment
+def section_tableau_ia():
+    st.divider()
+    st.markdown("### 📊 Appels IA : tokens et latences")
+    journal = get_client().journal
+    periode = st.radio("Période", list(PERIODES_JOURNAL), horizontal=True, key="periode_journal")
+    synthese = journal.synthese(time.time() - PERIODES_JOURNAL[periode])
+    if not synthese:
+        st.caption("Aucun appel journalisé sur la période.")
+        return
+    st.dataframe(
+        [{"Nature": nature, "Appels": n["appels"], "Lus en cache": n["cache"], "Erreurs": n["erreurs"],
+          **{f"Tokens moy. {k}": v for k, v in n["sections"].items()},
+          "Tokens entrée (facturés)": n["tokens_entree"], "Tokens sortie": n["tokens_sortie"],
+          "Latence p50 (s)": n["latence_p50"], "Latence p95 (s)": n["latence_p95"]}
+         for nature, n in synthese.items()],
+        hide_index=True, use_container_width=True
+    )
+    with st.expander("Derniers appels"):
+        st.dataframe(
+            [{"Heure": time.strftime("%d/%m %H:%M:%S", time.localtime(a["ts"])), "Nature": a["nature"],
+              "Modèle": a["modele"], "Source": a["source"], "Tokens estimés": a["tokens_estimes"],
+              "Sections": ", ".join(f"{k} {v}" for k, v in a["sections"].items()),
+              "Entrée": a["tokens_entree"], "Sortie": a["tokens_sortie"],
+              "Latence (s)": round(a["latence"], 2), "Erreur": "⚠️" if a["erreur"] else ""}
+             for a in journal.derniers(50)],
+            hide_index=True, use_container_width=True
+        )
+    if st.button("Vider le journal des appels"):
+        journal.vider()
+        st.rerun(scope="fragment")
+
+if st.session_state.get('user_role') == "admin" and st.session_state.get('afficher_tableau_ia'):
+    section_tableau_ia()
+
+# ==========================================
+# 13. MÉMOIRE PAR SESSION (ADMIN)
+# ==========================================
+# Chaque rendu complet note la taille de l'état de la session ; les données
+# communes (bibliothèque, index, normes, exports) sont partagées par le
+# processus et n'y figurent pas.
+get_registre_sessions().noter(st.session_state['id_session'], clinicien_connecte(), st.session_state.to_dict())
+
+@st.fragment
+def section_memoire_sessions():
+    st.divider()
+    st.markdown("### 🧮 Mémoire par session")
+    registre = get_registre_sessions()
+    sessions = registre.sessions()
+    st.caption(f"Processus : {rss_octets() / 2**20:.0f} Mo résidents · {len(sessions)} session(s) active(s) · "
+               f"Bibliothèque partagée : {get_bibliotheque().memoire() / 2**20:.1f} Mo · "
+               f"Plafond par session : {registre.plafond / 2**20:.0f} Mo")
+    st.dataframe(
+        [{"Session": s["id"], "Utilisateur": s["utilisateur"],
+          "Dernier rendu": time.strftime("%H:%M:%S", time.localtime(s["vu"])),
+          "État (Ko)": round(s["total"] / 1024, 1), "Plafond": "⚠️ dépassé" if s["au_dela"] else "",
+          "Clés les plus lourdes": ", ".join(f"{k} {v / 1024:.0f} Ko" for k, v in
+                                             sorted(s["tailles"].items(), key=lambda kv: -kv[1])[:3])}
+         for s in sessions],
+        hide_index=True, use_container_width=True
+    )
+    if st.button("🔄 Actualiser", key="actualiser_memoire"):
+        st.rerun(scope="fragment")
+
+if st.session_state.get('user_role') == "admin" and st.session_state.get('afficher_memoire'):
+    section_memoire_sessions()
+
+# ==========================================
+# 14. DIAGNOSTICS (ADMIN)
+# ==========================================
+# Temps par bloc du rendu (spans) agrégés pour le processus et par session ;
+# chaque span est aussi écrit dans le journal tournant .cache_wisc/diagnostics.log.
+@st.fragment
+def section_diagnostics():
+    st.divider()
+    st.markdown("### 🩺 Diagnostics : temps par bloc")
+    diagnostics = get_diagnostics()
+    diagnostics.actif = st.toggle("Mesures actives (tout le processus)", value=diagnostics.actif,
+                                  key="diagnostics_actifs")
+    sessions = diagnostics.sessions()
+    st.caption(f"{len(sessions)} session(s) mesurée(s) · Journal : {diagnostics.chemin}")
+    synthese = diagnostics.synthese()
+    if not synthese:
+        st.caption("Aucune mesure depuis le démarrage du processus.")
+        return
+    st.markdown("**Processus**")
+    st.dataframe(
+        [{"Bloc": l["bloc"], "Mesures": l["n"], "Moyenne (ms)": round(l["moyenne"] * 1000, 1),
+          "p50 (ms)": round(l["p50"] * 1000, 1), "p95 (ms)": round(l["p95"] * 1000, 1),
+          "Max (ms)": round(l["max"] * 1000, 1), "Total (s)": round(l["total"], 2)}
+         for l in synthese],
+        hide_index=True, use_container_width=True
+    )
+    courante = next((s for s in sessions if s["id"] == st.session_state.get('id_session')), None)
+    if courante:
+        st.markdown("**Cette session**")
+        st.dataframe(
+            [{"Bloc": bloc, "Mesures": b["n"], "Dernier (ms)": round(b["dernier"] * 1000, 1),
+              "Moyenne (ms)": round(b["total"] / b["n"] * 1000, 1), "Max (ms)": round(b["max"] * 1000, 1)}
+             for bloc, b in sorted(courante["blocs"].items(), key=lambda kv: -kv[1]["total"])],
+            hide_index=True, use_container_width=True
+        )
+    with st.expander(f"Sessions actives ({len(sessions)})"):
+        st.dataframe(
+            [{"Session": s["id"], "Utilisateur": s["utilisateur"],
+              "Dernière mesure": time.strftime("%H:%M:%S", time.localtime(s["vu"])),
+              "Total (s)": round(s["total"], 2),
+              "Blocs les plus coûteux": ", ".join(f"{bloc} {b['total']:.1f} s" for bloc, b in
+                                                  sorted(s["blocs"].items(), key=lambda kv: -kv[1]["total"])[:3])}
+             for s in sessions],
+            hide_index=True, use_container_width=True
+        )
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("🔄 Actualiser", key="actualiser_diagnostics"):
+            st.rerun(scope="fragment")
+    with c2:
+        if st.button("Remettre les mesures à zéro", key="vider_diagnostics"):
+            diagnostics.vider()
+            st.rerun(scope="fragment")
+
+if st.session_state.get('user_role') == "admin" and st.session_state.get('afficher_diagnostics'):
+    section_diagnostics()
+
+chrono_section("Page complète", DEBUT_PAGE)
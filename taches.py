@@ -0,0 +1,248 @@
+# ==========================================
+# TÂCHES DE FOND (EXTRACTION, IMPORT PAR LOT, COMPTE RENDU, RÉSUMÉ)
+# ==========================================
+# Les appels longs au modèle tournent dans un pool de threads du processus,
+# hors du thread de la session Streamlit : le clinicien continue la saisie
+# pendant la rédaction. Aucun service externe (pas de broker) : tout tient
+# dans le processus et une base SQLite locale.
+#
+# La table `taches` garde l'état et le résultat (JSON) de chaque tâche, par
+# propriétaire (identifiant du clinicien) : un résultat terminé pendant un
+# rechargement de page ou une reconnexion reste disponible. Le `contexte`
+# porte la session et le bilan d'origine ; c'est l'interface qui décide de
+# la session qui reprend le résultat. Contexte et résultat (identité, scores,
+# compte rendu) sont chiffrés avec la clé des dossiers patients (dossiers.py). Le texte partiel d'une rédaction en
+# cours reste en mémoire (affichage en direct), seul le résultat final est écrit.
+#
+# Une tâche en attente ou en cours au démarrage du processus a été perdue
+# avec le processus précédent : elle est marquée en échec.
+
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from bibliotheque import DOSSIER_CACHE, read_file
+from dossiers import cle_chiffrement
+from ia import get_client
+from import_lot import importer_lot
+from moteur import SECTIONS_RAPPORT, assembler_sections, lire_interpretation, relire_coherence
+import qglobal
+
+WORKERS_TACHES = int(os.environ.get("WISC_TACHES_WORKERS", "4"))
+RETENTION_TACHES = 7 * 24 * 3600   # secondes de conservation des tâches terminées
+EN_COURS = ("attente", "en_cours")
+
+
+class FileTaches:
+    """File locale de tâches : pool de threads + table SQLite des états et résultats."""
+
+    def __init__(self, chemin=None, workers=WORKERS_TACHES, retention=RETENTION_TACHES, cle=None):
+        if chemin is None:
+            os.makedirs(DOSSIER_CACHE, exist_ok=True)
+            chemin = os.path.join(DOSSIER_CACHE, "taches.sqlite")
+        self.chemin = chemin
+        self._fernet = Fernet(cle or cle_chiffrement())
+        self.retention = retention
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tache")
+        self._verrou = threading.Lock()
+        self._futurs = {}     # id -> Future (tâches de ce processus)
+        self._partiels = {}   # id -> texte partiel publié par la tâche
+        with self._connexion() as cx:
+            cx.execute("PRAGMA journal_mode=WAL")
+            cx.execute("""CREATE TABLE IF NOT EXISTS taches (
+                id INTEGER PRIMARY KEY, nature TEXT, proprietaire TEXT, statut TEXT,
+                cree REAL, debut REAL, fin REAL, contexte TEXT, resultat TEXT, erreur TEXT,
+                recuperee INTEGER DEFAULT 0)""")
+            cx.execute("CREATE INDEX IF NOT EXISTS idx_taches_proprietaire ON taches(proprietaire, recuperee)")
+            cx.execute("""UPDATE taches SET statut = 'echec', fin = ?,
+                          erreur = 'Interrompue (redémarrage de l''application)'
+                          WHERE statut IN ('attente', 'en_cours')""", (time.time(),))
+            cx.execute("DELETE FROM taches WHERE cree < ?", (time.time() - self.retention,))
+            # Lignes en clair des versions précédentes (contexte JSON stocké en texte)
+            cx.execute("DELETE FROM taches WHERE typeof(contexte) = 'text'")
+
+    @contextmanager
+    def _connexion(self):
+        cx = sqlite3.connect(self.chemin, timeout=10)
+        try:
+            with cx:   # commit / rollback
+                yield cx
+        finally:
+            cx.close()
+
+    def soumettre(self, nature, fonction, *args, proprietaire="", contexte=None, **kwargs):
+        """Lance `fonction(*args, suivi=..., **kwargs)` en arrière-plan. Retourne l'identifiant.
+
+        La fonction retourne un résultat sérialisable en JSON ; elle peut
+        publier un texte partiel en appelant `suivi(texte)`. `contexte` (JSON) :
+        ce que l'interface doit retrouver avec le résultat.
+        """
+        with self._connexion() as cx:
+            id_tache = cx.execute(
+                "INSERT INTO taches (nature, proprietaire, statut, cree, contexte) VALUES (?, ?, 'attente', ?, ?)",
+                (nature, proprietaire, time.time(), self._chiffrer(contexte or {}))).lastrowid
+        with self._verrou:
+            self._futurs[id_tache] = self._pool.submit(self._executer, id_tache, fonction, args, kwargs)
+        return id_tache
+
+    def _executer(self, id_tache, fonction, args, kwargs):
+        with self._connexion() as cx:
+            cx.execute("UPDATE taches SET statut = 'en_cours', debut = ? WHERE id = ?", (time.time(), id_tache))
+        try:
+            resultat = fonction(*args, suivi=partial(self._publier, id_tache), **kwargs)
+            statut, resultat, erreur = "termine", self._chiffrer(resultat), None
+        except Exception as e:
+            statut, resultat, erreur = "echec", None, str(e) or type(e).__name__
+        with self._connexion() as cx:
+            cx.execute("UPDATE taches SET statut = ?, fin = ?, resultat = ?, erreur = ? WHERE id = ?",
+                       (statut, time.time(), resultat, erreur, id_tache))
+        with self._verrou:
+            self._futurs.pop(id_tache, None)
+            self._partiels.pop(id_tache, None)
+
+    def _publier(self, id_tache, texte):
+        with self._verrou:
+            self._partiels[id_tache] = texte
+
+    def _chiffrer(self, valeur):
+        return self._fernet.encrypt(json.dumps(valeur, ensure_ascii=False).encode("utf-8"))
+
+    def _decoder(self, ligne):
+        t = dict(ligne)
+        try:
+            t["contexte"] = json.loads(self._fernet.decrypt(t["contexte"])) if t["contexte"] else {}
+            t["resultat"] = json.loads(self._fernet.decrypt(t["resultat"])) if t["resultat"] else None
+        except InvalidToken:   # clé des dossiers changée depuis le lancement
+            t.update(contexte={}, resultat=None, statut="echec",
+                     erreur="Résultat illisible : clé de chiffrement différente")
+        with self._verrou:
+            t["partiel"] = self._partiels.get(t["id"], "")
+        return t
+
+    def etat(self, id_tache):
+        """{"id", "nature", "statut", "cree", "debut", "fin", "contexte", "resultat",
+        "erreur", "partiel", ...} ; None si la tâche n'existe pas (ou plus)."""
+        with self._connexion() as cx:
+            cx.row_factory = sqlite3.Row
+            ligne = cx.execute("SELECT * FROM taches WHERE id = ?", (id_tache,)).fetchone()
+        return self._decoder(ligne) if ligne else None
+
+    def a_recuperer(self, proprietaire):
+        """Tâches du propriétaire dont le résultat n'a pas encore été repris par une session."""
+        with self._connexion() as cx:
+            cx.row_factory = sqlite3.Row
+            lignes = cx.execute("SELECT * FROM taches WHERE proprietaire = ? AND recuperee = 0 ORDER BY id",
+                                (proprietaire,)).fetchall()
+        return [self._decoder(l) for l in lignes]
+
+    def marquer_recuperee(self, id_tache):
+        with self._connexion() as cx:
+            cx.execute("UPDATE taches SET recuperee = 1 WHERE id = ?", (id_tache,))
+
+    def annuler(self, id_tache):
+        """Annule une tâche encore en attente. Retourne False si elle a déjà démarré."""
+        with self._verrou:
+            futur = self._futurs.get(id_tache)
+        if futur is None or not futur.cancel():
+            return False
+        with self._connexion() as cx:
+            cx.execute("UPDATE taches SET statut = 'annulee', fin = ?, recuperee = 1 WHERE id = ?",
+                       (time.time(), id_tache))
+        with self._verrou:
+            self._futurs.pop(id_tache, None)
+        return True
+
+    def stats(self):
+        with self._connexion() as cx:
+            return dict(cx.execute("SELECT statut, COUNT(*) FROM taches GROUP BY statut").fetchall())
+
+
+# ==========================================
+# TRAVAUX
+# ==========================================
+# Fonctions exécutées par la file : les prompts sont préparés par
+# l'interface (tables et index partagés), seuls les appels au modèle
+# tournent en arrière-plan.
+
+def _diffuser(prompt, suivi=None, forcer=False, **journal):
+    """Texte complet en streaming, publié au fil de l'eau. Retourne (texte, premier token, durée)."""
+    debut = time.perf_counter()
+    premier = None
+    morceaux = []
+    for t in get_client().diffuser(prompt, forcer=forcer, **journal):
+        premier = premier if premier is not None else time.perf_counter() - debut
+        morceaux.append(t)
+        if suivi:
+            suivi("".join(morceaux))
+    return "".join(morceaux), premier or 0.0, time.perf_counter() - debut
+
+
+def tache_extraction(nom, contenu, normes=None, suivi=None):
+    """Rapport Q-GLOBAL (octets) : parser local, normes, puis l'IA pour les champs non résolus."""
+    texte = read_file(io.BytesIO(contenu), nom)
+    donnees, sources = qglobal.extraire(texte, appel_llm=partial(get_client().generer, nature="extraction"),
+                                        normes=normes)
+    return {"donnees": donnees, "sources": sources}
+
+
+def tache_import_lot(fichiers, ia=False, normes=None, suivi=None):
+    """Import par lot (import_lot.importer_lot) : {"enregistrements", "rapport"}."""
+    appel_llm = partial(get_client().generer, nature="extraction") if ia else None
+    enregistrements, rapport = importer_lot(fichiers, appel_llm, normes=normes)
+    return {"enregistrements": enregistrements, "rapport": rapport}
+
+
+def tache_rapport(mode, prompt=None, sections=None, prompts_sections=None, rediger=None,
+                  forcer=False, suivi=None):
+    """Compte rendu selon le mode de génération (voir moteur.MODES_GENERATION).
+
+    - « direct » : `prompt`, `sections` ;
+    - « deux_temps » : `prompt` / `sections` de l'interprétation et
+      `rediger(interpretation) -> (prompt, sections)` pour la rédaction ;
+    - « sections » : `prompts_sections` ({clé: (prompt, sections, retirés)}).
+    Retourne {"texte", "ttft", "duree", "duree_interpretation", "corrections", "sections"}.
+    """
+    client = get_client()
+    debut = time.perf_counter()
+    resultat = {"duree_interpretation": None, "corrections": None}
+    if mode == "sections":
+        futurs = {client.soumettre(p, forcer, nature=f"section_{cle}", sections=sec): cle
+                  for cle, (p, sec, _) in prompts_sections.items()}
+        textes, premier = {}, None
+        for futur in as_completed(futurs):
+            textes[futurs[futur]] = futur.result()
+            premier = premier or time.perf_counter() - debut
+            if suivi:
+                suivi("\n\n".join(textes[cle] if cle in textes else f"*⏳ {SECTIONS_RAPPORT[cle][0]}...*"
+                                  for cle in prompts_sections))
+        sections = {}
+        for _, sections_une, _ in prompts_sections.values():
+            for k, v in sections_une.items():
+                sections[k] = sections.get(k, 0) + v
+        texte, resultat["corrections"] = relire_coherence(
+            assembler_sections(textes), partial(client.generer, forcer=forcer, nature="coherence"))
+        resultat.update(texte=texte, ttft=premier or 0.0, duree=time.perf_counter() - debut, sections=sections)
+        return resultat
+    nature = "rapport"
+    if mode == "deux_temps":
+        interpretation = lire_interpretation(client.generer(prompt, forcer=forcer, nature="interpretation",
+                                                            sections=sections))
+        resultat["duree_interpretation"] = time.perf_counter() - debut
+        prompt, sections = rediger(interpretation)
+        nature = "redaction"
+    texte, ttft, _ = _diffuser(prompt, suivi, forcer, nature=nature, sections=sections)
+    resultat.update(texte=texte, ttft=ttft, duree=time.perf_counter() - debut, sections=sections)
+    return resultat
+
+
+def tache_resume(prompt, sections=None, suivi=None):
+    texte, ttft, duree = _diffuser(prompt, suivi, nature="resume", sections=sections)
+    return {"texte": texte, "ttft": ttft, "duree": duree}
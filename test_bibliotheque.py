@@ -0,0 +1,112 @@
+import io
+import sys
+import types
+
+import pytest
+from reportlab.pdfgen import canvas
+
+import bibliotheque
+from bibliotheque import Bibliotheque, compacter, extraire_pages
+
+
+def _pdf(pages):
+    tampon = io.BytesIO()
+    c = canvas.Canvas(tampon)
+    for texte in pages:
+        c.drawString(72, 720, texte)
+        c.showPage()
+    c.save()
+    return tampon.getvalue()
+
+
+@pytest.fixture
+def ouvrage(tmp_path):
+    chemin = tmp_path / "manuel.pdf"
+    chemin.write_bytes(_pdf(["Premiere page.", "Deuxieme page.", "Troisieme page."]))
+    return str(chemin)
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """Pages effectivement extraites du PDF (hors cache)."""
+    demandees = []
+
+    def extraire(contenu, numeros):
+        demandees.extend(numeros)
+        return extraire_pages(contenu, numeros)
+    monkeypatch.setattr(bibliotheque, "extraire_pages", extraire)
+    return demandees
+
+
+def test_cache_des_pages(tmp_path, ouvrage, extractions):
+    cache = str(tmp_path / "cache")
+    texte = Bibliotheque(cache).texte(ouvrage)
+    assert "Premiere page." in texte and "Troisieme page." in texte
+    assert extractions == [0, 1, 2]
+    assert Bibliotheque(cache).texte(ouvrage) == texte   # texte compacté relu sur disque
+    assert extractions == [0, 1, 2]
+
+
+def test_changement_de_compactage_sans_relire_le_pdf(tmp_path, ouvrage, extractions, monkeypatch):
+    cache = str(tmp_path / "cache")
+    bibli = Bibliotheque(cache)
+    texte = bibli.texte(ouvrage)
+    monkeypatch.setattr(bibliotheque, "VERSION_COMPACTAGE", 99)
+    assert Bibliotheque(cache).texte(ouvrage) == texte
+    assert extractions == [0, 1, 2]   # pages relues dans le cache, aucune extraite
+    assert (tmp_path / "cache" / "textes" / f"{bibli.empreinte(ouvrage)}.c99.txt").exists()
+
+
+def test_page_manquante_seule_extraite(tmp_path, ouvrage, extractions):
+    bibli = Bibliotheque(str(tmp_path / "cache"))
+    sha = bibli.empreinte(ouvrage)
+    bibli.texte(ouvrage)
+    (tmp_path / "cache" / "textes" / f"{sha}.c{bibliotheque.VERSION_COMPACTAGE}.txt").unlink()
+    (tmp_path / "cache" / "pages" / sha / "00001.txt").unlink()
+    assert "Deuxieme page." in Bibliotheque(str(tmp_path / "cache")).texte(ouvrage)
+    assert extractions == [0, 1, 2, 1]
+
+
+def test_pas_de_pool_sous_streamlit(monkeypatch):
+    script = types.ModuleType("__main__")   # module installé par le ScriptRunner de Streamlit
+    script.__file__ = "streamlit_app.py"
+    monkeypatch.setitem(sys.modules, "__main__", script)
+    monkeypatch.setattr(bibliotheque, "WORKERS_PAGES", 4)
+    monkeypatch.setattr(bibliotheque, "_pool", lambda: pytest.fail("pool démarré sous Streamlit"))
+    contenu = _pdf([f"Page {n}." for n in range(2 * bibliotheque.SEUIL_PARALLELE)])
+    lots = list(extraire_pages(contenu, list(range(2 * bibliotheque.SEUIL_PARALLELE))))
+    assert len(lots) == 1 and lots[0][5].strip() == "Page 5."
+
+
+PHRASES = ["Le profil est homogène,", "La vitesse de traitement chute,", "Les subtests verbaux progressent,",
+           "La mémoire de travail reste fragile,", "Le raisonnement fluide est préservé,"]
+
+
+def _pages_avec_titre(titres):
+    suites = ["d'abord.", "ensuite.", "puis.", "encore.", "enfin."]
+    return "\f".join(f"{titre}\n{phrase}\n{suite}\n{n + 40}"
+                      for n, (titre, phrase, suite) in enumerate(zip(titres, PHRASES, suites)))
+
+
+def test_compacter_titres_courants_variantes_ocr():
+    titres = ["Considérations sur l'interprétation des résultats",
+              "Considérations sur I'interprétation des résultats",
+              "a Considérations sur l’interprétation des résultats",
+              "Considérations sur l‘interprétation des résultats €",
+              "666566565658 Considérations sur 1'interprétation des résultats"]
+    texte = compacter(_pages_avec_titre(titres))
+    assert "Considérations" not in texte and "40" not in texte
+    assert all(phrase in texte for phrase in PHRASES)
+    assert "Le profil est homogène, d'abord." in texte
+
+
+def test_compacter_garde_le_texte_courant():
+    texte = compacter("Exemple\nvoir l'exemple 1).\n\fExemple\nRésul-\ntat obtenu.\n\fExemple\nFin\f"
+                      "Chapitre\nI'enfant lit.")
+    assert "voir l'exemple 1)." in texte   # « 1). » n'est pas un caractère isolé
+    assert "Résultat obtenu." in texte and "I'enfant lit." in texte   # texte lui-même non corrigé
+    assert "Exemple" not in texte and texte.startswith("voir")
+
+
+def test_compacter_titre_trop_rare():
+    assert "Chapitre 2" in compacter("Chapitre 2\nA.\f\fChapitre 2\nB.")   # deux pages seulement
@@ -0,0 +1,57 @@
+from discordances import PAIRES_INDICES, PAIRES_SUBTESTS, TablesEcarts, comparer, formater_comparaisons
+from moteur import Scores
+
+SCORES = Scores(sim=12, voc=8, cub=10, puz=11, icv=95, ivs=120, irf=100, imt=80, ivt=110)
+
+LIGNES = [
+    {"paire": "ICV-IVS", "critique": "11,5", "ecart": "", "taux_base": "", "tranche": "6:0-9:11"},
+    {"paire": "ivs-icv", "critique": "13", "ecart": "", "taux_base": "", "tranche": "10:0-16:11"},
+    {"paire": "ICV-IVS", "critique": "", "ecart": "15", "taux_base": "12,4", "tranche": ""},
+    {"paire": "ICV-IVS", "critique": "", "ecart": "25", "taux_base": "3,1", "tranche": ""},
+    {"paire": "SIM-VOC", "critique": "3", "ecart": "", "taux_base": "", "tranche": ""},
+]
+
+
+def _par_paire(lignes):
+    return {l["paire"]: l for l in lignes}
+
+
+def test_seuils_par_defaut():
+    lignes = _par_paire(comparer(SCORES))
+    assert len(lignes) == len(PAIRES_INDICES) - 1 + 2   # IAG-ICC non renseignés, deux paires de subtests
+    assert lignes["ICV-IVS"]["ecart"] == -25 and lignes["ICV-IVS"]["critique"] == 15
+    assert lignes["ICV-IRF"]["significatif"] is False                      # |-5| < 15
+    assert lignes["IMT-IVT"]["significatif"] is True                       # |-30| >= 15
+    assert lignes["ICV-IMT"]["significatif"] is True                       # écart au seuil exact
+    assert lignes["SIM-VOC"]["critique"] == 4 and lignes["SIM-VOC"]["significatif"] is True
+    assert lignes["CUB-PUZ"]["significatif"] is False
+    assert all(l["taux_base"] is None for l in lignes.values())
+
+
+def test_seuils_et_taux_de_base_par_age():
+    tables = TablesEcarts(LIGNES)
+    icv_ivs = _par_paire(comparer(SCORES, 8 * 12, tables))["ICV-IVS"]
+    assert (icv_ivs["critique"], icv_ivs["taux_base"]) == (11.5, 3.1)
+    assert _par_paire(comparer(SCORES, 12 * 12, tables))["ICV-IVS"]["critique"] == 13   # paire inversée
+    assert _par_paire(comparer(SCORES, None, tables))["ICV-IVS"]["critique"] == 15      # âge inconnu
+    assert _par_paire(comparer(SCORES, 8 * 12, tables))["SIM-VOC"]["critique"] == 3
+
+
+def test_taux_de_base_du_plus_grand_ecart_tabule():
+    tables = TablesEcarts(LIGNES)
+    assert tables.taux_base("ICV", "IVS", -20) == 12.4
+    assert tables.taux_base("IVS", "ICV", 30) == 3.1
+    assert tables.taux_base("ICV", "IVS", 10) is None
+
+
+def test_paires_non_renseignees():
+    assert comparer(Scores()) == []
+    assert formater_comparaisons([]) == ""
+    assert [l["paire"] for l in comparer(Scores(sim=10, voc=10, cub=10))] == ["SIM-VOC"]
+    assert len(PAIRES_SUBTESTS) == 5
+
+
+def test_format_pour_le_prompt():
+    txt = formater_comparaisons(comparer(SCORES, 8 * 12, TablesEcarts(LIGNES)))
+    assert "ICV-IVS -25* (seuil 11,5, taux de base 3,1 %)" in txt
+    assert "\nSubtests : SIM-VOC +4* (seuil 3), CUB-PUZ -1 (seuil 4)." in txt
@@ -0,0 +1,93 @@
+import os
+import stat
+from datetime import date
+
+import pytest
+from cryptography.fernet import Fernet
+
+from dossiers import Dossiers, cle_chiffrement, normaliser_nom
+from moteur import EntreeBilan, Identite, Observations, Scores
+
+
+def _entree(prenom="Éloïse", naissance=date(2014, 4, 3), bilan=date(2023, 6, 12), **scores):
+    return EntreeBilan(Identite(prenom, "Fille", "Gaucher", date_naissance=naissance, date_bilan=bilan),
+                       Observations(["Calme"], "Attentive.", ["Suspicion TDAH"], "Suivi ortho."),
+                       Scores(**(scores or {"sim": 12, "voc": 8, "perc_icv": 37.5, "icv": 95})))
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    monkeypatch.delenv("WISC_CLE_DOSSIERS", raising=False)
+    return Dossiers(str(tmp_path / "dossiers.sqlite"))
+
+
+def test_aller_retour(base):
+    entree = _entree()
+    id_dossier = base.enregistrer(entree, "dr-a", "Analyse.", "Résumé.", {"prenom": "Éloïse"},
+                                  {"pdf": b"%PDF-1.4", "docx": b"PK"})
+    dossier = base.ouvrir(id_dossier)
+    assert dossier["entree"] == entree
+    assert (dossier["analyse"], dossier["resume"], dossier["champs_export"]) == ("Analyse.", "Résumé.",
+                                                                                 {"prenom": "Éloïse"})
+    assert sorted(dossier["formats"]) == ["docx", "pdf"]
+    assert base.export(id_dossier, "pdf") == b"%PDF-1.4"
+    assert base.export(id_dossier, "txt") is None
+    assert base.ouvrir(id_dossier + 1) is None
+
+
+def test_identite_chiffree_sur_disque(base):
+    base.enregistrer(_entree(prenom="Zéphyrin"), "dr-a", "Analyse confidentielle.")
+    brut = b""
+    for suffixe in ("", "-wal"):   # base et journal WAL
+        if os.path.exists(base.chemin + suffixe):
+            with open(base.chemin + suffixe, "rb") as fh:
+                brut += fh.read()
+    assert b"dr-a" in brut   # colonnes de recherche en clair : la lecture porte bien sur les données
+    for clair in ("Zéphyrin".encode("utf-8"), b"zephyrin", "Analyse confidentielle.".encode("utf-8")):
+        assert clair not in brut
+
+
+def test_mauvaise_cle(base):
+    id_dossier = base.enregistrer(_entree(), "dr-a", exports={"pdf": b"%PDF"})
+    autre = Dossiers(base.chemin, cle=Fernet.generate_key())
+    with pytest.raises(ValueError, match="clé de chiffrement incorrecte"):
+        autre.ouvrir(id_dossier)
+    with pytest.raises(ValueError, match="clé de chiffrement incorrecte"):
+        autre.export(id_dossier, "pdf")
+    assert autre.lister(nom="Éloïse") == []   # l'empreinte du prénom dépend aussi de la clé
+
+
+def test_cle_generee_une_fois(tmp_path, monkeypatch):
+    monkeypatch.delenv("WISC_CLE_DOSSIERS", raising=False)
+    cle = cle_chiffrement(str(tmp_path))
+    assert cle_chiffrement(str(tmp_path)) == cle
+    assert stat.S_IMODE(os.stat(tmp_path / "cle_dossiers.key").st_mode) == 0o600
+    monkeypatch.setenv("WISC_CLE_DOSSIERS", Fernet.generate_key().decode("ascii"))
+    assert cle_chiffrement(str(tmp_path)) != cle
+
+
+def test_recherche_et_historique(base):
+    ancien = base.enregistrer(_entree(bilan=date(2020, 5, 1), sim=9), "dr-a")
+    recent = base.enregistrer(_entree(sim=12), "dr-b")
+    base.enregistrer(_entree(naissance=date(2015, 1, 1)), "dr-a")   # homonyme
+    base.enregistrer(_entree(prenom="Tom"), "dr-a")
+    assert normaliser_nom("  ÉLOÏSE ") == "eloise"
+    assert len(base.lister(nom="eloise")) == 3
+    assert [d["clinicien"] for d in base.lister(nom="ELOÏSE", clinicien="dr-b")] == ["dr-b"]
+    assert [d["id"] for d in base.lister(du=date(2021, 1, 1), au=date(2021, 12, 31))] == []
+    ligne = base.lister(nom="Tom")[0]
+    assert (ligne["prenom"], ligne["age"], ligne["date_bilan"]) == ("Tom", "9 ans 2 mois", "2023-06-12")
+    historique = base.historique("Eloise", date(2014, 4, 3))
+    assert [d["id"] for d in historique] == [ancien, recent]
+    assert [d["entree"].scores.sim for d in historique] == [9, 12]
+
+
+def test_mise_a_jour_et_suppression(base):
+    id_dossier = base.enregistrer(_entree(), "dr-a", exports={"pdf": b"v1"})
+    assert base.enregistrer(_entree(sim=15), "dr-a", "Nouvelle analyse.", id_dossier=id_dossier) == id_dossier
+    dossier = base.ouvrir(id_dossier)
+    assert dossier["entree"].scores.sim == 15 and dossier["analyse"] == "Nouvelle analyse."
+    assert base.export(id_dossier, "pdf") == b"v1"   # exports gardés si non fournis
+    base.supprimer(id_dossier)
+    assert base.ouvrir(id_dossier) is None and base.export(id_dossier, "pdf") is None
+    assert base.stats()["dossiers"] == 0
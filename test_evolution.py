@@ -0,0 +1,61 @@
+import numpy as np
+
+from evolution import comparer_bilans, evolution_lot, formater_evolution, matrice_ic
+from moteur import Scores
+from psychometrie import COLONNES, matrice
+
+AVANT = Scores(sim=8, voc=10, cub=9, icv=90, icv_bas=84, icv_haut=98, ivs=100, ivs_bas=92, ivs_haut=108,
+               irf=95, irf_bas=88, irf_haut=103, imt=85)
+APRES = Scores(sim=11, voc=12, cub=9, icv=112, icv_bas=104, icv_haut=119, ivs=107, ivs_bas=99, ivs_haut=114,
+               irf=104, irf_bas=96, irf_haut=111, imt=95)
+
+
+def _par_note(lignes):
+    return {l["note"]: l for l in lignes}
+
+
+def test_recouvrement_des_ic():
+    lignes = _par_note(comparer_bilans([AVANT, APRES]))
+    assert (lignes["ICV"]["delta"], lignes["ICV"]["hors_erreur"]) == (22, True)    # 84-98 puis 104-119
+    assert (lignes["IVS"]["delta"], lignes["IVS"]["hors_erreur"]) == (7, False)    # IC qui se recouvrent
+    assert not lignes["IRF"]["hors_erreur"]                                        # 88-103 / 96-111
+    assert (lignes["IMT"]["delta"], lignes["IMT"]["hors_erreur"]) == (10, False)   # IC non saisis
+
+
+def test_ic_contigus_ou_disjoints_par_le_bas():
+    baisse = Scores(icv=80, icv_bas=74, icv_haut=83)
+    assert _par_note(comparer_bilans([AVANT, baisse]))["ICV"]["hors_erreur"]   # 74-83 sous 84-98
+    contigu = Scores(icv=78, icv_bas=70, icv_haut=84)
+    assert not _par_note(comparer_bilans([AVANT, contigu]))["ICV"]["hors_erreur"]  # borne commune
+
+
+def test_subtests_un_ecart_type():
+    lignes = _par_note(comparer_bilans([AVANT, APRES]))
+    assert (lignes["SIM"]["delta"], lignes["SIM"]["hors_erreur"]) == (3, True)
+    assert (lignes["VOC"]["delta"], lignes["VOC"]["hors_erreur"]) == (2, False)
+    assert (lignes["CUB"]["delta"], lignes["CUB"]["hors_erreur"]) == (0, False)
+    assert "PUZ" not in lignes and "QIT" not in lignes   # non renseignés
+
+
+def test_trois_bilans_note_manquante_au_milieu():
+    milieu = Scores(sim=9, icv=100, icv_bas=93, icv_haut=107)
+    lignes = _par_note(comparer_bilans([AVANT, milieu, APRES]))
+    assert lignes["VOC"]["valeurs"] == [10, 0, 12]
+    assert lignes["ICV"]["valeurs"] == [90, 100, 112] and lignes["ICV"]["hors_erreur"]
+    protocoles = [AVANT, milieu, APRES]
+    r = evolution_lot(matrice(protocoles), matrice_ic(protocoles))
+    icv = COLONNES.index("icv")
+    assert r["delta"][:, icv].tolist() == [10, 12]
+    assert r["change"][:, icv].tolist() == [0, 0]                  # pas à pas, les IC se recouvrent
+    assert np.isnan(r["delta"][:, COLONNES.index("voc")]).all()
+    assert r["change"][:, COLONNES.index("voc")].tolist() == [-1, -1]
+
+
+def test_format_pour_le_prompt():
+    txt = formater_evolution(["12/06/2020", "12/06/2023"], comparer_bilans([AVANT, Scores(sim=11, voc=0, icv=112,
+                                                                                          icv_bas=104,
+                                                                                          icv_haut=119)]))
+    assert "(12/06/2020 -> 12/06/2023 ;" in txt
+    assert "\nIndices : ICV 90->112 (+22*)." in txt
+    assert "\nSubtests : SIM 8->11 (+3*)." in txt
+    assert formater_evolution([], []) == ""
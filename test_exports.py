@@ -0,0 +1,29 @@
+import os
+
+import exports
+from exports import CacheExports
+
+CHAMPS = {"prenom": "Lucas", "sexe": "Garçon", "age_court": "9 ans", "age_long": "9 ans 2 mois",
+          "date_bilan": "12/06/2023"}
+
+
+def test_rendus_en_memoire_seulement(tmp_path, monkeypatch):
+    ancien = tmp_path / "exports"
+    ancien.mkdir()
+    (ancien / "vieux.pdf").write_bytes(b"%PDF en clair")
+    monkeypatch.setattr(exports, "DOSSIER_CACHE", str(tmp_path))
+    rendus = []
+    monkeypatch.setattr(exports, "rendre", lambda fmt, texte, champs: rendus.append(texte) or texte.encode())
+    cache = CacheExports(lru_max=2)
+    assert not ancien.exists()
+    assert cache.obtenir("pdf", "a", CHAMPS) == b"a"
+    assert cache.obtenir("pdf", "a", CHAMPS) == b"a"
+    cache.obtenir("pdf", "b", CHAMPS)
+    cache.obtenir("docx", "a", CHAMPS)   # format différent : autre entrée ; « a » en pdf sort du LRU
+    cache.obtenir("pdf", "a", CHAMPS)
+    assert rendus == ["a", "b", "a", "a"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_rendu_pdf():
+    assert CacheExports().obtenir("pdf", "## 1. SYNTHÈSE\nTexte.", CHAMPS).startswith(b"%PDF")
@@ -0,0 +1,72 @@
+import ia
+from ia import CacheReponses, cle_prompt
+
+
+class Horloge:
+    def __init__(self, t=1_000_000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def _cache(tmp_path, monkeypatch, **kwargs):
+    horloge = Horloge()
+    monkeypatch.setattr(ia.time, "time", horloge)
+    return CacheReponses(str(tmp_path / "reponses.sqlite"), **kwargs), horloge
+
+
+def test_cle_prompt():
+    assert cle_prompt("m", "p", {"a": 1, "b": 2}) == cle_prompt("m", "p", {"b": 2, "a": 1})
+    assert cle_prompt("m", "p") != cle_prompt("autre", "p")
+    assert cle_prompt("m", "p") != cle_prompt("m", "p", {"temperature": 0.2})
+
+
+def test_lecture_et_compteurs(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    assert cache.lire("k") is None
+    cache.ecrire("k", "modele", "réponse")
+    assert cache.lire("k") == "réponse"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entrees": 1, "taille": len("réponse".encode("utf-8"))}
+
+
+def test_expiration_ttl(tmp_path, monkeypatch):
+    cache, horloge = _cache(tmp_path, monkeypatch, ttl=60)
+    cache.ecrire("k", "modele", "vieille")
+    horloge.t += 60
+    assert cache.lire("k") == "vieille"
+    horloge.t += 1
+    assert cache.lire("k") is None
+    cache.ecrire("autre", "modele", "neuve")   # purge des entrées expirées
+    assert cache.stats()["entrees"] == 1
+
+
+def test_eviction_des_moins_recemment_lues(tmp_path, monkeypatch):
+    cache, horloge = _cache(tmp_path, monkeypatch, taille_max=25)
+    for i, cle in enumerate("abc"):
+        horloge.t += 1
+        cache.ecrire(cle, "modele", cle * 10)
+        if i == 1:
+            horloge.t += 1
+            cache.lire("a")   # « a » relue : c'est « b » la moins récente
+    assert cache.lire("b") is None
+    assert cache.lire("a") == "a" * 10
+    assert cache.lire("c") == "c" * 10
+    assert cache.stats()["taille"] <= 25
+
+
+def test_vider(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    cache.ecrire("k", "modele", "x")
+    cache.vider()
+    assert cache.lire("k") is None
+    assert cache.stats()["entrees"] == 0
+
+
+def test_reponses_simulees_hors_des_cles_gemini(tmp_path, monkeypatch):
+    cache, _ = _cache(tmp_path, monkeypatch)
+    client = ia.ClientIA(ia.BackendStub(), cache=cache, journal=ia.JournalAppels(str(tmp_path / "journal.sqlite")))
+    prompt = "Scores ? Renvoie UNIQUEMENT un JSON valide."
+    assert client.generer(prompt) == "{}"
+    assert cache.lire(cle_prompt(ia.MODELE_DEFAUT, prompt)) is None
+    assert cache.lire(cle_prompt(f"stub:{ia.MODELE_DEFAUT}", prompt)) == "{}"
@@ -0,0 +1,93 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from normes import SOMME_MAX, TablesNormes, age_en_mois, nombre, tranche
+from psychometrie import matrice
+
+LIGNES = [
+    {"indice": "ICV", "somme": "20", "note": "100", "percentile": "50", "ic_bas": "92", "ic_haut": "108",
+     "tranche": "6:0-9:11"},
+    {"indice": "ICV", "somme": "20", "note": "97", "percentile": "42", "ic_bas": "89", "ic_haut": "105",
+     "tranche": "10:0-16:11"},
+    {"indice": "ICV", "somme": "2", "note": "45", "percentile": "<0,1", "ic_bas": "42", "ic_haut": "56",
+     "tranche": "6:0-9:11"},
+    {"indice": "IAG", "somme": "50", "note": "100", "percentile": "", "ic_bas": "", "ic_haut": "", "tranche": ""},
+]
+
+
+def test_lectures_elementaires():
+    assert tranche("6:0-9:11") == (72, 119)
+    assert tranche("") == (0, 12 * 99)
+    assert nombre("<0,1") == 0.1 and nombre(">99,9") == 99.9 and np.isnan(nombre(""))
+    assert age_en_mois(date(2014, 4, 3), date(2023, 6, 12)) == 110
+    assert age_en_mois(date(2014, 4, 13), date(2023, 6, 12)) == 109
+
+
+def test_conversion_selon_la_tranche_d_age():
+    tables = TablesNormes(LIGNES)
+    scores = {"sim": 10, "voc": 10}
+    assert tables.convertir(scores, 8 * 12) == {"icv": 100, "perc_icv": 50.0, "icv_bas": 92, "icv_haut": 108}
+    assert tables.convertir(scores, 12 * 12)["icv"] == 97
+    assert tables.convertir({"sim": 1, "voc": 1}, 8 * 12)["perc_icv"] == 0.1
+
+
+def test_hors_table():
+    tables = TablesNormes(LIGNES)
+    assert tables.convertir({"sim": 10, "voc": 10}, 5 * 12) == {}          # âge avant la première tranche
+    assert tables.convertir({"sim": 10, "voc": 10}, 17 * 12) == {}         # après la dernière
+    assert tables.convertir({"sim": 10, "voc": 10}) == {}                  # âge inconnu
+    assert tables.convertir({"sim": 10, "voc": 11}, 8 * 12) == {}          # somme absente de la table
+    assert tables.convertir({"sim": 10, "voc": 0}, 8 * 12) == {}           # subtest manquant
+    X = matrice([{"sim": SOMME_MAX, "voc": SOMME_MAX}])                      # somme au-delà du tableau
+    assert np.isnan(tables.convertir_lot(X, [8 * 12])["icv"][0])
+
+
+def test_table_tous_ages_sans_percentile():
+    tables = TablesNormes(LIGNES)
+    scores = {"sim": 10, "voc": 10, "cub": 10, "mat": 10, "bal": 10}
+    assert tables.convertir(scores) == {"iag": 100}
+    assert tables.convertir(scores, 8 * 12)["iag"] == 100
+
+
+def test_conversion_par_lot():
+    tables = TablesNormes(LIGNES)
+    X = matrice([{"sim": 10, "voc": 10}, {"sim": 10, "voc": 10}, {"sim": 1, "voc": 1}])
+    icv = tables.convertir_lot(X, [8 * 12, 12 * 12, None])["icv"]
+    assert icv[:2].tolist() == [100, 97] and np.isnan(icv[2])
+
+
+def test_depuis_dossier(tmp_path):
+    (tmp_path / "icv.csv").write_text(
+        "Indice;Somme;Note;Percentile;IC_bas;IC_haut;Tranche\nICV;20;100;50;92;108;\n", encoding="utf-8")
+    tables = TablesNormes.depuis_dossier(str(tmp_path))
+    assert tables.indices == ["icv"]
+    assert tables.convertir({"sim": 10, "voc": 10})["icv"] == 100
+    assert not TablesNormes.depuis_dossier(str(tmp_path / "absent"))
+
+
+def test_indice_inconnu():
+    with pytest.raises(ValueError):
+        TablesNormes([{"indice": "XYZ", "somme": "10", "note": "100"}])
+
+
+def test_ligne_hors_bornes(tmp_path):
+    (tmp_path / "icv.csv").write_text(
+        "Indice;Somme;Note;Percentile;IC_bas;IC_haut;Tranche\nICV;20;100;50;92;108;\n"
+        f"ICV;{SOMME_MAX + 1};160;99,9;150;165;\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=rf"icv\.csv, ligne 3 : somme {SOMME_MAX + 1} hors de 0-{SOMME_MAX}"):
+        TablesNormes.depuis_dossier(str(tmp_path))
+    with pytest.raises(ValueError, match="ligne 2 : somme -1 hors"):   # sans repli sur la dernière case
+        TablesNormes([LIGNES[0], {**LIGNES[0], "somme": "-1"}])
+    with pytest.raises(ValueError, match="ligne 1 : somme illisible"):
+        TablesNormes([{**LIGNES[0], "somme": "vingt"}])
+
+
+def test_tranche_invalide():
+    with pytest.raises(ValueError, match="ligne 1 : tranche d'âge illisible « 6:0 »"):
+        TablesNormes([{**LIGNES[0], "tranche": "6:0"}])
+    with pytest.raises(ValueError, match="tranche d'âge invalide « 9:11-6:0 »"):
+        TablesNormes([{**LIGNES[0], "tranche": "9:11-6:0"}])
+    with pytest.raises(ValueError, match="invalide « 6:12-7:0 »"):
+        tranche("6:12-7:0")
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+from bilan_reference import SCORES_BILAN
+from moteur import Scores, analyser
+from psychometrie import (COLONNES, COLONNES_INDICES, COLONNES_SUBTESTS, FRAGILE, INCOMPLET, INDICES_PRINCIPAUX,
+                          NON_INTERPRETABLE, SOMMES, VALIDE, analyser_lot, matrice)
+
+
+def _protocoles(n, graine=7):
+    """Protocoles aléatoires autour d'un niveau par enfant, avec des notes manquantes (0)."""
+    alea = random.Random(graine)
+    lignes = []
+    for _ in range(n):
+        niveau = alea.randint(4, 16)
+        ligne = {k: min(19, max(1, niveau + alea.randint(-4, 4))) for k in COLONNES_SUBTESTS}
+        ligne.update({k: 5 * niveau + 50 + alea.randint(-15, 15) for k in COLONNES_INDICES})
+        for k in alea.sample(COLONNES, alea.choice([0, 0, 1, 3])):
+            ligne[k] = 0
+        lignes.append(ligne)
+    return lignes
+
+
+def test_profil_de_reference():
+    a = analyser(Scores(**SCORES_BILAN))
+    assert a.statut_validite == NON_INTERPRETABLE and a.dispersion == 38
+    assert a.nb_inv == 0 and all(h for h, _ in a.homogeneite.values())
+    assert a.moy == 97.8
+    assert a.forces == ["ICV"] and a.faiblesses == ["IVT"]
+    assert a.sommes == {"IAG": 57, "ICC": 30, "INV": 55}
+
+
+def test_lot_identique_au_bilan_individuel():
+    lignes = _protocoles(300)
+    r = analyser_lot(matrice(lignes))
+    for i, ligne in enumerate(lignes):
+        a = analyser(Scores(**ligne))
+        assert r["statut"][i] == a.statut_validite
+        assert r["nb_inv"][i] == a.nb_inv
+        assert (None if r["dispersion"][i] < 0 else r["dispersion"][i]) == a.dispersion
+        assert np.isclose(r["moy"][i], a.moy) and np.isclose(r["et"][i], a.et)
+        assert [k for j, k in enumerate(INDICES_PRINCIPAUX) if r["forces"][i][j]] == a.forces
+        assert [k for j, k in enumerate(INDICES_PRINCIPAUX) if r["faiblesses"][i][j]] == a.faiblesses
+        assert [{1: True, 0: False, -1: None}[h] for h in r["homogene"][i]] == \
+            [a.homogeneite[k][0] for k in INDICES_PRINCIPAUX]
+        assert {k: (int(v) if v >= 0 else "Incomplet") for k, v in zip(SOMMES, r["sommes"][i])} == a.sommes
+    assert {INCOMPLET, VALIDE, FRAGILE, NON_INTERPRETABLE} <= set(r["statut"])
+
+
+def test_ligne_vide():
+    r = analyser_lot(np.zeros(len(COLONNES)))
+    assert r["statut"][0] == INCOMPLET and r["dispersion"][0] == -1
+    assert r["moy"][0] == 0 and r["et"][0] == 0
+    assert (r["homogene"][0] == -1).all() and (r["sommes"][0] == -1).all()
+
+
+def test_matrice_valeurs_absentes():
+    X = matrice([{"sim": 12, "voc": None, "cub": ""}, Scores(sim=3)])
+    assert X.shape == (2, len(COLONNES))
+    assert X[0, COLONNES.index("sim")] == 12 and X[0].sum() == 12
+    assert X[1, COLONNES.index("sim")] == 3
@@ -0,0 +1,50 @@
+import json
+
+from bilan_reference import SCORES_BILAN, rapport_qglobal
+from qglobal import CHAMPS_QGLOBAL, analyser_rapport, extraire
+
+
+def test_rapport_de_reference():
+    donnees = analyser_rapport(rapport_qglobal())
+    attendu = {**SCORES_BILAN, 'date_naissance': "03/04/2014", 'date_passation': "12/06/2023"}
+    assert donnees == attendu
+
+
+def test_libelles_ambigus_et_valeurs_hors_bornes():
+    texte = ("Mémoire des chiffres MCH 20 9 50\n"
+             "Mémoire des images MIM 18 25 50\n"     # note standard impossible : ignorée
+             "Compréhension verbale ICV 20 112 79 104-119\n"
+             "Compréhension COM 19 11 63\n")
+    donnees = analyser_rapport(texte)
+    assert donnees['memc'] == 9 and 'memi' not in donnees
+    assert donnees['comp'] == 11
+    assert (donnees['icv'], donnees['perc_icv'], donnees['icv_bas'], donnees['icv_haut']) == (112, 79.0, 104, 119)
+
+
+def test_percentile_inferieur_et_virgule():
+    donnees = analyser_rapport("Vitesse de traitement IVT 6 55 < 0,1 51-65\n")
+    assert (donnees['ivt'], donnees['perc_ivt']) == (55, 0.1)
+
+
+def test_modele_seulement_pour_les_champs_manquants():
+    demandes = []
+
+    def appel_llm(prompt):
+        demandes.append(prompt)
+        return "```json\n" + json.dumps({'iag': 101, 'icc': 88, 'inv': 95, 'sim': 1}) + "\n```"
+
+    donnees, sources = extraire(rapport_qglobal(), appel_llm)
+    assert len(demandes) == 1
+    assert "Champs demandés UNIQUEMENT : iag, iag_bas, iag_haut, icc, icc_bas, icc_haut, inv, inv_bas, inv_haut\n" \
+        in demandes[0]
+    assert (donnees['iag'], donnees['icc'], donnees['inv']) == (101, 88, 95)
+    assert donnees['sim'] == SCORES_BILAN['sim']   # réponse du modèle ignorée hors champs manquants
+    assert {sources[k] for k in ('iag', 'icc', 'inv')} == {"IA"}
+    assert sources['sim'] == "parser"
+    assert set(CHAMPS_QGLOBAL) - set(donnees) == {'iag_bas', 'iag_haut', 'icc_bas', 'icc_haut', 'inv_bas', 'inv_haut'}
+
+
+def test_sans_modele():
+    donnees, sources = extraire(rapport_qglobal())
+    assert 'iag' not in donnees
+    assert set(sources.values()) == {"parser"}
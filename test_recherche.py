@@ -0,0 +1,59 @@
+from recherche import IndexBM25, decouper, normaliser_tokens, selectionner_passages, estimer_tokens
+
+
+def _passage(source, numero, texte):
+    return {"source": source, "numero": numero, "texte": texte}
+
+
+PASSAGES = [
+    _passage("a.txt", 1, "La mémoire de travail retient les chiffres et les images."),
+    _passage("a.txt", 2, "Le raisonnement fluide repose sur les matrices et les balances."),
+    _passage("b.txt", 1, "La vitesse de traitement se mesure avec le code et les symboles."),
+    _passage("b.txt", 2, "Mémoire, mémoire, mémoire : la mémoire de travail avant tout."),
+]
+
+
+def test_normaliser_tokens():
+    assert normaliser_tokens("Les Évaluations de la MÉMOIRE") == ["evalu", "memoir"]
+
+
+def test_classement_par_pertinence():
+    index = IndexBM25(PASSAGES)
+    resultats = index.rechercher("mémoire de travail")
+    assert [p["numero"] for p, _ in resultats[:2]] == [2, 1]
+    assert [p["source"] for p, _ in resultats[:2]] == ["b.txt", "a.txt"]
+    scores = [s for _, s in resultats]
+    assert scores == sorted(scores, reverse=True)
+    assert len(resultats) == 2   # seuls les passages qui contiennent un terme
+
+
+def test_terme_inconnu_et_top_k():
+    index = IndexBM25(PASSAGES)
+    assert index.rechercher("dyspraxie") == []
+    assert len(index.rechercher("mémoire matrices code", top_k=2)) == 2
+
+
+def test_terme_rare_plus_discriminant():
+    index = IndexBM25(PASSAGES)
+    (meilleur, _), = index.rechercher("balances", top_k=1)
+    assert meilleur["numero"] == 2 and meilleur["source"] == "a.txt"
+
+
+def test_index_vide():
+    assert IndexBM25([]).rechercher("mémoire") == []
+
+
+def test_decouper_chevauchement():
+    texte = " ".join(f"mot{i}" for i in range(400))
+    passages = decouper("x.txt", texte, mots_par_passage=180, chevauchement=30)
+    assert [p["numero"] for p in passages] == [1, 2, 3]
+    assert passages[1]["texte"].split()[0] == "mot150"
+    assert passages[-1]["texte"].split()[-1] == "mot399"
+
+
+def test_selection_dans_le_budget_et_ordre_de_lecture():
+    index = IndexBM25(PASSAGES)
+    budget = estimer_tokens(PASSAGES[3]["texte"]) + estimer_tokens(PASSAGES[0]["texte"])
+    retenus = selectionner_passages(index, "mémoire de travail", budget_tokens=budget)
+    assert [(p["source"], p["numero"]) for p, _ in retenus] == [("a.txt", 1), ("b.txt", 2)]
+    assert selectionner_passages(index, "mémoire de travail", budget_tokens=1) == []
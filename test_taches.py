@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+from cryptography.fernet import Fernet
+
+from taches import FileTaches
+
+CLE = Fernet.generate_key()
+
+
+def _attendre(file_taches, id_tache, limite=5):
+    fin = time.time() + limite
+    while file_taches.etat(id_tache)["statut"] in ("attente", "en_cours") and time.time() < fin:
+        time.sleep(0.01)
+    return file_taches.etat(id_tache)
+
+
+def _rapport(prenom, suivi=None):
+    suivi("Compte rendu de")
+    return {"texte": f"Compte rendu de {prenom}."}
+
+
+def test_resultat_et_contexte_chiffres(tmp_path):
+    chemin = str(tmp_path / "taches.sqlite")
+    file_taches = FileTaches(chemin, cle=CLE)
+    id_tache = file_taches.soumettre("rapport", _rapport, "Zéphyrine", proprietaire="dr-a",
+                                     contexte={"saisie": {"prenom": "Zéphyrine"}})
+    tache = _attendre(file_taches, id_tache)
+    assert tache["statut"] == "termine" and tache["resultat"] == {"texte": "Compte rendu de Zéphyrine."}
+    assert tache["contexte"] == {"saisie": {"prenom": "Zéphyrine"}}
+    assert [t["id"] for t in file_taches.a_recuperer("dr-a")] == [id_tache]
+    brut = b""
+    for suffixe in ("", "-wal"):
+        if (tmp_path / f"taches.sqlite{suffixe}").exists():
+            brut += (tmp_path / f"taches.sqlite{suffixe}").read_bytes()
+    assert b"dr-a" in brut and "Zéphyrine".encode("utf-8") not in brut
+
+
+def test_autre_cle(tmp_path):
+    chemin = str(tmp_path / "taches.sqlite")
+    file_taches = FileTaches(chemin, cle=CLE)
+    id_tache = file_taches.soumettre("rapport", _rapport, "Tom", proprietaire="dr-a")
+    _attendre(file_taches, id_tache)
+    tache = FileTaches(chemin, cle=Fernet.generate_key()).etat(id_tache)
+    assert (tache["statut"], tache["resultat"], tache["contexte"]) == ("echec", None, {})
+    assert "clé de chiffrement" in tache["erreur"]
+
+
+def test_lignes_en_clair_purgees(tmp_path):
+    chemin = str(tmp_path / "taches.sqlite")
+    FileTaches(chemin, cle=CLE)
+    with sqlite3.connect(chemin) as cx:
+        cx.execute("INSERT INTO taches (nature, proprietaire, statut, cree, contexte, resultat) "
+                   "VALUES ('rapport', 'dr-a', 'termine', ?, '{}', '{\"texte\": \"en clair\"}')", (time.time(),))
+    assert FileTaches(chemin, cle=CLE).a_recuperer("dr-a") == []